@@ -13,6 +13,8 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 import numpy as np
 import datetime as dt
+import sys
+sys.path.append('C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/scripts')
 
 from copy import deepcopy
 import colorsys
@@ -21,6 +23,7 @@ import ellUtils as eu
 import ceilUtils as ceil
 from forward_operator import FOUtils as FO
 from forward_operator import FOconstants as FOcon
+from sensitivity_FO import aer_ext_scat_versions
 
 def dateList_to_datetime(dayList):
 
@@ -34,59 +37,6 @@ def dateList_to_datetime(dayList):
 
     return datetimeDays
 
-def nearest_heights(mod_height, obs_height, corr_max_height):
-
-    """
-    Get the nearest ceilometer height gate to each model level
-
-    :param mod_height:
-    :param obs_height:
-    :param corr_max_height:
-    :return:
-
-    obs_idx = ALL nearest gate idx
-    mod_idx = idx of the model height that each obs_idx are paired to
-    """
-
-    from mod_obs_stats_plot import unique_pairs
-
-    a = np.array([eu.nearest(obs_height, i) for i in mod_height])
-    values = a[:, 0]
-    obs_idx = np.array(a[:, 1], dtype=int)
-    diff = a[:, 2]
-    mod_idx = np.arange(len(mod_height))  # mod_idx should be paired with obs_idx spots.
-
-    # Trim off the ends of obs_idx, as UKV and obs z0 and zmax are different, leading to the same gate matching multiple ukvs
-    # assumes no duplicates in the middle of the arrays, just at the end
-
-    # At this point, variables are like:
-    # obs_idx = [0, 0, 0, 1, 3, 5, .... 769, 769, 769]
-    # mod_idx = [0, 1, 2, 3, 4, 4, .... 67,  68,  69 ]
-    unique_pairs_range = unique_pairs(obs_idx, diff)
-
-    # ALL unique pairs
-    # Use these to plot correlations for all possible pairs, regardless of height
-    obs_unique_pairs = obs_idx[unique_pairs_range]
-    mod_unique_pairs = mod_idx[unique_pairs_range]
-    values_unique_pairs = values[unique_pairs_range]
-    diff_unique_pairs = diff[unique_pairs_range]
-
-    # ~~~~~~~~~~~~~~~~~~~~ #
-
-    # Remove pairs where obs is above the max allowed height.
-    # hc = height cut
-    hc_unique_pairs_range = np.where(values_unique_pairs <= corr_max_height)[0]
-
-    # trim off unique pairs that are above the maximum height
-    obs_hc_unique_pairs = obs_unique_pairs[hc_unique_pairs_range]
-    mod_hc_unique_pairs = mod_unique_pairs[hc_unique_pairs_range]
-    pairs_hc_unique_values = values_unique_pairs[hc_unique_pairs_range]
-    pairs_hc_unique_diff = diff_unique_pairs[hc_unique_pairs_range]
-
-
-    return obs_hc_unique_pairs, mod_hc_unique_pairs, \
-           pairs_hc_unique_values, pairs_hc_unique_diff
-
 def main():
 
     # ==============================================================================
@@ -124,6 +74,16 @@ def main():
 
     days_iterate = [dt.datetime(2016,01,19)]# new PM10 case study day
 
+    # forward operator versions to compare, and the aer_ext_scat_versions parameters that give each one
+    #   NOTE: these are recalculated with the aerosol operator in scripts/sensitivity_FO.py (its 910 nm Mie tables and
+    #   default parameters) on the extracted fields, NOT by FOUtils. The FOUtils alpha_a of the extracted version
+    #   is plotted alongside them for reference.
+    #   0.1 = Q_ext from the swollen radius, 0.2 = Q_ext from the dry radius
+    versions = [0.1, 0.2]
+    version_params = [{'Q_radius': 'r_m'}, {'Q_radius': 'r_md'}]
+    version_labels = ['sensitivity_FO: r_m (swollen)', 'sensitivity_FO: r_md (dry)']
+    FO_label = 'FOUtils v' + str(versions[-1])
+
     # ==============================================================================
     # Read data
     # ==============================================================================
@@ -143,34 +103,34 @@ def main():
 
         # extract MURK aerosol and calculate RH for each of the sites in the ceil metadata
         # reads all london model data, extracts site data, stores in single dictionary
-        mod_data_old = FO.mod_site_extract_calc(day, ceil_data_i, modDatadir, model_type, res, 910,
-                                            Z=Z, allvars=True, version=0.1)
-
-        mod_data_new = FO.mod_site_extract_calc(day, ceil_data_i, modDatadir, model_type, res, 910,
-                                            Z=Z, allvars=True, version=0.2)
+        #   the model fields are only extracted once. The forward operator versions are then all run on them.
+        mod_data = FO.mod_site_extract_calc(day, ceil_data_i, modDatadir, model_type, res, 910,
+                                            Z=Z, allvars=True, version=versions[-1])
 
+        # alpha_a for each version [version, time, height]
+        ext_versions = aer_ext_scat_versions(mod_data[site]['aerosol_for_visibility'], mod_data[site]['RH'] * 100.0,
+                                             version_params, ceil_lam=910, out_vars=['alpha'])['alpha']
 
         # store ext_coeff and RH for lowest ~2000 m
         if day == days_iterate[0]:
 
-            RH_all_old = mod_data_old['MR']['RH'][:, 0:24]
-            RH_all_new = mod_data_new['MR']['RH'][:, 0:24]
-            ext_old = mod_data_old['MR']['alpha_a'][:, 0:24]
-            ext_new = mod_data_new['MR']['alpha_a'][:, 0:24]
+            RH_all = mod_data[site]['RH'][:, 0:24].flatten()
+            ext_all = ext_versions[:, :, 0:24].reshape(len(versions), -1)
+            ext_FO_all = mod_data[site]['alpha_a'][:, 0:24].flatten()
 
         else:
 
-            RH_all_old = np.append(RH_all_old, mod_data_old['MR']['RH'][:, 0:24])
-            RH_all_new = np.append(RH_all_new, mod_data_new['MR']['RH'][:, 0:24])
-            ext_old = np.append(ext_old, mod_data_old['MR']['alpha_a'][:, 0:24])
-            ext_new = np.append(ext_new, mod_data_new['MR']['alpha_a'][:, 0:24])
+            RH_all = np.append(RH_all, mod_data[site]['RH'][:, 0:24])
+            ext_all = np.append(ext_all, ext_versions[:, :, 0:24].reshape(len(versions), -1), axis=1)
+            ext_FO_all = np.append(ext_FO_all, mod_data[site]['alpha_a'][:, 0:24])
 
         # plot alpha_a vs RH (day)
         fig, ax = plt.subplots(1, 1, figsize=(6, 6))
         s=3
 
-        plt.scatter(mod_data_old[site]['RH']*100.0, mod_data_old[site]['alpha_a']*1000.0, label='r_m (swollen)', s=s)
-        plt.scatter(mod_data_new[site]['RH']*100.0, mod_data_new[site]['alpha_a']*1000.0, label='r_md (dry)', s=s)
+        for v, label in enumerate(version_labels):
+            plt.scatter(mod_data[site]['RH']*100.0, ext_versions[v]*1000.0, label=label, s=s)
+        plt.scatter(mod_data[site]['RH']*100.0, mod_data[site]['alpha_a']*1000.0, label=FO_label, s=s, c='k')
 
         ax.set_xlabel('RH [%]', fontsize=10, labelpad=10)
         ax.set_ylabel('extinction coefficient [km-1]', fontsize=10, labelpad=2)
@@ -185,8 +145,9 @@ def main():
     fig, ax = plt.subplots(1, 1, figsize=(6, 6))
     s = 5
 
-    plt.scatter(RH_all_old * 100.0, ext_old * 1000.0, label='r_m (swollen)', s=s)
-    plt.scatter(RH_all_new * 100.0, ext_new * 1000.0, label='r_md (dry)', s=s)
+    for v, label in enumerate(version_labels):
+        plt.scatter(RH_all * 100.0, ext_all[v] * 1000.0, label=label, s=s)
+    plt.scatter(RH_all * 100.0, ext_FO_all * 1000.0, label=FO_label, s=s, c='k')
 
     ax.set_xlabel('RH [%]', fontsize=10, labelpad=10)
     ax.set_ylabel('extinction coefficient [km-1]', fontsize=10, labelpad=2)
@@ -0,0 +1,337 @@
+"""
+Look up Q_ext_dry, f(RH) and Q_ext_wet from the Mie tables, for whole arrays of (time, r_md, RH) in one go.
+
+The tables are either the csv files used by calc_Q_ext_wet() (a single f(RH) curve and Q_ext_dry(radius)), or the
+monthly/daily f(RH) netCDF files [time, radius, RH]. Values are linearly interpolated along each axis (bi- or
+trilinear overall) using index maths on the sorted axes, rather than a nearest search per element.
+"""
+
+import numpy as np
+from netCDF4 import Dataset
+
+# lookups already read in by get_Q_ext_lookup(), kept for the whole process
+#   {(ceil_lam, f_RH_path, Q_ext_dry_path, method): QextLookup}
+lookup_cache = {}
+
+def axis_weights(axis, x, method='linear'):
+
+    """
+    Find the neighbouring points on a sorted axis, and the weight of the upper one, for all of x at once.
+    x outside the axis is clamped to the end values.
+
+    :param axis: sorted 1D axis
+    :param x: values to find (any shape)
+    :param method: 'linear' or 'nearest'
+    :return: idx_lo, idx_hi: indices of the lower and upper neighbours (same shape as x)
+    :return: w: weight of the upper neighbour (1 - w for the lower)
+    """
+
+    axis = np.asarray(axis, dtype=float)
+    x = np.asarray(x, dtype=float)
+
+    # single point axis, nothing to interpolate
+    if len(axis) == 1:
+        idx_lo = np.zeros(x.shape, dtype=int)
+        return idx_lo, idx_lo, np.zeros(x.shape)
+
+    idx_lo = np.clip(np.searchsorted(axis, x, side='right') - 1, 0, len(axis) - 2)
+    idx_hi = idx_lo + 1
+
+    w = np.clip((x - axis[idx_lo]) / (axis[idx_hi] - axis[idx_lo]), 0.0, 1.0)
+
+    if method == 'nearest':
+        w = np.where(w > 0.5, 1.0, 0.0)
+    elif method != 'linear':
+        raise ValueError("method needs to be either 'linear' or 'nearest'")
+
+    return idx_lo, idx_hi, w
+
+def axis_inv_spacing(axis, x, idx_lo, idx_hi):
+
+    """
+    1 / spacing of the axis segment each x is in, i.e. the rate of change of the linear weight w with x.
+    0 where x is off the ends of the axis (where the lookup is clamped).
+
+    :param axis: sorted 1D axis
+    :param x: values (any shape)
+    :param idx_lo: from axis_weights()
+    :param idx_hi: from axis_weights()
+    :return: dw_dx: same shape as x
+    """
+
+    axis = np.asarray(axis, dtype=float)
+    x = np.asarray(x, dtype=float)
+
+    if len(axis) == 1:
+        return np.zeros(x.shape)
+
+    inside = (x >= axis[0]) & (x <= axis[-1])
+
+    return np.where(inside, 1.0 / (axis[idx_hi] - axis[idx_lo]), 0.0)
+
+class QextLookup(object):
+
+    """
+    Q_ext_dry(r_md) and f(RH)(time, r_md, RH) tables, with vectorised lookups.
+
+    :param f_RH: f(RH) table [time, radius, RH] (a 1D [RH] curve is also fine)
+    :param RH: RH axis of f_RH [fraction]
+    :param Q_ext_dry: Q_ext for dry aerosol [radius]
+    :param Q_radius: radius axis of Q_ext_dry [m]
+    :param f_RH_radius: (optional) radius axis of f_RH [m]
+    :param f_RH_time: (optional) time axis of f_RH, e.g. month number or days
+    :param method: 'linear' or 'nearest'
+    """
+
+    def __init__(self, f_RH, RH, Q_ext_dry, Q_radius, f_RH_radius=None, f_RH_time=None, method='linear'):
+
+        f_RH = np.asarray(f_RH, dtype=float)
+
+        # always keep f(RH) as [time, radius, RH]
+        while f_RH.ndim < 3:
+            f_RH = f_RH[np.newaxis, ...]
+
+        self.f_RH = f_RH
+        self.RH = np.asarray(RH, dtype=float)
+        self.f_RH_radius = np.array([np.nan]) if f_RH_radius is None else np.asarray(f_RH_radius, dtype=float)
+        self.f_RH_time = np.arange(f_RH.shape[0], dtype=float) if f_RH_time is None else np.asarray(f_RH_time, dtype=float)
+
+        self.Q_ext_dry_table = np.asarray(Q_ext_dry, dtype=float)
+        self.Q_radius = np.asarray(Q_radius, dtype=float)
+
+        self.method = method
+
+    def Q_ext_dry(self, r_md):
+
+        """
+        :param r_md: dry mean volume radius [m] (any shape)
+        :return: Q_ext_dry, same shape as r_md
+        """
+
+        lo, hi, w = axis_weights(self.Q_radius, r_md, self.method)
+
+        return ((1.0 - w) * self.Q_ext_dry_table[lo]) + (w * self.Q_ext_dry_table[hi])
+
+    def f_RH_lookup(self, RH, r_md=None, time=None):
+
+        """
+        :param RH: relative humidity [fraction] (any shape)
+        :param r_md: (optional) dry mean volume radius [m]. Needed if the f(RH) table varies with radius
+        :param time: (optional) position on the time axis of the table (e.g. month number). Needed if the f(RH) table
+                        varies with time
+        :return: f(RH), with the broadcast shape of RH, r_md and time
+        """
+
+        if (r_md is None) & (len(self.f_RH_radius) > 1):
+            raise ValueError('f(RH) table varies with radius, so r_md needs to be given')
+        if (time is None) & (len(self.f_RH_time) > 1):
+            raise ValueError('f(RH) table varies with time, so time needs to be given')
+
+        RH, r_md, time = np.broadcast_arrays(np.asarray(RH, dtype=float),
+                                             np.nan if r_md is None else np.asarray(r_md, dtype=float),
+                                             np.nan if time is None else np.asarray(time, dtype=float))
+
+        t_lo, t_hi, t_w = axis_weights(self.f_RH_time, time, self.method)
+        r_lo, r_hi, r_w = axis_weights(self.f_RH_radius, r_md, self.method)
+        h_lo, h_hi, h_w = axis_weights(self.RH, RH, self.method)
+
+        # weighted sum of the 8 surrounding points
+        f_RH = np.zeros(RH.shape)
+        for t_idx, t_wi in [(t_lo, 1.0 - t_w), (t_hi, t_w)]:
+            for r_idx, r_wi in [(r_lo, 1.0 - r_w), (r_hi, r_w)]:
+                for h_idx, h_wi in [(h_lo, 1.0 - h_w), (h_hi, h_w)]:
+                    f_RH += t_wi * r_wi * h_wi * self.f_RH[t_idx, r_idx, h_idx]
+
+        return f_RH
+
+    def Q_ext_dry_slope(self, r_md):
+
+        """
+        dQ_ext_dry/dr_md of the linearly interpolated table. 0 off the ends of the table, or for the 'nearest' method.
+
+        :param r_md: dry mean volume radius [m] (any shape)
+        :return: dQ_ext_dry/dr_md [m-1], same shape as r_md
+        """
+
+        if self.method == 'nearest':
+            return np.zeros(np.shape(r_md))
+
+        lo, hi, w = axis_weights(self.Q_radius, r_md)
+
+        return (self.Q_ext_dry_table[hi] - self.Q_ext_dry_table[lo]) * axis_inv_spacing(self.Q_radius, r_md, lo, hi)
+
+    def f_RH_slope(self, RH, r_md=None, time=None):
+
+        """
+        df(RH)/dRH of the interpolated table, with r_md and time held constant. 0 off the ends of the RH axis, or
+        for the 'nearest' method.
+
+        :param RH: relative humidity [fraction] (any shape)
+        :param r_md: (optional) as f_RH_lookup()
+        :param time: (optional) as f_RH_lookup()
+        :return: df(RH)/dRH [fraction-1], with the broadcast shape of RH, r_md and time
+        """
+
+        if (r_md is None) & (len(self.f_RH_radius) > 1):
+            raise ValueError('f(RH) table varies with radius, so r_md needs to be given')
+        if (time is None) & (len(self.f_RH_time) > 1):
+            raise ValueError('f(RH) table varies with time, so time needs to be given')
+
+        RH, r_md, time = np.broadcast_arrays(np.asarray(RH, dtype=float),
+                                             np.nan if r_md is None else np.asarray(r_md, dtype=float),
+                                             np.nan if time is None else np.asarray(time, dtype=float))
+
+        if self.method == 'nearest':
+            return np.zeros(RH.shape)
+
+        t_lo, t_hi, t_w = axis_weights(self.f_RH_time, time)
+        r_lo, r_hi, r_w = axis_weights(self.f_RH_radius, r_md)
+        h_lo, h_hi, h_w = axis_weights(self.RH, RH)
+        dw_dRH = axis_inv_spacing(self.RH, RH, h_lo, h_hi)
+
+        # slope along RH of the weighted sum in f_RH_lookup()
+        f_RH_slope = np.zeros(RH.shape)
+        for t_idx, t_wi in [(t_lo, 1.0 - t_w), (t_hi, t_w)]:
+            for r_idx, r_wi in [(r_lo, 1.0 - r_w), (r_hi, r_w)]:
+                f_RH_slope += t_wi * r_wi * (self.f_RH[t_idx, r_idx, h_hi] - self.f_RH[t_idx, r_idx, h_lo])
+
+        return f_RH_slope * dw_dRH
+
+    def Q_ext_wet(self, r_md, RH, time=None):
+
+        """
+        Q_ext_wet = Q_ext_dry(r_md) * f(RH)
+
+        :param r_md: dry mean volume radius [m]
+        :param RH: relative humidity [fraction]
+        :param time: (optional) position on the time axis of the f(RH) table
+        :return: Q: Q_ext_wet
+        :return: Q_ext_dry
+        :return: f_RH
+        """
+
+        Q_ext_dry = self.Q_ext_dry(r_md)
+
+        if len(self.f_RH_radius) > 1:
+            f_RH = self.f_RH_lookup(RH, r_md=r_md, time=time)
+        else:
+            f_RH = self.f_RH_lookup(RH, time=time)
+
+        Q = Q_ext_dry * f_RH
+
+        return Q, Q_ext_dry, f_RH
+
+# Reading
+
+def read_Q_ext_dry_csv(Q_ext_dry_path):
+
+    """
+    Read in the Q_ext for dry murk from csv (radius [m], Q_ext)
+
+    :param Q_ext_dry_path:
+    :return: Q_ext_dry = {radius:... Q_ext:...}
+    """
+
+    raw = np.loadtxt(Q_ext_dry_path, delimiter=',')
+
+    Q_ext_dry = {'radius': raw[:, 0],
+                 'Q_ext': raw[:, 1]}
+
+    return Q_ext_dry
+
+def read_Q_ext_lookup_csv(f_RH_path, Q_ext_dry_path, method='linear'):
+
+    """
+    Create the lookup from the csv files: f(RH) (RH [fraction], f_RH) and Q_ext_dry (radius [m], Q_ext)
+
+    :param f_RH_path:
+    :param Q_ext_dry_path:
+    :param method: 'linear' or 'nearest'
+    :return: QextLookup
+    """
+
+    raw = np.loadtxt(f_RH_path, delimiter=',')
+    Q_ext_dry = read_Q_ext_dry_csv(Q_ext_dry_path)
+
+    return QextLookup(raw[:, 1], raw[:, 0], Q_ext_dry['Q_ext'], Q_ext_dry['radius'], method=method)
+
+def read_Q_ext_lookup_netCDF(f_RH_path, Q_ext_dry_path, var_name='f(RH) MURK', method='linear'):
+
+    """
+    Create the lookup from a monthly or daily f(RH) netCDF file and the Q_ext_dry csv file
+
+    :param f_RH_path: monthly or daily f(RH) netCDF file
+    :param Q_ext_dry_path: Q_ext_dry csv (radius [m], Q_ext)
+    :param var_name: f(RH) variable to use. 'f(RH) MURK' is [time, radius, RH], species are [radius, RH]
+    :param method: 'linear' or 'nearest'
+    :return: QextLookup. The time axis is month number for monthly files and days since the start for daily files
+    """
+
+    ncfile = Dataset(f_RH_path, 'r')
+
+    # the monthly and daily files do not use the same co-ordinate names
+    def first_var(names):
+        for name in names:
+            if name in ncfile.variables:
+                return np.array(ncfile.variables[name][:], dtype=float)
+        return None
+
+    RH = first_var(['RH', 'Relative Humidity'])
+    radius_m = first_var(['radii_range', 'radii_range_nm']) * 1.0e-9 # nm to m
+    f_RH = np.array(ncfile.variables[var_name][:], dtype=float)
+
+    if f_RH.ndim == 3:
+        time = first_var(['month', 'months', 'times'])
+    else:
+        time = None
+
+    ncfile.close()
+
+    Q_ext_dry = read_Q_ext_dry_csv(Q_ext_dry_path)
+
+    return QextLookup(f_RH, RH, Q_ext_dry['Q_ext'], Q_ext_dry['radius'], f_RH_radius=radius_m, f_RH_time=time,
+                      method=method)
+
+# Caching
+
+def get_Q_ext_lookup(ceil_lam, f_RH_path, Q_ext_dry_path, method='linear', reload=False):
+
+    """
+    Get the lookup for these files, only reading them in the first time they are asked for. Later calls return the
+    same QextLookup from lookup_cache, without touching the disk.
+
+    :param ceil_lam: wavelength the tables are for [nm]
+    :param f_RH_path: f(RH) csv or netCDF (.nc) file
+    :param Q_ext_dry_path: Q_ext_dry csv file
+    :param method: 'linear' or 'nearest'
+    :param reload: read the files in again, even if they are already in the cache (e.g. if they have been remade)
+    :return: QextLookup
+    """
+
+    key = (ceil_lam, f_RH_path, Q_ext_dry_path, method)
+
+    if (reload == True) | (key not in lookup_cache):
+        if f_RH_path.endswith('.nc'):
+            lookup_cache[key] = read_Q_ext_lookup_netCDF(f_RH_path, Q_ext_dry_path, method=method)
+        else:
+            lookup_cache[key] = read_Q_ext_lookup_csv(f_RH_path, Q_ext_dry_path, method=method)
+
+    return lookup_cache[key]
+
+def evict_Q_ext_lookup(ceil_lam=None, file_path=None):
+
+    """
+    Remove lookups from the cache, so they get read in again next time
+
+    :param ceil_lam: (optional) only remove lookups for this wavelength [nm]
+    :param file_path: (optional) only remove lookups made from this file (f(RH) or Q_ext_dry)
+    :return: removed: keys of the removed lookups
+    """
+
+    removed = [key for key in lookup_cache.keys()
+               if ((ceil_lam is None) or (key[0] == ceil_lam)) & ((file_path is None) or (file_path in key[1:3]))]
+
+    for key in removed:
+        del lookup_cache[key]
+
+    return removed
@@ -18,6 +18,7 @@ import ellUtils as eu
 import ceilUtils as ceil
 from forward_operator import FOUtils as FO
 from forward_operator import FOconstants as FOcon
+from obs_mod_matching import nearest_heights
 
 def dateList_to_datetime(dayList):
 
@@ -31,101 +32,6 @@ def dateList_to_datetime(dayList):
 
     return datetimeDays
 
-def nearest_heights(mod_height, obs_height, corr_max_height):
-
-    """
-    Get the nearest ceilometer height gate to each model level
-
-    :param mod_height:
-    :param obs_height:
-    :param corr_max_height:
-    :return:
-
-    obs_idx = ALL nearest gate idx
-    mod_idx = idx of the model height that each obs_idx are paired to
-    """
-
-    def unique_pairs(obs_idx, diff):
-
-        """
-        Find range that excludes duplicate occurances. Keeps the pair with the smallest height difference and removes
-        the rest.
-
-        :param obs_idx:
-        :param diff:
-        :return: unique_pairs_range
-
-        At this point, the two arrays are like:
-        obs_idx = [0, 0, 0, 1, 3, 5, .... 769, 769, 769]
-        mod_idx = [0, 1, 2, 3, 4, 4, .... 67,  68,  69 ]
-        By finding the unique pairs index array for obs_idx, the same array can be used
-        on the mod_idx, as they are already paired up and of equal lengths. E.g. from above
-        0-0, 0-1, ..., 3-4, 5-4 etc.
-        """
-
-        # 1. remove start duplicates
-        # -------------------------------
-        # find start idx to remove duplicate pairs
-        duplicates = np.where(obs_idx == obs_idx[0])[0]  # find duplicates
-
-        if len(duplicates) > 1:
-            lowest_diff = np.argmin(abs(diff[duplicates]))  # find which has smallest difference
-            pairs_idx_start = duplicates[lowest_diff]  # set start position for pairing at this point
-        else:
-            pairs_idx_start = 0
-
-        # 2. remove end duplicates
-        # -------------------------------
-        # find end idx to remove duplicate pairs
-        duplicates = np.where(obs_idx == obs_idx[-1])[0]  # find duplicates
-        if len(duplicates) > 1:
-            lowest_diff = np.argmin(abs(diff[duplicates]))  # find which has smallest difference
-            pairs_idx_end = duplicates[lowest_diff]  # set start position for pairing at this point
-        else:
-            pairs_idx_end = len(obs_idx)
-
-        # create range in order to extract the unique pairs
-        unique_pairs_range = np.arange(pairs_idx_start, pairs_idx_end + 1)
-
-        return unique_pairs_range
-
-    a = np.array([eu.nearest(obs_height, i) for i in mod_height])
-    values = a[:, 0]
-    obs_idx = np.array(a[:, 1], dtype=int)
-    diff = a[:, 2]
-    mod_idx = np.arange(len(mod_height))  # mod_idx should be paired with obs_idx spots.
-
-    # Trim off the ends of obs_idx, as UKV and obs z0 and zmax are different, leading to the same gate matching multiple ukvs
-    # assumes no duplicates in the middle of the arrays, just at the end
-
-    # At this point, variables are like:
-    # obs_idx = [0, 0, 0, 1, 3, 5, .... 769, 769, 769]
-    # mod_idx = [0, 1, 2, 3, 4, 4, .... 67,  68,  69 ]
-    unique_pairs_range = unique_pairs(obs_idx, diff)
-
-    # ALL unique pairs
-    # Use these to plot correlations for all possible pairs, regardless of height
-    obs_unique_pairs = obs_idx[unique_pairs_range]
-    mod_unique_pairs = mod_idx[unique_pairs_range]
-    values_unique_pairs = values[unique_pairs_range]
-    diff_unique_pairs = diff[unique_pairs_range]
-
-    # ~~~~~~~~~~~~~~~~~~~~ #
-
-    # Remove pairs where obs is above the max allowed height.
-    # hc = height cut
-    hc_unique_pairs_range = np.where(values_unique_pairs <= corr_max_height)[0]
-
-    # trim off unique pairs that are above the maximum height
-    obs_hc_unique_pairs = obs_unique_pairs[hc_unique_pairs_range]
-    mod_hc_unique_pairs = mod_unique_pairs[hc_unique_pairs_range]
-    pairs_hc_unique_values = values_unique_pairs[hc_unique_pairs_range]
-    pairs_hc_unique_diff = diff_unique_pairs[hc_unique_pairs_range]
-
-
-    return obs_hc_unique_pairs, mod_hc_unique_pairs, \
-           pairs_hc_unique_values, pairs_hc_unique_diff
-
 if __name__ == '__main__':
 
     # ==============================================================================
@@ -276,7 +182,8 @@ if __name__ == '__main__':
             # get unique pairs of ceilometer obs to model, then do a simple MBE
             obs_hc_unique_pairs, mod_hc_unique_pairs, \
             pairs_hc_unique_values, pairs_hc_unique_diff = \
-                nearest_heights(mod_data[site]['level_height'], bsc_obs_sub[ceil_id_full]['height'], max_height)
+                nearest_heights(mod_data[site]['level_height'], bsc_obs_sub[ceil_id_full]['height'],
+                                maxHeight=max_height)
 
             # extract out all unique pairs below the upper height limit
             # these are time and height matched now
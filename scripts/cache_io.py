@@ -0,0 +1,40 @@
+"""
+Write cache files so that they can be shared between processes (e.g. a Pool of workers, or two runs at once).
+
+A cache file is written under a temporary name unique to the process, then moved into place. Cache files are only
+ever written once for a given name, so if another process has already made the file, its copy is kept and ours is
+thrown away. A half written file is never read back in, and os.rename is never asked to replace an existing file
+(which it cannot do on Windows).
+"""
+
+import os
+
+def write_cache_file(path, write_func):
+
+    """
+    Write a cache file, via a temporary file unique to this process
+
+    :param path: final path of the cache file
+    :param write_func: function that writes the data to an open (binary) file handle e.g.
+                        lambda handle: np.save(handle, data)
+    :return: written: True if this process's file was kept, False if another process had already made path
+    """
+
+    tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+
+    with open(tmp_path, 'wb') as handle:
+        write_func(handle)
+
+    if os.path.exists(path):
+        # another process got there first
+        os.remove(tmp_path)
+        return False
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process made path between the check and the rename
+        os.remove(tmp_path)
+        return False
+
+    return True
@@ -16,6 +16,7 @@ from scipy.stats import spearmanr
 import ellUtils as eu
 from forward_operator import FOUtils as FO
 from forward_operator import FOconstants as FOcon
+from obs_mod_matching import block_average_obs
 
 def dateList_to_datetime(dayList):
 
@@ -96,6 +97,11 @@ def main():
 
     calib=True
 
+    # average the obs into hourly blocks first, so each hour counts equally towards the daily average profile,
+    # even if some of the obs are missing. Method = 'mean', 'nanmean', 'median' or 'nanmedian'.
+    hourly_average = False
+    hourly_average_method = 'nanmean'
+
     # ==============================================================================
     # Read data
     # ==============================================================================
@@ -116,6 +122,11 @@ def main():
 
         bsc_obs = FO.read_ceil_obs_only(day, site_bsc, ceilDatadir, calib=calib)
 
+        if hourly_average == True:
+            # hour ending times, so the blocks are 00-01, 01-02, ... 23-24 UTC
+            hours = [day + dt.timedelta(hours=h) for h in range(1, 25)]
+            bsc_obs = block_average_obs(bsc_obs, hours, method=hourly_average_method, window='previous')
+
         # set up the average dicts
         if day == days_iterate[0]:
 
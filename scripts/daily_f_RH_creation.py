@@ -6,6 +6,7 @@ Based on f_RH_creation.py
 """
 
 import numpy as np
+import os
 from scipy.optimize import curve_fit
 from scipy import interpolate
 from scipy.interpolate import interp1d
@@ -13,10 +14,13 @@ import matplotlib.pyplot as plt
 import matplotlib as mpl
 from matplotlib import cm
 import pickle
+from multiprocessing import Pool
+from functools import partial
 from netCDF4 import Dataset
 import datetime as dt
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import ellUtils as eu
+from f_RH_creation import read_aer_data_cached
 
 # Reading
 
@@ -70,121 +74,159 @@ def read_spec_bands(file_path):
 
     return spec_bands
 
-def read_aer_data(file_path, aer_index, aer_order, band=1):
+# Processing
 
-    """
-    Read in the aerosol data, calculate the Qs
+def calc_f_RH(data, aer_order, Q_type=''):
 
-    :param file_path:
-    :param aer_index:
+    """
+    Calculate f(RH) for the Q type
+    :param data:
     :param aer_order:
-    :param band
+    :param Q_type:
     :return:
     """
 
-    # print "Reading from:" + file_path
-    # print "Band: " + str(band)
-
     # define arrays
-    data = {}
+    Q = {}
+    f_RH = {}
 
     for aer in aer_order:
 
+        if Q_type == 'extinction':
+            # calculate total extinction (abs + scatt)
+            Q[aer] = np.sum((data[aer][:, 1], data[aer][:, 2]), axis=0)
 
-        # print 'Getting ...' + aer
+        elif Q_type == 'scattering':
+            # extract scattering
+            Q[aer] = data[aer][:, 2]
 
-        data[aer] = []
+        elif Q_type == 'absorption':
+            # extract absorption
+            Q[aer] = data[aer][:, 1]
+        else:
+            raise ValueError("Incorrect Q_type value. Needs to be either 'extinction', 'absorption', or 'scattering'")
 
-        file = open(file_path, "r")
+        # calculate f(RH) = Q(RH>=0)/Q(RH=0)
+        f_RH[aer] = np.array([Q_RH / Q[aer][0] for Q_RH in Q[aer]])
 
-        line = file.readline()  # read the first actual line
-        line = line.rstrip('\n\r')
+    return Q, f_RH
 
-        while line != '*BLOCK: TYPE =   11: SUBTYPE =    1: VERSION =    2':
-            line = file.readline()
-            line = line.rstrip('\n\r')
+def radius_file_path(specdir, radius_nm_i, geo_stdev='1.6'):
 
-        # while line != 'Index of species = 6 Accum. Sulphate':
-        while line != 'Index of species = ' + str(aer_index[aer]) + ' ' + aer:
-            line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
+    """
+    Path of the spectral file for a single radius
+    :param specdir: directory with the sp_885-925_r... spectral files in
+    :param radius_nm_i: radius [nm]
+    :param geo_stdev: geometric standard deviation as it appears in the spectral file names
+    :return: file_path
+    """
 
-        while line != 'Band = ' + str(band):
-            line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
+    # format of radius used in the filename
+    #   trying to use m or microns leads to rounding errors when making the string...
+    radius_filestr = '0.%09d' % radius_nm_i
 
+    # create filename
+    filename = 'sp_885-925_r'+radius_filestr+'_stdev'+geo_stdev+'_num4.461e9'
 
-        # skip two lines
-        line = file.readline()
-        line = file.readline()
+    return specdir + filename
 
-        # read first line of data
-        line = file.readline()
-        line = line.rstrip('\n\r')
+def create_f_RH_file(file_path, aer_index, aer_order, aer_particles_chem, RH_int, band=1, Q_type='extinction',
+                     cachedir=None):
 
-        # when reached the data line...
-        while (line != 'Band = ' + str(band + 1)) & (line != '*END'):
+    """
+    Read in a single spectral file and create the f(RH) curve of each species, interpolated onto RH_int
+    :param file_path: spectral file
+    :param aer_index:
+    :param aer_order:
+    :param aer_particles_chem: {species name: chemical name} for all species, including soot
+    :param RH_int: interpolated RH values [fraction]
+    :param band:
+    :param Q_type:
+    :param cachedir: (optional) spectral file cache directory
+    :return: interp_f_RH_i: f(RH) curves {species name: [RH_int]}
+    """
 
-            line = ' '.join(line.split()) # remove duplicate, trailing and leading spaces
-            line_split = line.split(' ')
+    print 'on file: ' + os.path.basename(file_path)
 
-            # extract data
-            data[aer] += [line_split]
+    # read the aerosol data, all species in a single pass of the file (or from the cache)
+    aer_data, _ = read_aer_data_cached(file_path, aer_index, aer_order, cachedir, bands=[band])
+    data = dict(zip(aer_order, aer_data[:, 0, :, :]))
 
-            line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
+    # Extract RH (RH is the same across all aerosol types)
+    RH = np.array(data[aer_order[0]][:, 0])
 
-        file.close()
+    # calculate f(RH) for each species
+    Q, f_RH_i = calc_f_RH(data, aer_order, Q_type=Q_type)
 
-        # convert to numpy array, list already alligned correctly for np.array()
-        data[aer] = np.array(data[aer], dtype=float)
+    # linearly interpolate f(RH) to increase resolution from 0.05 to 0.01 [fraction]
+    interp_f_RH_i = {}
 
+    # soot is always the same (fixed at 1)
+    interp_f_RH_i['Soot'] = np.repeat(1.0, len(RH_int))
 
-    return data
+    # boost RH resolution (soot already boosted)
+    for species_i in aer_particles_chem.iterkeys():
+        if species_i != 'Soot':
+            f = interp1d(RH, f_RH_i[species_i], kind='linear')
+            interp_f_RH_i[species_i] = f(RH_int)
 
-# Processing
+    return interp_f_RH_i
 
-def calc_f_RH(data, aer_order, Q_type=''):
+def create_f_RH_all_files(file_paths, aer_index, aer_order, aer_particles_chem, RH_int, band=1,
+                          Q_type='extinction', cachedir=None, n_workers=1):
 
     """
-    Calculate f(RH) for the Q type
-    :param data:
-    :param aer_order:
-    :param Q_type:
-    :return:
+    Create the interpolated f(RH) curves of each species, for every spectral file. Each file is independent, so they
+    can be spread across a pool of n_workers processes. Results are the same as doing them one after another.
+    :param file_paths: spectral files
+    :param n_workers: number of processes to use (1 = run in serial, in this process)
+    :return: interp_f_RH: list of f(RH) curves {species name: [RH_int]}, one for each file in file_paths
+    (see create_f_RH_file() for the other params)
     """
 
-    # define arrays
-    Q = {}
-    f_RH = {}
+    # fix everything but the file
+    f_RH_file = partial(create_f_RH_file, aer_index=aer_index, aer_order=aer_order,
+                        aer_particles_chem=aer_particles_chem, RH_int=RH_int, band=band, Q_type=Q_type,
+                        cachedir=cachedir)
 
-    for aer in aer_order:
+    if n_workers > 1:
+        pool = Pool(n_workers)
+        try:
+            # map keeps the results in the same order as file_paths
+            interp_f_RH = pool.map(f_RH_file, file_paths)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        interp_f_RH = [f_RH_file(file_path) for file_path in file_paths]
 
-        if Q_type == 'extinction':
-            # calculate total extinction (abs + scatt)
-            Q[aer] = np.sum((data[aer][:, 1], data[aer][:, 2]), axis=0)
+    return interp_f_RH
 
-        elif Q_type == 'scattering':
-            # extract scattering
-            Q[aer] = data[aer][:, 2]
+def calc_f_RH_MURK(f_RH, rel_vol, aer_particles):
 
-        elif Q_type == 'absorption':
-            # extract absorption
-            Q[aer] = data[aer][:, 1]
-        else:
-            raise ValueError("Incorrect Q_type value. Needs to be either 'extinction', 'absorption', or 'scattering'")
+    """
+    Create the MURK f(RH) as the relative volume weighted sum of the species f(RH) curves, for all times at once.
+    Done as a single tensor contraction of the [time, species] relative volumes with the [species, radius, RH] curves.
+    :param f_RH: species f(RH) curves {chemical name: [radius, RH]}
+    :param rel_vol: relative volume of each species {chemical name: [time]}
+    :param aer_particles: chemical names of the species that make up MURK
+    :return: f_RH_MURK: [time, radius, RH]
+    """
 
-        # calculate f(RH) = Q(RH>=0)/Q(RH=0)
-        f_RH[aer] = np.array([Q_RH / Q[aer][0] for Q_RH in Q[aer]])
+    # [time, species]
+    rel_vol_matrix = np.transpose(np.array([rel_vol[chem_i] for chem_i in aer_particles], dtype=float))
 
-    return Q, f_RH
+    # [species, radius, RH]
+    f_RH_species = np.array([f_RH[chem_i] for chem_i in aer_particles], dtype=float)
+
+    f_RH_MURK = np.einsum('ts,srh->trh', rel_vol_matrix, f_RH_species)
+
+    return f_RH_MURK
 
 # Saving
 
-def save_fRH_netCDF(fRHdir, f_RH, size_extract_nm, RH_int, site_ins, ceil_lambda_nm_str, pm10_time, timeRes='daily'):
+def save_fRH_netCDF(fRHdir, f_RH, size_extract_nm, RH_int, site_ins, ceil_lambda_nm_str, pm10_time, timeRes='daily',
+                    zlib=False, complevel=4, shuffle=True, float32=False, radii_chunk=8):
     """
     Create a netCDF file for the f(RH) information to be stored in.
     :param fRHdir: dircetory to save netCDF file to (should ideally be the monthly f(RH) dir)
@@ -194,23 +236,35 @@ def save_fRH_netCDF(fRHdir, f_RH, size_extract_nm, RH_int, site_ins, ceil_lambda
     :param site_ins: site information
     :param ceil_lambda_nm_str: ceilometer wavelength as str with nm on the end e.g. '905.0nm'
     :param pm10_time: time from the rel_vol calculations
-    param: timeRes: f(RH) time resolution
+    param: timeRes: f(RH) time resolution, 'daily' or 'hourly'. Sets the file name and the time units
+    :param zlib: compress the f(RH) variables
+    :param complevel: zlib compression level (1-9)
+    :param shuffle: use the shuffle filter with zlib (usually makes compression better)
+    :param float32: store the f(RH) variables as float32 instead of float64
+    :param radii_chunk: number of radii in each chunk. Chunks are [1 time, radii_chunk radii, all RH], to
+                suit the forward operator reading one time and a few radii at a time.
     :return:
 
     Store the MURK [month, radius, RH] AND species f(RH) curves [radius, RH]
     """
 
-    # prepare time so it is days after start day
+    # prepare time so it is days (or hours) after start day
     # tdiffs is the number of days since the start day
     start_day = pm10_time[0]
     t_diff = np.array([i - start_day for i in pm10_time])
-    t_diff_days = np.array([i.days for i in t_diff])
+    if timeRes == 'hourly':
+        t_diff_days = np.array([(i.days * 24.0) + (i.seconds / 3600.0) for i in t_diff])
+        t_units = 'hours since '
+    else:
+        t_diff_days = np.array([i.days for i in t_diff])
+        t_units = 'days since '
 
     # create netCDF file
-    ncfile = Dataset(fRHdir + 'daily_f(RH)_' + site_ins['site_short'] + '_' + ceil_lambda_nm_str + '.nc', 'w')
+    ncfile = Dataset(fRHdir + timeRes + '_f(RH)_' + site_ins['site_short'] + '_' + ceil_lambda_nm_str + '.nc', 'w')
 
     # create Dimensions
-    ncfile.createDimension('time', len(pm10_time))
+    #   time is unlimited so new days can be appended later (see append_fRH_netCDF)
+    ncfile.createDimension('time', None)
     ncfile.createDimension('RH', len(RH_int))
     ncfile.createDimension('radii_range', len(size_extract_nm))
 
@@ -223,19 +277,27 @@ def save_fRH_netCDF(fRHdir, f_RH, size_extract_nm, RH_int, site_ins, ceil_lambda
     nc_RH[:] = RH_int
     nc_radii_range_nm[:] = size_extract_nm
 
-    nc_times.units = 'days since ' + start_day.strftime('%Y-%m-%d %H:%M')
+    nc_times.units = t_units + start_day.strftime('%Y-%m-%d %H:%M')
     nc_RH.units = 'fraction'
     nc_radii_range_nm.units = 'nm'
 
+    # storage type, compression and chunking for the f(RH) variables
+    f_RH_dtype = np.float32 if float32 else np.float64
+    radii_chunk = min(radii_chunk, len(size_extract_nm))
+
     # create and fill variables
     for species_i in f_RH.keys():
         var_name = 'f(RH) ' + species_i
 
         if var_name == 'f(RH) MURK':
-            nc_f_RH_MURK = ncfile.createVariable('f(RH) MURK', np.float64, ('time', 'radii_range', 'RH'))
+            nc_f_RH_MURK = ncfile.createVariable('f(RH) MURK', f_RH_dtype, ('time', 'radii_range', 'RH'),
+                                                 zlib=zlib, complevel=complevel, shuffle=shuffle,
+                                                 chunksizes=(1, radii_chunk, len(RH_int)))
             nc_f_RH_MURK[:] = f_RH['MURK']
         else:
-            nc_f_RH_species_i = ncfile.createVariable(var_name, np.float64, ('radii_range', 'RH'))
+            nc_f_RH_species_i = ncfile.createVariable(var_name, f_RH_dtype, ('radii_range', 'RH'),
+                                                      zlib=zlib, complevel=complevel, shuffle=shuffle,
+                                                      chunksizes=(radii_chunk, len(RH_int)))
             nc_f_RH_species_i[:] = f_RH[species_i]
 
     # extra attributes
@@ -246,6 +308,83 @@ def save_fRH_netCDF(fRHdir, f_RH, size_extract_nm, RH_int, site_ins, ceil_lambda
 
     return
 
+def read_fRH_netCDF(fRHdir, site_ins, ceil_lambda_nm_str):
+
+    """
+    Read in a daily f(RH) netCDF file, made by save_fRH_netCDF()
+    :param fRHdir: directory the netCDF file is in
+    :param site_ins: site information
+    :param ceil_lambda_nm_str: ceilometer wavelength as str with nm on the end e.g. '905.0nm'
+    :return: f_RH: f(RH) curves. MURK [time, radius, RH] AND species [radius, RH]
+    :return: radii_range_nm: radii sizes used to make f(RH)
+    :return: RH: RH values [fraction]
+    :return: time: list of datetimes for the MURK time dimension
+    """
+
+    ncfile = Dataset(fRHdir + 'daily_f(RH)_' + site_ins['site_short'] + '_' + ceil_lambda_nm_str + '.nc', 'r')
+
+    # time is stored as days since the start day
+    start_day = dt.datetime.strptime(ncfile.variables['times'].units, 'days since %Y-%m-%d %H:%M')
+    time = [start_day + dt.timedelta(days=float(i)) for i in ncfile.variables['times'][:]]
+
+    RH = ncfile.variables['Relative Humidity'][:]
+    radii_range_nm = ncfile.variables['radii_range_nm'][:]
+
+    f_RH = {}
+    for var_name in ncfile.variables.iterkeys():
+        if var_name.startswith('f(RH) '):
+            f_RH[var_name[6:]] = ncfile.variables[var_name][:]
+
+    ncfile.close()
+
+    return f_RH, radii_range_nm, RH, time
+
+def append_fRH_netCDF(fRHdir, f_RH_MURK_new, site_ins, ceil_lambda_nm_str, new_time):
+
+    """
+    Append new days of MURK f(RH) onto the end of an existing daily f(RH) netCDF file (along the unlimited time
+    dimension). The species f(RH) curves, RH and radii are already in the file and are left alone.
+    :param fRHdir: directory the netCDF file is in
+    :param f_RH_MURK_new: MURK f(RH) for the new days only [new time, radius, RH]
+    :param site_ins: site information
+    :param ceil_lambda_nm_str: ceilometer wavelength as str with nm on the end e.g. '905.0nm'
+    :param new_time: sorted list of datetimes for the new days. All must be after the last day in the file.
+    :return:
+
+    The time dimension must stay sorted (read_Q_ext_lookup_netCDF and QextLookup rely on it), so days cannot be
+    backfilled. Recreate the file instead.
+    """
+
+    filepath = fRHdir + 'daily_f(RH)_' + site_ins['site_short'] + '_' + ceil_lambda_nm_str + '.nc'
+    ncfile = Dataset(filepath, 'a')
+
+    # days since the original start day
+    nc_times = ncfile.variables['times']
+    start_day = dt.datetime.strptime(nc_times.units, 'days since %Y-%m-%d %H:%M')
+    t_diff_days = np.array([(i - start_day).days for i in new_time])
+
+    # keep the time dimension sorted
+    if (len(nc_times) > 0) & (len(t_diff_days) > 0):
+        if (np.any(np.diff(t_diff_days) <= 0)) | (t_diff_days[0] <= nc_times[-1]):
+            ncfile.close()
+            raise ValueError('New days must be sorted and after the last day in ' + filepath + '. Recreate the '
+                             'file to add earlier days.')
+
+    # write the new days after those already there
+    t_start = len(nc_times)
+    t_end = t_start + len(new_time)
+    nc_times[t_start:t_end] = t_diff_days
+    ncfile.variables['f(RH) MURK'][t_start:t_end, :, :] = f_RH_MURK_new
+
+    # extra attributes
+    ncfile.history += '; appended ' + str(len(new_time)) + ' days ' + dt.datetime.now().strftime('%Y-%m-%d %H:%M') + ' GMT'
+
+    ncfile.close()
+
+    print filepath + ' appended!'
+
+    return
+
 # plotting
 
 def create_colours(intervals):
@@ -281,7 +420,10 @@ if __name__ == '__main__':
     # site_ins = {'site_short':'Ha', 'site_long': 'Harwell',
     #             'ceil_lambda': 0.905e-06, 'land-type': 'rural'}
 
-    ceil_lambda_nm_str = str(site_ins['ceil_lambda'] * 1e9) + 'nm'
+    # f(RH) is made by f_RH_climatology_creation, which imports this module for save_fRH_netCDF()
+    import f_RH_climatology_creation as clim
+
+    ceil_lambda_nm_str = clim.ceil_lambda_str(site_ins['ceil_lambda'])
 
     # User set args
     # band that read_spec_bands() uses to find the correct band
@@ -291,6 +433,17 @@ if __name__ == '__main__':
     # saveF(RH)?
     saveFRH = True
 
+    # f(RH) file storage: zlib compress? store as float32 instead of float64?
+    compressFRH = True
+    float32FRH = False
+
+    # only add new days to an existing f(RH) file, instead of recreating it?
+    #   species f(RH) curves are read from the file rather than recalculated
+    appendFRH = False
+
+    # number of processes to spread the radii across (1 = serial)
+    n_workers = 1
+
     # -------------------------
 
     # directories
@@ -299,6 +452,8 @@ if __name__ == '__main__':
     specdir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/' \
               'sp_885-925_r_files/'
     pickleloaddir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/pickle/'
+    # parsed spectral files are cached here (as .npy) to save re-reading the ASCII on later runs. None = no caching
+    cachedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/cache/'
 
 
     # variables to take from file (as listed within the file) with index from BLOCK = 0
@@ -334,12 +489,7 @@ if __name__ == '__main__':
 
     # read in relative volume of aerosol species
     #   created in VMachine "create_Qext_for_MURK_.py" and saved as a pickle
-    # # read in any pickled S data from before
-    filename = pickleloaddir + site_ins['site_short'] + '_daily_aerosol_relative_volume.pickle'
-    with open(filename, 'rb') as handle:
-        pickle_load_in = pickle.load(handle)
-    pm10_rel_vol = pickle_load_in['pm10_rel_vol']
-    pm10_time = pickle_load_in['time']
+    pm10_rel_vol, pm10_time = clim.load_rel_vol(pickleloaddir, site_ins['site_short'], 'daily')
 
     # range of radii to iterate over
     radii_range_m = np.arange(0.005e-06, 3.685e-6 + 0.005e-06, 0.005e-06)
@@ -349,76 +499,62 @@ if __name__ == '__main__':
     # RH to interpolate to
     RH_int = np.arange(0, 1.01, 0.01)
 
-    # create f(RH) dictionaries to fill (including one for murk)
-    #   MURK data will be in a 3D array [month, size, RH]
-    #   all other speices will be 2D [size, RH] as they wont vary each month
-    f_RH = {}
-    f_RH['MURK'] = np.empty((len(pm10_time), len(size_extract_nm), 101))
-    f_RH['MURK'][:] = np.nan
-    for species_i in aer_particles:
-        f_RH[species_i] = np.empty((len(size_extract_nm), 101))
-        f_RH[species_i][:] = np.nan
-
-
-    for array_idx, radius_nm_i in enumerate(size_extract_nm):
-
-        print 'on size: ' +str(radius_nm_i)
+    fRH_filepath = fRHdir + 'daily_f(RH)_' + site_ins['site_short'] + '_' + ceil_lambda_nm_str + '.nc'
 
-        # format of radius used in the filename
-        #   trying to use m or microns leads to rounding errors when making the string...
-        radius_filestr = '0.%09d' % radius_nm_i
+    if appendFRH & os.path.exists(fRH_filepath):
 
-        # create filename
-        filename = 'sp_885-925_r'+radius_filestr+'_stdev1.6_num4.461e9'
-        file_path = specdir + filename
+        # species curves and radii never change, so take them from the existing file
+        f_RH, radii_in_file_nm, _, fRH_time = read_fRH_netCDF(fRHdir, site_ins, ceil_lambda_nm_str)
 
-        # read in the spectral band information
-        spec_bands = read_spec_bands(file_path)
+        if not np.array_equal(radii_in_file_nm, size_extract_nm):
+            raise ValueError('Radii in ' + fRH_filepath + ' do not match size_extract_nm. Set appendFRH = False '
+                             'to recreate the file.')
 
-        # wavelength range in current band
-        band_idx = np.where(spec_bands['band'] == band)[0][0]
-        band_lam_range = '%.0f' % (spec_bands['lower_limit'][band_idx] * 1.0e9) + '-' + \
-                         '%.0f' % (spec_bands['upper_limit'][band_idx] * 1.0e9) + 'nm'
+        # daily average relative volume, as when the file is recreated
+        day_rel_vol, day_time = clim.aggregate_rel_vol(pm10_rel_vol, pm10_time, aer_particles, clim.day_key)
+        fRH_time = [clim.day_key(t) for t in fRH_time]
 
-        # read the aerosol data
-        data = read_aer_data(file_path, aer_index, aer_order, band=band)
+        # days in the relative volume input that are not in the file yet
+        fRH_time_set = set(fRH_time)
+        new_idx = np.array([t_idx for t_idx, t in enumerate(day_time) if t not in fRH_time_set], dtype=int)
+        new_time = [day_time[t_idx] for t_idx in new_idx]
+        print str(len(new_time)) + ' new days to add'
 
-        # Extract RH (RH is the same across all aerosol types)
-        RH = np.array(data[aer_order[0]][:, 0])
+        # the file's time dimension must stay sorted, so only days after its last day can be added
+        if (len(new_time) > 0) & (len(fRH_time) > 0):
+            if new_time[0] <= fRH_time[-1]:
+                raise ValueError('Relative volume has days missing from ' + fRH_filepath + ' before its last day ('
+                                 + fRH_time[-1].strftime('%Y-%m-%d') + '). Set appendFRH = False to recreate the file.')
 
-        # calculate f(RH) for each species
-        Q, f_RH_i = calc_f_RH(data, aer_order, Q_type=Q_type)
+        if len(new_time) > 0:
 
-        # add a soot f_RH
-        f_RH_i['Soot'] = np.array([1.0 for i in f_RH_i['Generic NaCl']])
+            # make f(RH) for murk for the new days only
+            new_rel_vol = {chem_i: day_rel_vol[chem_i][new_idx] for chem_i in aer_particles}
+            f_RH_MURK_new = calc_f_RH_MURK(f_RH, new_rel_vol, aer_particles)
 
-        # linearly interpolate f(RH) to increase resolution from 0.05 to 0.01 [fraction]
-        interp_f_RH_i = {}
+            if saveFRH == True:
+                append_fRH_netCDF(fRHdir, f_RH_MURK_new, site_ins, ceil_lambda_nm_str, new_time)
 
-        # soot is always the same (fixed at 1)
-        interp_f_RH_i['Soot'] = np.repeat(1.0, 101)
-        f_RH['CBLK'][array_idx, :] = interp_f_RH_i['Soot']
-
-        # boost RH resolution (soot already boosted)
-        for species_i, chem_i in aer_particles_chem.iteritems():
-            f = interp1d(RH, f_RH_i[species_i], kind='linear')
-            interp_f_RH_i[species_i] = f(RH_int)
-            f_RH[chem_i][array_idx, :] = interp_f_RH_i[species_i]
+            f_RH['MURK'] = np.concatenate((f_RH['MURK'], f_RH_MURK_new), axis=0)
+            fRH_time = fRH_time + new_time
 
-        # make f(RH) for murk from the interpolated f(RH)
-        for t_idx, t in enumerate(pm10_time):
-            f_RH['MURK'][t_idx, array_idx, :] = \
-                (interp_f_RH_i['Ammonium Sulphate'] * pm10_rel_vol['(NH4)2SO4'][t_idx]) + \
-                (interp_f_RH_i['Ammonium nitrate'] * pm10_rel_vol['NH4NO3'][t_idx]) + \
-                (interp_f_RH_i['Aged fossil-fuel OC'] * pm10_rel_vol['CORG'][t_idx]) + \
-                (interp_f_RH_i['Soot'] * pm10_rel_vol['CBLK'][t_idx]) + \
-                (interp_f_RH_i['Generic NaCl'] * pm10_rel_vol['NaCl'][t_idx])
+        # keep the days in the relative volume input, as when the file is recreated
+        fRH_time_idx = {t: t_idx for t_idx, t in enumerate(fRH_time)}
+        f_RH['MURK'] = f_RH['MURK'][[fRH_time_idx[t] for t in day_time], :, :]
+        fRH_time = day_time
 
+    else:
+        # f(RH) for each species [radius, RH] and MURK [day, radius, RH]
+        file_paths = [radius_file_path(specdir, radius_nm_i) for radius_nm_i in size_extract_nm]
+        f_RH, fRH_time = clim.create_f_RH(file_paths, pm10_rel_vol, pm10_time, aer_index, aer_order,
+                                          aer_particles_chem, aer_particles, RH_int, product='daily', band=band,
+                                          Q_type=Q_type, cachedir=cachedir, n_workers=n_workers)
 
-    # save f(RH) once all radii have been looped through
-    if saveFRH == True:
+        # save f(RH) once all radii have been looped through
+        if saveFRH == True:
 
-        save_fRH_netCDF(fRHdir, f_RH, size_extract_nm, RH_int, site_ins, ceil_lambda_nm_str, pm10_time, timeRes='daily')
+            save_fRH_netCDF(fRHdir, f_RH, size_extract_nm, RH_int, site_ins, ceil_lambda_nm_str, fRH_time, timeRes='daily',
+                            zlib=compressFRH, float32=float32FRH)
 
 
     # ---------------------------------------------------
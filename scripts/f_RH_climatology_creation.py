@@ -0,0 +1,334 @@
+"""
+Create monthly, daily and/or hourly climatologies of f(RH) in a single run, for use in calculating the extinction
+efficiency (Q). The species f(RH) curves are read from the spectral files and interpolated once, then each MURK
+product is made from them by averaging the relative volumes of the species over its own time periods.
+
+Each product reads its own relative volume pickle (see load_rel_vol()), so the monthly product uses the monthly
+<site>_aerosol_relative_volume.pickle, as monthly_f_RH_creation.py always has, not an average of the daily one.
+
+monthly_f_RH_creation.py, daily_f_RH_creation.py and monthly_f_RH_creation_wrt_stdev.py all make their f(RH)
+through create_f_RH() here.
+
+Based on monthly_f_RH_creation.py and daily_f_RH_creation.py
+"""
+
+import numpy as np
+import pickle
+import datetime as dt
+
+import daily_f_RH_creation as daily
+import monthly_f_RH_creation as monthly
+
+# Time aggregation
+#   each of these turns a time into the key of the period it belongs to. Any function like these can be used.
+
+def month_key(t):
+    """Month number (1-12) of t, for a monthly climatology"""
+    return t.month
+
+def day_key(t):
+    """Start of the day t is in"""
+    return dt.datetime(t.year, t.month, t.day)
+
+def hour_key(t):
+    """Start of the hour t is in"""
+    return dt.datetime(t.year, t.month, t.day, t.hour)
+
+time_aggregations = {'monthly': month_key,
+                     'daily': day_key,
+                     'hourly': hour_key}
+
+def ceil_lambda_str(ceil_lambda):
+
+    """
+    Ceilometer wavelength as it appears in the f(RH) file names
+    :param ceil_lambda: ceilometer wavelength [m]
+    :return: ceil_lambda_nm_str: wavelength [nm] as str with nm on the end e.g. '905.0nm'
+    """
+
+    return '%.1f' % (ceil_lambda * 1e9) + 'nm'
+
+# Reading
+
+def load_rel_vol(pickleloaddir, site_short, product):
+
+    """
+    Read in the relative volume of the aerosol species for a product
+        created in VMachine "create_Qext_for_MURK_.py" and saved as a pickle
+    :param pickleloaddir: directory the pickles are in
+    :param site_short: short site name e.g. 'NK'
+    :param product: 'monthly' reads <site>_aerosol_relative_volume.pickle, anything else (e.g. 'daily') reads
+                <site>_<product>_aerosol_relative_volume.pickle
+    :return: rel_vol: relative volume of each species {chemical name: [time]}
+    :return: time: list of datetimes for rel_vol. The monthly pickle has one value per month (Jan - Dec), so these
+                are the start of each month (year 1900)
+    """
+
+    if product == 'monthly':
+        filename = pickleloaddir + site_short + '_aerosol_relative_volume.pickle'
+    else:
+        filename = pickleloaddir + site_short + '_' + product + '_aerosol_relative_volume.pickle'
+
+    with open(filename, 'rb') as handle:
+        pickle_load_in = pickle.load(handle)
+    rel_vol = pickle_load_in['pm10_rel_vol']
+
+    if product == 'monthly':
+        time = [dt.datetime(1900, month_i, 1) for month_i in range(1, 13)]
+    else:
+        time = pickle_load_in['time']
+
+    return rel_vol, time
+
+# Processing
+
+def aggregate_rel_vol(rel_vol, time, aer_particles, key_func):
+
+    """
+    Average the relative volume of each species over the time periods given by key_func. NaNs are ignored.
+    :param rel_vol: relative volume of each species {chemical name: [time]}
+    :param time: list of datetimes for rel_vol
+    :param aer_particles: chemical names of the species to average
+    :param key_func: function turning a datetime into the key of its period (e.g. month_key)
+    :return: rel_vol_agg: average relative volume of each species {chemical name: [period]}
+    :return: period_keys: sorted list of the period keys
+    """
+
+    # which period each time is in
+    keys = [key_func(t) for t in time]
+    period_keys = sorted(set(keys))
+    period_pos = dict(zip(period_keys, range(len(period_keys))))
+    period_idx = np.array([period_pos[key] for key in keys], dtype=int)
+
+    # [time, species]
+    rel_vol_matrix = np.transpose(np.array([rel_vol[chem_i] for chem_i in aer_particles], dtype=float))
+    valid = ~np.isnan(rel_vol_matrix)
+
+    # grouped sums and counts over the non-NaN values
+    sums = np.zeros((len(period_keys), len(aer_particles)))
+    counts = np.zeros((len(period_keys), len(aer_particles)))
+    np.add.at(sums, period_idx, np.where(valid, rel_vol_matrix, 0.0))
+    np.add.at(counts, period_idx, valid)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rel_vol_mean = sums / counts
+
+    rel_vol_agg = {}
+    for species_idx, chem_i in enumerate(aer_particles):
+        rel_vol_agg[chem_i] = rel_vol_mean[:, species_idx]
+
+    return rel_vol_agg, period_keys
+
+def create_f_RH_products(f_RH_species, rel_vol, time, aer_particles, products):
+
+    """
+    Create a MURK f(RH) for each product (time resolution), all from the same species f(RH) curves
+    :param f_RH_species: species f(RH) curves {chemical name: [radius, RH]}
+    :param rel_vol: relative volume of each species {chemical name: [time]}
+    :param time: list of datetimes for rel_vol
+    :param aer_particles: chemical names of the species that make up MURK
+    :param products: list of product names from time_aggregations (e.g. ['monthly', 'daily']), or a dictionary
+                {product name: key function} to use other time periods
+    :return: f_RH_products: {product name: {'MURK': [period, radius, RH], 'time': period keys}}
+    """
+
+    if type(products) == list:
+        products = {product: time_aggregations[product] for product in products}
+
+    f_RH_products = {}
+
+    for product, key_func in products.iteritems():
+
+        rel_vol_agg, period_keys = aggregate_rel_vol(rel_vol, time, aer_particles, key_func)
+
+        f_RH_products[product] = {'MURK': daily.calc_f_RH_MURK(f_RH_species, rel_vol_agg, aer_particles),
+                                  'time': period_keys}
+
+    return f_RH_products
+
+def create_f_RH_species(file_paths, aer_index, aer_order, aer_particles_chem, RH_int, band=1, Q_type='extinction',
+                        cachedir=None, n_workers=1):
+
+    """
+    Read the spectral files and create the interpolated f(RH) curves of each species, for every file
+    :param file_paths: spectral files, one for each radius (or geometric standard deviation etc.)
+    :return: f_RH_species: species f(RH) curves {chemical name: [file, RH]}
+    (see daily_f_RH_creation.create_f_RH_all_files() for the other params)
+    """
+
+    interp_f_RH = daily.create_f_RH_all_files(file_paths, aer_index, aer_order, aer_particles_chem, RH_int,
+                                              band=band, Q_type=Q_type, cachedir=cachedir, n_workers=n_workers)
+
+    # [file, RH] for each species
+    f_RH_species = {}
+    for species_i, chem_i in aer_particles_chem.iteritems():
+        f_RH_species[chem_i] = np.array([interp_f_RH_i[species_i] for interp_f_RH_i in interp_f_RH])
+
+    return f_RH_species
+
+def f_RH_product_dict(f_RH_species, f_RH_product, product):
+
+    """
+    Put the species and MURK f(RH) of a product into one dictionary, laid out as the monthly and daily files are
+    :param f_RH_species: species f(RH) curves {chemical name: [radius, RH]}
+    :param f_RH_product: a single product from create_f_RH_products()
+    :param product: product name
+    :return: f_RH: MURK [period, radius, RH] AND species [radius, RH]. Monthly MURK always has all 12 months, with any
+                missing months left as NaN
+    """
+
+    f_RH = dict(f_RH_species)
+
+    if product == 'monthly':
+        f_RH['MURK'] = np.empty((12,) + f_RH_product['MURK'].shape[1:])
+        f_RH['MURK'][:] = np.nan
+        for month_idx, month_i in enumerate(f_RH_product['time']):
+            f_RH['MURK'][month_i - 1, :, :] = f_RH_product['MURK'][month_idx, :, :]
+    else:
+        f_RH['MURK'] = f_RH_product['MURK']
+
+    return f_RH
+
+def create_f_RH(file_paths, rel_vol, time, aer_index, aer_order, aer_particles_chem, aer_particles, RH_int,
+                product='monthly', band=1, Q_type='extinction', cachedir=None, n_workers=1):
+
+    """
+    Create the species and MURK f(RH) for a single product, straight from the spectral files
+    :param file_paths: spectral files, one for each radius (or geometric standard deviation etc.)
+    :param rel_vol: relative volume of each species {chemical name: [time]} (see load_rel_vol())
+    :param time: list of datetimes for rel_vol
+    :param aer_particles: chemical names of the species that make up MURK
+    :param product: product name from time_aggregations
+    :return: f_RH: MURK [period, file, RH] AND species [file, RH] (see f_RH_product_dict())
+    :return: f_RH_time: period keys for the MURK time dimension
+    (see create_f_RH_species() for the other params)
+    """
+
+    f_RH_species = create_f_RH_species(file_paths, aer_index, aer_order, aer_particles_chem, RH_int, band=band,
+                                       Q_type=Q_type, cachedir=cachedir, n_workers=n_workers)
+
+    f_RH_product = create_f_RH_products(f_RH_species, rel_vol, time, aer_particles, [product])[product]
+
+    return f_RH_product_dict(f_RH_species, f_RH_product, product), f_RH_product['time']
+
+# Saving
+
+def save_f_RH_products(fRHdir, f_RH_species, f_RH_products, radii_range_nm, RH_int, site_ins, ceil_lambda_nm_str,
+                       zlib=False, float32=False):
+
+    """
+    Save each f(RH) product in the same format as the monthly and daily scripts would
+    :param fRHdir: directory to save the netCDF files to
+    :param f_RH_species: species f(RH) curves {chemical name: [radius, RH]}
+    :param f_RH_products: from create_f_RH_products()
+    :param radii_range_nm: radii sizes used to make f(RH) [nm]
+    :param RH_int: interpolated RH values [fraction]
+    :param site_ins: site information
+    :param ceil_lambda_nm_str: ceilometer wavelength as str with nm on the end e.g. '905.0nm' (see ceil_lambda_str())
+    :param zlib: compress the f(RH) variables
+    :param float32: store the f(RH) variables as float32 instead of float64
+    :return:
+    """
+
+    for product, f_RH_product in f_RH_products.iteritems():
+
+        f_RH = f_RH_product_dict(f_RH_species, f_RH_product, product)
+
+        if product == 'monthly':
+            monthly.save_fRH_netCDF(fRHdir, f_RH, radii_range_nm, RH_int, site_ins, ceil_lambda_nm_str,
+                                    zlib=zlib, float32=float32)
+
+        elif product in ['daily', 'hourly']:
+            daily.save_fRH_netCDF(fRHdir, f_RH, radii_range_nm, RH_int, site_ins, ceil_lambda_nm_str,
+                                  f_RH_product['time'], timeRes=product, zlib=zlib, float32=float32)
+
+        else:
+            print 'No file format for ' + product + ' f(RH), not saved'
+
+    return
+
+if __name__ == '__main__':
+
+    # ------------------------------------------
+    # Setup
+    # ------------------------------------------
+    # site information
+    site_ins = {'site_short': 'NK', 'site_long': 'North Kensington',
+                'ceil_lambda': 0.905e-06, 'land-type': 'urban', 'geo_stdev': '1.6'}
+    # site_ins = {'site_short':'Ch', 'site_long': 'Chilbolton',
+    #             'ceil_lambda': 0.905e-06, 'land-type': 'rural', 'geo_stdev': '1.6'}
+    # site_ins = {'site_short':'Ha', 'site_long': 'Harwell',
+    #             'ceil_lambda': 0.905e-06, 'land-type': 'rural', 'geo_stdev': '1.6'}
+
+    ceil_lambda_nm_str = ceil_lambda_str(site_ins['ceil_lambda'])
+
+    # User set args
+    # band that read_spec_bands() uses to find the correct band
+    #! Manually set
+    band = 1
+
+    # products to make, all from the same species f(RH) curves (see time_aggregations)
+    #   each needs its own relative volume pickle in pickleloaddir (see load_rel_vol())
+    products = ['monthly', 'daily']
+
+    # saveF(RH)?
+    saveFRH = True
+
+    # f(RH) file storage: zlib compress? store as float32 instead of float64?
+    compressFRH = True
+    float32FRH = False
+
+    # number of processes to spread the radii across (1 = serial)
+    n_workers = 1
+
+    # -------------------------
+
+    # directories
+    fRHdir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/f(RH)/'
+    specdir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/' \
+              'sp_885-925_r_files/'
+    pickleloaddir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/pickle/'
+    # parsed spectral files are cached here (as .npy) to save re-reading the ASCII on later runs. None = no caching
+    cachedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/cache/'
+
+    # variables to take from file (as listed within the file) with index from BLOCK = 0
+    # NOTE: data MUST be in ascending index order
+    aer_index = {'Ammonium Sulphate': 1, 'Generic NaCl': 2, 'Biogenic': 3, 'Aged fossil-fuel OC': 4,
+                 'Ammonium nitrate': 5}
+    aer_order = ['Ammonium Sulphate', 'Generic NaCl', 'Aged fossil-fuel OC', 'Ammonium nitrate']
+
+    aer_particles_chem = {'Ammonium Sulphate': '(NH4)2SO4', 'Generic NaCl': 'NaCl', 'Aged fossil-fuel OC': 'CORG',
+                          'Ammonium nitrate': 'NH4NO3', 'Soot': 'CBLK'}
+
+    aer_particles = ['(NH4)2SO4', 'NH4NO3', 'NaCl', 'CORG', 'CBLK']
+
+    # Q type to use in calculating f(RH)
+    Q_type = 'extinction'
+    print 'Q_type = ' + Q_type
+
+    # range of radii to iterate over
+    radii_range_nm = np.arange(5, 3685 + 5, 5)
+
+    # RH to interpolate to
+    RH_int = np.arange(0, 1.01, 0.01)
+
+    # ---------------------------------------------------
+    # Read, Process and save f(RH)
+    # ---------------------------------------------------
+
+    # species f(RH) curves, read and interpolated once for all the products
+    file_paths = [daily.radius_file_path(specdir, radius_nm_i, site_ins['geo_stdev']) for radius_nm_i in radii_range_nm]
+    f_RH_species = create_f_RH_species(file_paths, aer_index, aer_order, aer_particles_chem, RH_int, band=band,
+                                       Q_type=Q_type, cachedir=cachedir, n_workers=n_workers)
+
+    # MURK f(RH) for each product, each from its own relative volume pickle
+    f_RH_products = {}
+    for product in products:
+        pm10_rel_vol, pm10_time = load_rel_vol(pickleloaddir, site_ins['site_short'], product)
+        f_RH_products.update(create_f_RH_products(f_RH_species, pm10_rel_vol, pm10_time, aer_particles, [product]))
+
+    if saveFRH == True:
+        save_f_RH_products(fRHdir, f_RH_species, f_RH_products, radii_range_nm, RH_int, site_ins,
+                           ceil_lambda_nm_str, zlib=compressFRH, float32=float32FRH)
+
+    print 'END PROGRAM'
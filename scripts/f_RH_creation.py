@@ -5,12 +5,18 @@ Created by Elliott 06/02/2017
 """
 
 import numpy as np
+import os
+import glob
+import hashlib
+import pickle
 from scipy.optimize import curve_fit
 from scipy import interpolate
 from scipy.interpolate import interp1d
 import matplotlib.pyplot as plt
 import matplotlib
 
+from cache_io import write_cache_file
+
 def read_spec_bands(file_path):
 
     """
@@ -61,7 +67,7 @@ def read_spec_bands(file_path):
 
     return spec_bands
 
-def read_aer_data(file_path, aer_index, aer_order, band=4):
+def read_aer_data(file_path, aer_index, aer_order, band=4, spec_index=None):
 
     """
     Read in the aerosol data, calculate the Qs
@@ -70,71 +76,468 @@ def read_aer_data(file_path, aer_index, aer_order, band=4):
     :param aer_index:
     :param aer_order:
     :param band
+    :param spec_index: (optional) byte offset index from load_spec_index(), to seek straight to the band
     :return:
     """
 
     print "Reading from:" + file_path
     print "Band: " + str(band)
 
-    # define arrays
+    # read all the species in a single pass of the file
+    aer_data, _ = read_aer_data_all(file_path, aer_index, aer_order, bands=[band], spec_index=spec_index)
+
+    # split back out into a dictionary, one [RH, column] array per species
     data = {}
+    for aer_idx, aer in enumerate(aer_order):
+        data[aer] = aer_data[aer_idx, 0, :, :]
+
+    return data
+
+def read_aer_data_all(file_path, aer_index, aer_order, bands=None, spec_index=None):
+
+    """
+    Read in the aerosol data for all species and bands, in a single pass of the UM spectral file
+
+    :param file_path:
+    :param aer_index: species index within the file {species: index}
+    :param aer_order: species to extract, and their order along the 1st dimension of aer_data
+    :param bands: bands to extract, and their order along the 2nd dimension of aer_data. If None, take all
+                    bands found in the file
+    :param spec_index: (optional) byte offset index from load_spec_index(). If given, seek straight to each
+                    (species, band) table instead of scanning the file from the top.
+    :return: aer_data: [species, band, RH, column] array. Columns are as in the file (RH, absorption, scattering, ...)
+    :return: bands: band numbers for the 2nd dimension of aer_data
+    """
 
+    if spec_index is not None:
+        return read_aer_data_indexed(file_path, spec_index, aer_index, aer_order, bands=bands)
+
+    # header lines for each of the wanted species, with duplicate, trailing and leading spaces removed
+    species_headers = {}
     for aer in aer_order:
+        species_headers['Index of species = ' + str(aer_index[aer]) + ' ' + aer] = aer
 
+    # data lines for each (species, band) table
+    tables = {}
 
-        print 'Getting ...' + aer
+    in_block = False
+    aer = None
+    rows = None
+    skip = 0
 
-        data[aer] = []
+    file = open(file_path, "r")
 
-        file = open(file_path, "r")
+    for line in file:
 
-        line = file.readline()  # read the first actual line
         line = line.rstrip('\n\r')
 
-        while line != '*BLOCK: TYPE =   11: SUBTYPE =    1: VERSION =    2':
-            line = file.readline()
-            line = line.rstrip('\n\r')
+        # skip until the aerosol block is reached
+        if not in_block:
+            if line == '*BLOCK: TYPE =   11: SUBTYPE =    1: VERSION =    2':
+                in_block = True
+            continue
 
-        # while line != 'Index of species = 6 Accum. Sulphate':
-        while line != 'Index of species = ' + str(aer_index[aer]) + ' ' + aer:
-            line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
+        line = ' '.join(line.split()) # remove duplicate, trailing and leading spaces
+
+        # end of the aerosol block
+        if line == '*END':
+            break
+
+        # new species (aer = None if it is not one that is wanted)
+        elif line.startswith('Index of species = '):
+            aer = species_headers.get(line)
+            rows = None
+
+        # new band table for the current species
+        elif line.startswith('Band = '):
+            band_i = int(line.split(' ')[-1])
+            if (aer is not None) & ((bands is None) or (band_i in bands)):
+                rows = tables.setdefault((aer, band_i), [])
+                skip = 2 # skip the two header lines
+            else:
+                rows = None
+
+        # data line for a wanted table
+        elif (rows is not None) & (line != ''):
+            if skip > 0:
+                skip -= 1
+            else:
+                rows += [line.split(' ')]
+
+    file.close()
+
+    # set the band order if not given
+    if bands is None:
+        bands = sorted(set([band_i for (_, band_i) in tables.keys()]))
+
+    return stack_aer_tables(tables, file_path, aer_order, bands)
+
+def read_aer_data_indexed(file_path, spec_index, aer_index, aer_order, bands=None):
+
+    """
+    Read in the aerosol data for the given species and bands, seeking straight to each table using
+    the byte offsets in spec_index
+
+    :param file_path:
+    :param spec_index: byte offset index from load_spec_index()
+    :param aer_index: species index within the file {species: index}
+    :param aer_order: species to extract, and their order along the 1st dimension of aer_data
+    :param bands: bands to extract. If None, take all bands in the index
+    :return: aer_data: [species, band, RH, column] array
+    :return: bands: band numbers for the 2nd dimension of aer_data
+    """
+
+    # set the band order if not given
+    if bands is None:
+        bands = sorted(set([band_i for (_, band_i) in spec_index['bands'].keys()]))
+
+    tables = {}
+
+    # binary mode so the offsets are exact bytes
+    file = open(file_path, "rb")
+
+    for aer in aer_order:
+
+        # make sure the species index agrees with the one in the file
+        if (aer not in spec_index['species']) or (spec_index['species'][aer]['index'] != aer_index[aer]):
+            raise ValueError('Index of species = ' + str(aer_index[aer]) + ' ' + aer + ' not found in ' + file_path)
+
+        for band_i in bands:
+
+            if (aer, band_i) not in spec_index['bands']:
+                continue
+
+            # go to the 'Band = k' line and skip it
+            file.seek(spec_index['bands'][(aer, band_i)])
+            file.readline()
+
+            rows = []
+            skip = 2 # skip the two header lines, as in read_aer_data_all()
 
-        while line != 'Band = ' + str(band):
             line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
 
+            # read until the next band, species, end of block or end of file
+            while line != '':
 
-        # skip two lines
-        line = file.readline()
-        line = file.readline()
+                line = ' '.join(line.split()) # remove duplicate, trailing and leading spaces
+
+                if line.startswith('Band = ') | line.startswith('Index of species = ') | line.startswith('*'):
+                    break
+                elif line != '':
+                    if skip > 0:
+                        skip -= 1
+                    else:
+                        rows += [line.split(' ')]
+
+                line = file.readline()
 
-        # read first line of data
+            tables[(aer, band_i)] = rows
+
+    file.close()
+
+    return stack_aer_tables(tables, file_path, aer_order, bands)
+
+def stack_aer_tables(tables, file_path, aer_order, bands):
+
+    """
+    Stack the (species, band) tables of data lines into a single array
+
+    :param tables: {(species, band): [data lines split into columns]}
+    :param file_path: spectral file the tables came from (for error messages)
+    :param aer_order: order of species for the 1st dimension
+    :param bands: order of bands for the 2nd dimension
+    :return: aer_data: [species, band, RH, column] array
+    :return: bands: band numbers for the 2nd dimension of aer_data
+    """
+
+    # check everything was found
+    for aer in aer_order:
+        for band_i in bands:
+            if (aer, band_i) not in tables:
+                raise ValueError('Species ' + aer + ', band ' + str(band_i) + ' not found in ' + file_path)
+
+    # convert to numpy array, tables all have the same RH values so stack into [species, band, RH, column]
+    aer_data = np.array([[tables[(aer, band_i)] for band_i in bands] for aer in aer_order], dtype=float)
+
+    return aer_data, np.array(bands)
+
+def build_spec_index(file_path):
+
+    """
+    Scan a UM spectral file once and record the byte offsets of the aerosol block (*BLOCK: TYPE = 11),
+    each 'Index of species = N <name>' header and each 'Band = k' header within it.
+
+    :param file_path:
+    :return: spec_index: {'block': offset,
+                          'species': {name: {'index': N, 'offset': offset}},
+                          'bands': {(name, band): offset},
+                          'size': file size [bytes], 'mtime': file modification time}
+    """
+
+    spec_index = {'block': None,
+                  'species': {},
+                  'bands': {},
+                  'size': os.path.getsize(file_path),
+                  'mtime': os.path.getmtime(file_path)}
+
+    aer = None
+
+    # binary mode so the offsets are exact bytes
+    file = open(file_path, "rb")
+
+    offset = 0
+    line = file.readline()
+
+    while line != '':
+
+        line_clean = ' '.join(line.split()) # remove duplicate, trailing and leading spaces
+
+        if spec_index['block'] is None:
+            # skip until the aerosol block is reached
+            if line.rstrip('\n\r') == '*BLOCK: TYPE =   11: SUBTYPE =    1: VERSION =    2':
+                spec_index['block'] = offset
+
+        elif line_clean == '*END':
+            break
+
+        elif line_clean.startswith('Index of species = '):
+            # 'Index of species = N <name>'
+            line_split = line_clean.split(' ', 5)
+            aer = line_split[5]
+            spec_index['species'][aer] = {'index': int(line_split[4]), 'offset': offset}
+
+        elif line_clean.startswith('Band = ') & (aer is not None):
+            spec_index['bands'][(aer, int(line_clean.split(' ')[-1]))] = offset
+
+        offset += len(line)
         line = file.readline()
-        line = line.rstrip('\n\r')
 
-        # when reached the data line...
-        while (line != 'Band = ' + str(band + 1)) & (line != '*END'):
+    file.close()
+
+    if spec_index['block'] is None:
+        raise ValueError('No aerosol block (*BLOCK: TYPE = 11) found in ' + file_path)
 
-            line = ' '.join(line.split()) # remove duplicate, trailing and leading spaces
-            line_split = line.split(' ')
+    return spec_index
 
-            # extract data
-            data[aer] += [line_split]
+def load_spec_index(file_path, rebuild=False):
 
-            line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
+    """
+    Load the byte offset index for a UM spectral file from its sidecar file ([file_path].index.pickle).
+    The index is (re)built and saved if the sidecar is missing, out of date with the spectral file, or if
+    rebuild=True.
+
+    :param file_path:
+    :param rebuild: force the index to be rebuilt
+    :return: spec_index: see build_spec_index()
+    """
 
-        file.close()
+    index_path = file_path + '.index.pickle'
 
-        # convert to numpy array, list already alligned correctly for np.array()
-        data[aer] = np.array(data[aer], dtype=float)
+    if (not rebuild) & os.path.exists(index_path):
+        with open(index_path, 'rb') as handle:
+            spec_index = pickle.load(handle)
 
+        # only use it if the spectral file has not changed since the index was made
+        if (spec_index['size'] == os.path.getsize(file_path)) & \
+                (spec_index['mtime'] == os.path.getmtime(file_path)):
+            return spec_index
 
-    return data
+    spec_index = build_spec_index(file_path)
+
+    with open(index_path, 'wb') as handle:
+        pickle.dump(spec_index, handle, protocol=2)
+
+    return spec_index
+
+# md5 of the spectral files already hashed this run {file path: (size, mtime, md5)}
+spec_file_hashes = {}
+
+def spec_file_md5(file_path, cache_dir=None):
+
+    """
+    md5 of the contents of a spectral file. The file is only hashed again if its size or modification time have
+    changed since it was last hashed, in this run or (if cache_dir is given) a previous one.
+
+    :param file_path:
+    :param cache_dir: (optional) directory to keep the hash in, as [file name]__[size]__[mtime].md5
+    :return: md5: hex digest
+    """
+
+    size = os.path.getsize(file_path)
+    mtime = os.path.getmtime(file_path)
+
+    if file_path in spec_file_hashes:
+        if spec_file_hashes[file_path][0:2] == (size, mtime):
+            return spec_file_hashes[file_path][2]
+
+    if cache_dir is not None:
+        hash_path = os.path.join(cache_dir, os.path.basename(file_path) + '__' + str(size) + '__' +
+                                 '%.0f' % mtime + '.md5')
+        if os.path.exists(hash_path):
+            with open(hash_path, 'r') as handle:
+                md5_hex = handle.read().strip()
+            spec_file_hashes[file_path] = (size, mtime, md5_hex)
+            return md5_hex
+
+    # hash the contents in chunks
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as file:
+        chunk = file.read(1048576)
+        while chunk:
+            md5.update(chunk)
+            chunk = file.read(1048576)
+    md5_hex = md5.hexdigest()
+
+    spec_file_hashes[file_path] = (size, mtime, md5_hex)
+
+    if cache_dir is not None:
+        write_cache_file(hash_path, lambda handle: handle.write(md5_hex))
+
+    return md5_hex
+
+def spec_cache_key(file_path, extra='', cache_dir=None):
+
+    """
+    Create the cache key for a spectral file, from its name, the hash of its contents and its modification time.
+    The contents are only hashed when the file's size or modification time have changed (see spec_file_md5()).
+
+    :param file_path:
+    :param extra: (optional) anything else the cached data depends on (e.g. species and bands read)
+    :param cache_dir: (optional) directory the file hashes are kept in
+    :return: key: [file name]__[md5 of contents]__[mtime]__[md5 of extra]
+    """
+
+    key = os.path.basename(file_path) + '__' + spec_file_md5(file_path, cache_dir) + '__' + \
+          '%.0f' % os.path.getmtime(file_path) + '__' + hashlib.md5(extra).hexdigest()[0:8]
+
+    return key
+
+def read_spec_bands_cached(file_path, cache_dir=None, max_cache_size=None):
+
+    """
+    read_spec_bands(), but with the result kept in cache_dir as a .npz file so the ASCII only gets parsed once
+
+    :param file_path:
+    :param cache_dir: directory for the cache. If None, no caching is done
+    :param max_cache_size: (optional) [bytes] evict old entries to keep the cache below this size
+    :return: spec_bands: as read_spec_bands()
+    """
+
+    if cache_dir is None:
+        return read_spec_bands(file_path)
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    cache_path = os.path.join(cache_dir, spec_cache_key(file_path, 'spec_bands', cache_dir) + '_spec_bands.npz')
+
+    if os.path.exists(cache_path):
+        os.utime(cache_path, None) # mark as recently used, for eviction
+        cache = np.load(cache_path)
+        spec_bands = {key: cache[key] for key in cache.files}
+        cache.close()
+
+    else:
+        spec_bands = read_spec_bands(file_path)
+        write_cache_file(cache_path, lambda handle: np.savez(handle, **spec_bands))
+
+        if max_cache_size is not None:
+            evict_spec_cache(cache_dir, max_cache_size)
+
+    return spec_bands
+
+def read_aer_data_cached(file_path, aer_index, aer_order, cache_dir=None, bands=None, max_cache_size=None):
+
+    """
+    read_aer_data_all(), but with the [species, band, RH, column] array kept in cache_dir as a .npy file.
+    Later calls memory map the array straight from the cache (read only, no copy) instead of parsing the ASCII.
+
+    :param file_path:
+    :param aer_index: species index within the file {species: index}
+    :param aer_order: species to extract, and their order along the 1st dimension of aer_data
+    :param cache_dir: directory for the cache. If None, no caching is done
+    :param bands: bands to extract. If None, take all bands found in the file
+    :param max_cache_size: (optional) [bytes] evict old entries to keep the cache below this size
+    :return: aer_data: [species, band, RH, column] array
+    :return: bands: band numbers for the 2nd dimension of aer_data
+    """
+
+    if cache_dir is None:
+        return read_aer_data_all(file_path, aer_index, aer_order, bands=bands)
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    # the cached array also depends on which species (and their indices) and bands were asked for
+    request = repr([(aer, aer_index[aer]) for aer in aer_order]) + repr(bands if bands is None else list(bands))
+    cache_path = os.path.join(cache_dir, spec_cache_key(file_path, request, cache_dir))
+
+    if os.path.exists(cache_path + '_aer_data.npy') & os.path.exists(cache_path + '_bands.npy'):
+        os.utime(cache_path + '_aer_data.npy', None) # mark as recently used, for eviction
+        os.utime(cache_path + '_bands.npy', None)
+        aer_data = np.load(cache_path + '_aer_data.npy', mmap_mode='r')
+        bands = np.load(cache_path + '_bands.npy')
+
+    else:
+        aer_data, bands = read_aer_data_all(file_path, aer_index, aer_order, bands=bands)
+
+        for var, name in [(aer_data, '_aer_data'), (bands, '_bands')]:
+            write_cache_file(cache_path + name + '.npy', lambda handle, var=var: np.save(handle, var))
+
+        if max_cache_size is not None:
+            evict_spec_cache(cache_dir, max_cache_size)
+
+    return aer_data, bands
+
+def evict_spec_cache(cache_dir, max_cache_size):
+
+    """
+    Remove the least recently used files from the spectral cache until it is below max_cache_size
+
+    :param cache_dir:
+    :param max_cache_size: [bytes]
+    :return: removed: list of files removed
+    """
+
+    # cached files, least recently used first
+    cache_files = glob.glob(os.path.join(cache_dir, '*__*.np[yz]'))
+    cache_files.sort(key=os.path.getmtime)
+
+    total_size = np.sum([os.path.getsize(f) for f in cache_files])
+
+    removed = []
+    for f in cache_files:
+        if total_size <= max_cache_size:
+            break
+        total_size -= os.path.getsize(f)
+        os.remove(f)
+        removed += [f]
+
+    return removed
+
+def clear_spec_cache(cache_dir, file_path=None):
+
+    """
+    Invalidate the spectral cache, either for a single spectral file (all versions of it), or everything
+
+    :param cache_dir:
+    :param file_path: (optional) spectral file to remove the cached data of. If None, clear the whole cache
+    :return: removed: list of files removed
+    """
+
+    # cached data and the file hashes kept alongside it
+    if file_path is None:
+        cache_files = glob.glob(os.path.join(cache_dir, '*__*.np[yz]')) + glob.glob(os.path.join(cache_dir, '*__*.md5'))
+        spec_file_hashes.clear()
+    else:
+        cache_files = glob.glob(os.path.join(cache_dir, os.path.basename(file_path) + '__*.np[yz]')) + \
+                      glob.glob(os.path.join(cache_dir, os.path.basename(file_path) + '__*.md5'))
+        spec_file_hashes.pop(file_path, None)
+
+    for f in cache_files:
+        os.remove(f)
+
+    return cache_files
 
 def calc_f_RH(data, aer_order, Q_type=''):
 
@@ -171,6 +574,35 @@ def calc_f_RH(data, aer_order, Q_type=''):
 
     return Q, f_RH
 
+def calc_f_RH_all(aer_data, Q_type=''):
+
+    """
+    Calculate f(RH) for the Q type, for all species and bands from read_aer_data_all() at once
+    :param aer_data: [species, band, RH, column] array
+    :param Q_type:
+    :return: Q: [species, band, RH]
+    :return: f_RH: [species, band, RH]
+    """
+
+    if Q_type == 'extinction':
+        # calculate total extinction (abs + scatt)
+        Q = aer_data[..., 1] + aer_data[..., 2]
+
+    elif Q_type == 'scattering':
+        # extract scattering
+        Q = np.array(aer_data[..., 2])
+
+    elif Q_type == 'absorption':
+        # extract absorption
+        Q = np.array(aer_data[..., 1])
+    else:
+        raise ValueError("Incorrect Q_type value. Needs to be either 'extinction', 'absorption', or 'scattering'")
+
+    # calculate f(RH) = Q(RH>=0)/Q(RH=0)
+    f_RH = Q / Q[..., 0:1]
+
+    return Q, f_RH
+
 if __name__ == '__main__':
 
     # User set args
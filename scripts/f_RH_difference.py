@@ -70,49 +70,44 @@ def create_f_RH(file_paths, band, aer_index, aer_order, Q_type):
 
     return f_RH, band_lam_range, RH
 
-def calc_r_RH_difference(f_RH, f_RH_main, main_band_range):
+def calc_r_RH_difference(f_RH, f_RH_main, main_band_range=None):
 
     """
     Calculate the difference in f(RH) between the various wavelengths (f_RH) and the reference (f_RH_main)
 
-    :param f_RH:
-    :param f_RH_main:
-    :param main_band_range:
-    :return:
+    :param f_RH: [band, species, RH] array, or {lam_range: {aerosol: f(RH)}}
+    :param f_RH_main: [species, RH] array for the reference band, or {main_band_range: {aerosol: f(RH)}}
+    :param main_band_range: key of the reference in f_RH_main, if it is a dictionary
+    :return: f_RH_diff: same form as f_RH
     """
 
-    f_RH_diff = {}
-
-    for lam_range, all_aerosol in f_RH.iteritems():
-
-        f_RH_diff[lam_range] = {}
-
-        for aerosol_key, aerosol_data in all_aerosol.iteritems():
+    if type(f_RH) == dict:
+        return {lam_range: {aerosol_key: np.array(aerosol_data) - np.array(f_RH_main[main_band_range][aerosol_key])
+                            for aerosol_key, aerosol_data in all_aerosol.iteritems()}
+                for lam_range, all_aerosol in f_RH.iteritems()}
 
-            f_RH_diff[lam_range][aerosol_key] = np.array(aerosol_data) - np.array(f_RH_main[main_band_range][aerosol_key])
+    # broadcast the reference across all the bands
+    f_RH_diff = np.asarray(f_RH) - np.asarray(f_RH_main)[np.newaxis, ...]
 
     return f_RH_diff
 
-def calc_r_RH_ratio(f_RH, f_RH_main, main_band_range):
+def calc_r_RH_ratio(f_RH, f_RH_main, main_band_range=None):
     """
     Calculate the ratio of f(RH) between the various wavelengths (f_RH) and the reference (f_RH_main)
 
-    :param f_RH:
-    :param f_RH_main:
-    :param main_band_range:
-    :return:
+    :param f_RH: [band, species, RH] array, or {lam_range: {aerosol: f(RH)}}
+    :param f_RH_main: [species, RH] array for the reference band, or {main_band_range: {aerosol: f(RH)}}
+    :param main_band_range: key of the reference in f_RH_main, if it is a dictionary
+    :return: f_RH_ratio: same form as f_RH
     """
 
-    f_RH_ratio = {}
-
-    for lam_range, all_aerosol in f_RH.iteritems():
-
-        f_RH_ratio[lam_range] = {}
-
-        for aerosol_key, aerosol_data in all_aerosol.iteritems():
+    if type(f_RH) == dict:
+        return {lam_range: {aerosol_key: np.array(aerosol_data) / np.array(f_RH_main[main_band_range][aerosol_key])
+                            for aerosol_key, aerosol_data in all_aerosol.iteritems()}
+                for lam_range, all_aerosol in f_RH.iteritems()}
 
-            f_RH_ratio[lam_range][aerosol_key] = np.array(aerosol_data) / np.array(
-                f_RH_main[main_band_range][aerosol_key])
+    # broadcast the reference across all the bands
+    f_RH_ratio = np.asarray(f_RH) / np.asarray(f_RH_main)[np.newaxis, ...]
 
     return f_RH_ratio
 
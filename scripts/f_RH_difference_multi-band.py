@@ -17,58 +17,56 @@ import matplotlib.pyplot as plt
 from matplotlib.ticker import FormatStrFormatter
 from matplotlib import cm
 
-from f_RH_difference import create_f_RH, calc_f_RH, calc_r_RH_difference, calc_r_RH_ratio
-from f_RH_creation import read_spec_bands, read_aer_data
+from f_RH_difference import calc_r_RH_difference, calc_r_RH_ratio
+from f_RH_creation import read_spec_bands, read_aer_data_all, load_spec_index, calc_f_RH_all
 
 
 def create_f_RH_multi_band(file_path, bands, aer_index, aer_order, Q_type):
 
     """
-    Read in data and create the f_RH data for each aerosol, as well as an average.
+    Read in data and create the f_RH data for each aerosol, as well as MURK, for all the bands from a single read
+    of the file.
 
-    :param f_RH_file:
-    :param band:
+    :param file_path:
+    :param bands: band numbers to use
     :param aer_index:
     :param aer_order:
-    :return:
+    :param Q_type:
+    :return: f_RH: [band, species, RH] array. Species are aer_order + ['MURK']
+    :return: band_order: wavelength range of each band, e.g. '905-906nm'
+    :return: RH: [%]
 
     Designed to only do this for one file at a time, in order to split the main file from the others.
     """
 
-    f_RH = {}
-    band_order = []
-
-    for band_i in bands:
+    # MURK mixture of the species
+    murk_weights = {'Accum. Sulphate': 0.295, 'Aged fossil-fuel OC': 0.38, 'Ammonium nitrate': 0.325}
 
-        # read in the spectral band information
-        spec_bands = read_spec_bands(file_path)
+    # read in the spectral band information
+    spec_bands = read_spec_bands(file_path)
 
-        # wavelength range in current band
-        band_idx = np.where(spec_bands['band'] == band_i)[0][0]
-        band_lam_range = '%.0f' % (spec_bands['lower_limit'][band_idx] * 1.0e9) + '-' + \
-                         '%.0f' % (spec_bands['upper_limit'][band_idx] * 1.0e9) + 'nm'
+    # wavelength range of each band
+    band_pos = dict(zip(spec_bands['band'], range(len(spec_bands['band']))))
+    band_order = ['%.0f' % (spec_bands['lower_limit'][band_pos[band_i]] * 1.0e9) + '-' +
+                  '%.0f' % (spec_bands['upper_limit'][band_pos[band_i]] * 1.0e9) + 'nm' for band_i in bands]
 
-        # This will be used for plotting in order, later on
-        band_order += [band_lam_range]
+    # read the aerosol data for all the bands at once: [species, band, RH, column]
+    aer_data, bands = read_aer_data_all(file_path, aer_index, aer_order, bands=list(bands),
+                                        spec_index=load_spec_index(file_path))
 
-        # read the aerosol data
-        data = read_aer_data(file_path, aer_index, aer_order, band=band_i)
+    # Extract RH for plotting (RH is the same across all aerosol types and bands)
+    # convert from [frac] to [%]
+    RH = np.array(aer_data[0, 0, :, 0]) * 100.0
 
-        # Extract RH for plotting (RH is the same across all aerosol types)
-        # convert from [frac] to [%]
-        RH = np.array(data[aer_order[0]][:, 0]) * 100.0
+    # calculate f(RH): [species, band, RH] -> [band, species, RH]
+    Q, f_RH_species = calc_f_RH_all(aer_data, Q_type=Q_type)
+    f_RH_species = np.transpose(f_RH_species, (1, 0, 2))
 
-        # calculate f(RH)
-        # define wavelength key using band_lam_range
-        Q, f_RH[band_lam_range] = calc_f_RH(data, aer_order, Q_type=Q_type)
+    # create f(RH) for MURK
+    weights = np.array([murk_weights[aer] for aer in aer_order])
+    f_RH_murk = np.einsum('s,bsr->br', weights, f_RH_species)
 
-        # # create an average f(RH)
-        # f_RH[band_lam_range]['MURK'] = np.mean(f_RH[band_lam_range].values(), axis=0)
-
-        # create f(RH) for MURK
-        f_RH[band_lam_range]['MURK'] = np.sum([0.295 * np.array(f_RH[band_lam_range]['Accum. Sulphate']),
-                                              0.38 * np.array(f_RH[band_lam_range]['Aged fossil-fuel OC']),
-                                              0.325 * np.array(f_RH[band_lam_range]['Ammonium nitrate'])], axis=0)
+    f_RH = np.concatenate((f_RH_species, f_RH_murk[:, np.newaxis, :]), axis=1)
 
     return f_RH, band_order, RH
 
@@ -86,10 +84,7 @@ def create_colours(intervals):
 
     return colours
 
-def plot_absolute(f_RH_main, f_RH, RH, savedir, aer_order, aer_names, band_order, lam_colours, Q_type):
-
-    # get wavelength of f_RH_main
-    main_lam = f_RH_main.keys()[0]
+def plot_absolute(f_RH_main, main_lam, f_RH, RH, savedir, aer_order, aer_names, band_order, lam_colours, Q_type):
 
     # plot the data on a 4 panel plot
     fig, ax = plt.subplots(2, 2, figsize=(8, 6))
@@ -99,13 +94,13 @@ def plot_absolute(f_RH_main, f_RH, RH, savedir, aer_order, aer_names, band_order
     aer_names['MURK'] = 'MURK'
 
     # plot on each subplot fully, before doing the next one
-    for ax_i, aerosol in zip(ax.flatten(), aer_plot_order):
+    for aer_idx, (ax_i, aerosol) in enumerate(zip(ax.flatten(), aer_plot_order)):
 
-        for lam_range, lam_i_colour in zip(band_order, lam_colours):
+        for band_idx, (lam_range, lam_i_colour) in enumerate(zip(band_order, lam_colours)):
 
-            ax_i.plot(RH, f_RH[lam_range][aerosol], color=lam_i_colour, linestyle='--', label=lam_range)
+            ax_i.plot(RH, f_RH[band_idx, aer_idx, :], color=lam_i_colour, linestyle='--', label=lam_range)
 
-        ax_i.plot(RH, f_RH_main[main_lam][aerosol], color='black', linestyle='--', label=main_lam)
+        ax_i.plot(RH, f_RH_main[aer_idx, :], color='black', linestyle='--', label=main_lam)
 
 
         # prettify subplot
@@ -148,12 +143,12 @@ def plot_difference(f_RH_diff, RH, savedir, aer_order, aer_names, band_order, la
     aer_names['MURK'] = 'MURK'
 
     # plot on each subplot fully, before doing the next one
-    for ax_i, aerosol in zip(ax.flatten(), aer_plot_order):
+    for aer_idx, (ax_i, aerosol) in enumerate(zip(ax.flatten(), aer_plot_order)):
 
         # plot all curves for a single aerosol, at a time
-        for lam_range, lam_i_colour in zip(band_order, lam_colours):
+        for band_idx, (lam_range, lam_i_colour) in enumerate(zip(band_order, lam_colours)):
 
-            ax_i.plot(RH, f_RH_diff[lam_range][aerosol], color=lam_i_colour, label=lam_range)
+            ax_i.plot(RH, f_RH_diff[band_idx, aer_idx, :], color=lam_i_colour, label=lam_range)
 
 
         # prettify subplot
@@ -200,12 +195,12 @@ def plot_ratio(f_RH_ratio, RH, savedir, aer_order, aer_names, band_order, Q_type
     aer_names['MURK'] = 'MURK'
 
     # plot on each subplot fully, before doing the next one
-    for ax_i, aerosol in zip(ax.flatten(), aer_plot_order):
+    for aer_idx, (ax_i, aerosol) in enumerate(zip(ax.flatten(), aer_plot_order)):
 
         # plot all curves for a single aerosol, at a time
-        for lam_range, cmap_range_i in zip(band_order, cmap_range):
+        for band_idx, (lam_range, cmap_range_i) in enumerate(zip(band_order, cmap_range)):
 
-            ax_i.plot(RH, f_RH_ratio[lam_range][aerosol], color=cmap_range_i, label=lam_range)
+            ax_i.plot(RH, f_RH_ratio[band_idx, aer_idx, :], color=cmap_range_i, label=lam_range)
 
         # prettify subplot
         ax_i.set_title(aer_names[aerosol])
@@ -273,19 +268,21 @@ if __name__ == '__main__':
     # Read and Process
     # ---------------------------------------------------
 
-    # create f(RH) for the main file
-    f_RH_main, main_band_range, RH = create_f_RH(main_path, main_file_band, aer_index, aer_order, Q_type)
+    # create f(RH) for the main file: [species, RH]
+    f_RH_main, main_band_order, RH = create_f_RH_multi_band(main_path, [main_file_band], aer_index, aer_order, Q_type)
+    f_RH_main = f_RH_main[0, :, :]
+    main_band_range = main_band_order[0]
 
-    # create f(RH) for all bands
+    # create f(RH) for all bands: [band, species, RH]
     f_RH, band_order, RH = create_f_RH_multi_band(band_path, bands, aer_index, aer_order, Q_type)
 
     # take differences [reference - main] -> +ve = reference is higher; -ve = reference is lower
     # keep separate to plotting, in order to improve code modularity
-    f_RH_diff = calc_r_RH_difference(f_RH, f_RH_main, main_band_range)
+    f_RH_diff = calc_r_RH_difference(f_RH, f_RH_main)
 
     # calculate the ratio [reference / main] -> shows impact on extinction coefficient.
     # if ref = 2x high, then ext coeff will be 2x higher.
-    f_RH_ratio = calc_r_RH_ratio(f_RH, f_RH_main, main_band_range)
+    f_RH_ratio = calc_r_RH_ratio(f_RH, f_RH_main)
 
     # ---------------------------------------------------
     # Plotting
@@ -295,12 +292,12 @@ if __name__ == '__main__':
     lam_colours = create_colours(len(band_order) - 1)
 
     # plot the absolute value of f(RH): lam_i
-    fig = plot_absolute(f_RH_main, f_RH, RH, savedir, aer_order, aer_names, band_order, lam_colours, Q_type)
+    fig = plot_absolute(f_RH_main, main_band_range, f_RH, RH, savedir, aer_order, aer_names, band_order, lam_colours, Q_type)
 
     # plot the difference in f(RH): lam_i - lam_reference
     fig = plot_difference(f_RH_diff, RH, savedir, aer_order, aer_names, band_order, lam_colours, Q_type)
 
     # plot the ratio in f(RH): lam_i / lam_reference
-    fig = plot_ratio(f_RH_ratio, RH, savedir, aer_order, aer_names, band_order, lam_colours, Q_type)
+    fig = plot_ratio(f_RH_ratio, RH, savedir, aer_order, aer_names, band_order, Q_type)
 
     print 'END PROGRAM'
@@ -15,7 +15,7 @@ import ellUtils as eu
 from forward_operator import FOUtils as FO
 from forward_operator import FOconstants as FOcon
 
-from mod_obs_stats_plot import unique_pairs
+from obs_mod_matching import unique_pairs, time_match_idx
 
 def read_ceil_obs(day, site, height, ceilDatadir):
 
@@ -78,8 +78,8 @@ def trim_obs_time(bsc_obs, mod_data):
         site_id = site.split('_')[-1]
 
         # start and end idxs
-        t_start = eu.nearest(bsc_obs[site]['time'], mod_data[site_id]['time'][0])[1]
-        t_end = eu.nearest(bsc_obs[site]['time'], mod_data[site_id]['time'][-1])[1]
+        t_start, t_end = time_match_idx(bsc_obs[site]['time'],
+                                        [mod_data[site_id]['time'][0], mod_data[site_id]['time'][-1]])[0]
 
         # time range to extract data for
         t_idx = np.arange(t_start, t_end + 1)
@@ -208,25 +208,15 @@ def main():
             # nearest heights
             obs_hc_pairs, mod_hc_pairs = nearest_heights(mod_data[site_id]['level_height'], bsc_obs[site['height']])
 
-            # store heights
-            stat_bias[dayStr]['bias'] = np.empty((bsc_obs[site]['backscatter'].shape[0],
-                                                  obs_hc_pairs.shape[0]))
+            # nearest time in mod to each obs time, for the whole forecast at once
+            t_mod_idx = time_match_idx(mod_data[site_id]['time'], bsc_obs[site]['time'])[0]
 
-            for t in np.arange(len(bsc_obs[site]['time'])):
+            # extract profiles [time, height]
+            obs_x = bsc_obs[site]['backscatter'][:, obs_hc_pairs]
+            mod_y = mod_data[site_id]['backscatter'][t_mod_idx[:, np.newaxis], mod_hc_pairs]
 
-                # find t_idx in mod that match ceil
-                # take difference for the whole profile
-                # store it... somewhere
-
-                # nearest time in mod to obs
-                t_mod_idx = eu.nearest(mod_data[site_id]['time'], bsc_obs[site]['time'][t])[1]
-
-                # extract profiles
-                obs_x = bsc_obs[site]['backscatter'][t, obs_hc_pairs]
-                mod_y = mod_data[site_id]['backscatter'][t_mod_idx, mod_hc_pairs]
-
-                # bias (log10(obs) - log10(mod))
-                stat_bias[dayStr]['bias'][t, :] = np.log10(obs_x) - np.log10(mod_y)
+            # bias (log10(obs) - log10(mod))
+            stat_bias[dayStr]['bias'] = np.log10(obs_x) - np.log10(mod_y)
 
             # store the times
             stat_bias[dayStr]['time'] = deepcopy(bsc_obs[site]['time'])
@@ -17,52 +17,9 @@ from copy import deepcopy
 import ellUtils as eu
 from forward_operator import FOUtils as FO
 from forward_operator import FOconstants as FOcon
+from obs_mod_matching import get_pairing_table, block_average_obs
 
 
-def unique_pairs(obs_idx, diff):
-
-    """
-    Find range that excludes duplicate occurances. Keeps the pair with the smallest height difference and removes
-    the rest.
-
-    :param obs_idx:
-    :param diff:
-    :return: unique_pairs_range
-
-    At this point, the two arrays are like:
-    obs_idx = [0, 0, 0, 1, 3, 5, .... 769, 769, 769]
-    mod_idx = [0, 1, 2, 3, 4, 4, .... 67,  68,  69 ]
-    By finding the unique pairs index array for obs_idx, the same array can be used
-    on the mod_idx, as they are already paired up and of equal lengths. E.g. from above
-    0-0, 0-1, ..., 3-4, 5-4 etc.
-    """
-
-    # 1. remove start duplicates
-    # -------------------------------
-    # find start idx to remove duplicate pairs
-    duplicates = np.where(obs_idx == obs_idx[0])[0]  # find duplicates
-
-    if len(duplicates) > 1:
-        lowest_diff = np.argmin(abs(diff[duplicates]))  # find which has smallest difference
-        pairs_idx_start = duplicates[lowest_diff]  # set start position for pairing at this point
-    else:
-        pairs_idx_start = 0
-
-    # 2. remove end duplicates
-    # -------------------------------
-    # find end idx to remove duplicate pairs
-    duplicates = np.where(obs_idx == obs_idx[-1])[0]  # find duplicates
-    if len(duplicates) > 1:
-        lowest_diff = np.argmin(abs(diff[duplicates]))  # find which has smallest difference
-        pairs_idx_end = duplicates[lowest_diff]  # set start position for pairing at this point
-    else:
-        pairs_idx_end = len(obs_idx)
-
-    # create range in order to extract the unique pairs
-    unique_pairs_range = np.arange(pairs_idx_start, pairs_idx_end + 1)
-
-    return unique_pairs_range
-
 def create_stats_entry(site_id, statistics={}):
 
     """
@@ -148,61 +105,6 @@ def dateList_to_datetime(dayList):
 
     return datetimeDays
 
-def nearest_heights(mod_height, obs_height, minHeight=-np.inf, maxHeight=np.inf):
-
-    """
-    Get the nearest ceilometer height gate to each model level
-
-    :param mod_height:
-    :param obs_height:
-    :return:
-
-    obs_idx = ALL nearest gate idx
-    mod_idx = idx of the model height that each obs_idx are paired to
-    """
-
-
-    a = np.array([eu.nearest(obs_height, i) for i in mod_height])
-    values = a[:, 0]
-    obs_idx = np.array(a[:, 1], dtype=int)
-    diff = a[:, 2]
-    mod_idx = np.arange(len(mod_height))  # mod_idx should be paired with obs_idx spots.
-
-    # Trim off the ends of obs_idx, as UKV and obs z0 and zmax are different, leading to the same gate matching multiple ukvs
-    # assumes no duplicates in the middle of the arrays, just at the end
-
-    # At this point, variables are like:
-    # obs_idx = [0, 0, 0, 1, 3, 5, .... 769, 769, 769]
-    # mod_idx = [0, 1, 2, 3, 4, 4, .... 67,  68,  69 ]
-    unique_pairs_range = unique_pairs(obs_idx, diff)
-
-    # ALL unique pairs
-    # Use these to plot correlations for all possible pairs, regardless of height
-    obs_unique_pairs = obs_idx[unique_pairs_range]
-    mod_unique_pairs = mod_idx[unique_pairs_range]
-    values_unique_pairs = values[unique_pairs_range]
-    diff_unique_pairs = diff[unique_pairs_range]
-
-    # ~~~~~~~~~~~~~~~~~~~~ #
-
-
-    # # hc = height cut - original using corr_max_height
-    # hc_unique_pairs_range = np.where(values_unique_pairs <= corr_max_height)[0]
-
-    # cut off below min height and above max height. If undefined, then limits set to +/- inf
-    hc_unique_pairs_range = np.logical_and(values_unique_pairs >= minHeight,
-                                           values_unique_pairs <= maxHeight)
-
-    # trim off unique pairs that are below the minimum height and above the maximum height
-    obs_hc_unique_pairs = obs_unique_pairs[hc_unique_pairs_range]
-    mod_hc_unique_pairs = mod_unique_pairs[hc_unique_pairs_range]
-    pairs_hc_unique_values = values_unique_pairs[hc_unique_pairs_range]
-    pairs_hc_unique_diff = diff_unique_pairs[hc_unique_pairs_range]
-
-
-    return obs_hc_unique_pairs, mod_hc_unique_pairs, \
-           pairs_hc_unique_values, pairs_hc_unique_diff
-
 def summary_statistics(stat_i, site_i, site_stats_i):
 
     """
@@ -504,6 +406,7 @@ if __name__ == '__main__':
     modDatadir = datadir + model_type + '/'
     rhDatadir = datadir + 'L1/'
     aerDatadir = datadir + 'LAQN/'
+    pairsDatadir = datadir + 'height_pairs/'
 
     # instruments and other settings
     # site_bsc = FOcon.site_bsc # turn on for correlations with all ceilometers
@@ -547,6 +450,11 @@ if __name__ == '__main__':
     # reduce MLH so it is safely within the BL across ALL ceilometers and not just MR? [%]
     reduce_MLH = 10.0
 
+    # match the obs to the model times by averaging all the obs within each model time window, rather than sampling
+    # the obs at the model times. Method = 'mean', 'nanmean', 'median' or 'nanmedian'.
+    obs_time_average = False
+    obs_time_average_method = 'nanmean'
+
     # define statistics dictionary
     statistics = {}
     corr = {}
@@ -586,7 +494,13 @@ if __name__ == '__main__':
         # will only read in data is the site is there!
         # ToDo Remove the time sampling part and put it into its own function further down.
         # bsc_obs = FO.read_ceil_obs(day, site_bsc, ceilDatadir, mod_data, calib=False)
-        bsc_obs = FO.read_all_ceil_BSC(day, site_bsc, ceilDatadir, timeMatch=mod_data, calib=True)
+        if obs_time_average == True:
+            # read the full time resolution obs, then average them onto the model times
+            bsc_obs = FO.read_all_ceil_BSC(day, site_bsc, ceilDatadir, calib=True)
+            bsc_obs = block_average_obs(bsc_obs, mod_data[mod_data.keys()[0]]['time'],
+                                        method=obs_time_average_method)
+        else:
+            bsc_obs = FO.read_all_ceil_BSC(day, site_bsc, ceilDatadir, timeMatch=mod_data, calib=True)
 
         # mlh_obs = FO.read_all_ceil_obs(day, site_bsc, ceilDatadir, fType= 'MLH', timeMatch=mod_data, calib=True)
         # mlh_obs = FO.read_all_ceil_obs(day, site_bsc, ceilDatadir, timeMatch=mod_data, fType='MLH')
@@ -614,9 +528,11 @@ if __name__ == '__main__':
 
                 # minHeight for all sites was chosen to be 73.0, which is just higher than IMU
                 # Maximum height for all sites are the MLHs estimated from ceilometer backscatter (Simone's algorithm).
+                # The pairs are only worked out again if the site's heights change, otherwise they are read in.
                 obs_hc_unique_pairs, mod_hc_unique_pairs, \
                 pairs_hc_unique_values, pairs_hc_unique_diff = \
-                    nearest_heights(mod_data[site_id]['level_height'], bsc_site_obs['height'], minHeight=73.0)
+                    get_pairing_table(site_id, site.split('_')[0], model_type, mod_data[site_id]['level_height'],
+                                      bsc_site_obs['height'], cache_dir=pairsDatadir, minHeight=73.0)
 
                 # create entry in the dictionary if one does not exist
                 statistics = create_stats_entry(site_id, statistics)
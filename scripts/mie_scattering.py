@@ -0,0 +1,440 @@
+"""
+Mie scattering for homogeneous spheres, vectorised over arrays of radii, refractive indices and wavelengths, and the
+creation of the aerosol optical property tables from it.
+
+The tables are written in the same formats as the ones made externally: UM style spectral files
+(sp_<lam range>_r<radius>_stdev<stdev>_num<N>, read by read_aer_data() and turned into f(RH) by calc_f_RH()) and
+the calculated_Q_ext_<lam>nm.csv files used by calc_Q_ext_wet().
+
+Mie coefficients follow BHMIE in Bohren and Huffman (1983): the logarithmic derivative D_n is found by downward
+recurrence and the Riccati-Bessel functions by upward recurrence. Each recurrence steps over the orders n once, for
+all particles at the same time. The Riccati-Bessel functions only depend on the size parameters, so they are kept in
+a small cache and reused when the same sizes come round again (e.g. species with the same growth factors).
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Riccati-Bessel cache {(x bytes, n_max): (psi, chi)}, oldest used first, and its size limit [bytes]
+riccati_bessel_cache = OrderedDict()
+riccati_bessel_cache_max_bytes = 256 * 1024 * 1024
+
+def riccati_bessel(x, n_max):
+
+    """
+    Riccati-Bessel functions psi_n(x) and chi_n(x) for n = -1 ... n_max, by upward recurrence
+
+    Results are cached on the exact x values and n_max. The least recently used are dropped once the cache is over
+    riccati_bessel_cache_max_bytes, and results bigger than that are never kept.
+
+    :param x: 1D size parameters
+    :param n_max: highest order needed
+    :return: psi: [n + 1, x] (read only)
+    :return: chi: [n + 1, x] (read only)
+    """
+
+    x = np.ascontiguousarray(x, dtype=float)
+    key = (x.tobytes(), n_max)
+
+    if key in riccati_bessel_cache:
+        # move to the end, as most recently used
+        psi, chi = riccati_bessel_cache.pop(key)
+        riccati_bessel_cache[key] = (psi, chi)
+        return psi, chi
+
+    psi = np.empty((n_max + 2, len(x)))
+    chi = np.empty((n_max + 2, len(x)))
+
+    # n = -1 and n = 0
+    psi[0] = np.cos(x)
+    psi[1] = np.sin(x)
+    chi[0] = -np.sin(x)
+    chi[1] = np.cos(x)
+
+    # chi overflows for the small particles in a chunk once n is well past their own n_stop. Those orders are not used.
+    with np.errstate(over='ignore', invalid='ignore'):
+        for n in range(1, n_max + 1):
+            psi[n + 1] = (((2.0 * n) - 1.0) / x) * psi[n] - psi[n - 1]
+            chi[n + 1] = (((2.0 * n) - 1.0) / x) * chi[n] - chi[n - 1]
+
+    # cached arrays are shared, so stop them being changed
+    psi.setflags(write=False)
+    chi.setflags(write=False)
+
+    if psi.nbytes + chi.nbytes <= riccati_bessel_cache_max_bytes:
+        riccati_bessel_cache[key] = (psi, chi)
+        while riccati_bessel_cache_size() > riccati_bessel_cache_max_bytes:
+            riccati_bessel_cache.popitem(last=False)
+
+    return psi, chi
+
+def riccati_bessel_cache_size():
+
+    """
+    Size of the Riccati-Bessel cache [bytes]
+    """
+
+    return sum([psi.nbytes + chi.nbytes for psi, chi in riccati_bessel_cache.itervalues()])
+
+def clear_riccati_bessel_cache():
+
+    """
+    Empty the Riccati-Bessel cache
+    """
+
+    riccati_bessel_cache.clear()
+
+    return
+
+def mie_coefficient_sums(x, m):
+
+    """
+    Mie efficiencies for 1D arrays of size parameter and refractive index
+
+    :param x: 1D size parameters (2 pi r / lambda)
+    :param m: 1D complex refractive indices (relative to the medium). Imaginary part >= 0 for absorption
+    :return: Q_ext, Q_sca, Q_back, g
+    """
+
+    # number of terms for each particle (Wiscombe criterion, as in BHMIE)
+    n_stop = (x + (4.0 * np.power(x, 1. / 3.)) + 2.0).astype(int)
+    n_max = n_stop.max()
+
+    y = m * x
+
+    # logarithmic derivative D_n(mx) by downward recurrence
+    n_start = int(max(n_max, np.abs(y).max())) + 15
+    D = np.zeros((n_max + 1, len(x)), dtype=complex)
+    D_n = np.zeros(len(x), dtype=complex)
+    for n in range(n_start, 0, -1):
+        D_n = (n / y) - (1.0 / (D_n + (n / y)))
+        if n - 1 <= n_max:
+            D[n - 1] = D_n
+
+    psi, chi = riccati_bessel(x, n_max)
+
+    Q_ext = np.zeros(len(x))
+    Q_sca = np.zeros(len(x))
+    back = np.zeros(len(x), dtype=complex)
+    g = np.zeros(len(x))
+    a_prev = np.zeros(len(x), dtype=complex)
+    b_prev = np.zeros(len(x), dtype=complex)
+
+    # orders past a particle's n_stop can overflow (inf / inf) but are masked out below
+    with np.errstate(over='ignore', invalid='ignore'):
+        for n in range(1, n_max + 1):
+
+            # psi_n, psi_n-1 and xi_n = psi_n - i chi_n, xi_n-1
+            psi_n = psi[n + 1]
+            psi_n1 = psi[n]
+            xi_n = psi[n + 1] - (1j * chi[n + 1])
+            xi_n1 = psi[n] - (1j * chi[n])
+
+            a_term = (D[n] / m) + (n / x)
+            b_term = (m * D[n]) + (n / x)
+
+            a_n = ((a_term * psi_n) - psi_n1) / ((a_term * xi_n) - xi_n1)
+            b_n = ((b_term * psi_n) - psi_n1) / ((b_term * xi_n) - xi_n1)
+
+            # only use the terms each particle needs
+            use = n <= n_stop
+            a_n = np.where(use, a_n, 0.0)
+            b_n = np.where(use, b_n, 0.0)
+
+            Q_ext += ((2.0 * n) + 1.0) * np.real(a_n + b_n)
+            Q_sca += ((2.0 * n) + 1.0) * (np.power(np.abs(a_n), 2) + np.power(np.abs(b_n), 2))
+            back += ((2.0 * n) + 1.0) * np.power(-1.0, n) * (a_n - b_n)
+
+            g += (((2.0 * n) + 1.0) / (n * (n + 1.0))) * np.real(a_n * np.conj(b_n))
+            if n > 1:
+                g += (((n - 1.0) * (n + 1.0)) / n) * np.real((a_prev * np.conj(a_n)) + (b_prev * np.conj(b_n)))
+
+            a_prev = a_n
+            b_prev = b_n
+
+    g = 2.0 * g / Q_sca
+    Q_ext = 2.0 * Q_ext / np.power(x, 2)
+    Q_sca = 2.0 * Q_sca / np.power(x, 2)
+    Q_back = np.power(np.abs(back), 2) / np.power(x, 2)
+
+    return Q_ext, Q_sca, Q_back, g
+
+def mie_efficiencies(radius, m, wavelength, chunk_size=10000):
+
+    """
+    Mie efficiencies of homogeneous spheres, for any broadcastable arrays of radius, refractive index and wavelength
+
+    :param radius: particle radius [m]
+    :param m: complex refractive index. Imaginary part >= 0 for absorption (e.g. 1.53 + 0.001j)
+    :param wavelength: [m]
+    :param chunk_size: maximum number of particles done at once (memory is ~ chunk_size * number of orders)
+    :return: Q: {'Q_ext':, 'Q_sca':, 'Q_abs':, 'Q_back':, 'g':} with the broadcast shape of the inputs
+    """
+
+    radius, m, wavelength = np.broadcast_arrays(np.asarray(radius, dtype=float), np.asarray(m, dtype=complex),
+                                                np.asarray(wavelength, dtype=float))
+
+    x = (2.0 * np.pi * radius / wavelength).ravel()
+    m_flat = m.ravel()
+
+    Q = {}
+    for var in ['Q_ext', 'Q_sca', 'Q_back', 'g']:
+        Q[var] = np.empty(len(x))
+
+    for start in range(0, len(x), chunk_size):
+        stop = min(start + chunk_size, len(x))
+        Q['Q_ext'][start:stop], Q['Q_sca'][start:stop], Q['Q_back'][start:stop], Q['g'][start:stop] = \
+            mie_coefficient_sums(x[start:stop], m_flat[start:stop])
+
+    # remove rounding error for non-absorbing particles
+    Q['Q_abs'] = np.maximum(Q['Q_ext'] - Q['Q_sca'], 0.0)
+
+    for var in Q.keys():
+        Q[var] = Q[var].reshape(radius.shape)
+
+    return Q
+
+# Aerosol optical properties
+
+def lognormal_bins(r_g, geo_stdev, n_bins=200, n_sigma=4.0):
+
+    """
+    Radius bins and number weights for a lognormal size distribution
+
+    :param r_g: geometric median radius [m]
+    :param geo_stdev: geometric standard deviation
+    :param n_bins:
+    :param n_sigma: number of standard deviations (in ln r) to cover either side of r_g
+    :return: radius: [bin] [m]
+    :return: weights: [bin] number fraction in each bin (sums to 1)
+    """
+
+    ln_sigma = np.log(geo_stdev)
+    ln_r = np.log(r_g) + np.linspace(-n_sigma * ln_sigma, n_sigma * ln_sigma, n_bins)
+
+    weights = np.exp(-0.5 * np.power((ln_r - np.log(r_g)) / ln_sigma, 2))
+    weights /= np.sum(weights)
+
+    return np.exp(ln_r), weights
+
+def calc_wet_properties(m_dry, kappa, RH, m_water=1.33 + 0.0j):
+
+    """
+    Hygroscopic growth factor (kappa-Kohler, no curvature term; Petters and Kreidenweis, 2007) and the volume mixed
+    refractive index of the wet particle
+
+    :param m_dry: refractive index of the dry species
+    :param kappa: hygroscopicity parameter
+    :param RH: relative humidity [fraction], < 1
+    :param m_water: refractive index of water
+    :return: growth_factor: wet radius / dry radius
+    :return: m_wet: refractive index of the wet particle
+    """
+
+    RH = np.asarray(RH, dtype=float)
+
+    # growth_factor^3 = 1 + kappa * RH / (1 - RH)
+    volume_ratio = 1.0 + (kappa * RH / (1.0 - RH))
+    growth_factor = np.power(volume_ratio, 1. / 3.)
+
+    m_wet = (m_dry + ((volume_ratio - 1.0) * m_water)) / volume_ratio
+
+    return growth_factor, m_wet
+
+def calc_species_table(species, r_g, geo_stdev, RH, wavelengths, n_bins=200, max_growth_RH=0.995):
+
+    """
+    Mass specific absorption and scattering [m2 kg-1] and asymmetry parameter of one species with a lognormal size
+    distribution, for each RH and averaged over the wavelengths given (e.g. those across a band). All sizes, humidities
+    and wavelengths are done in one Mie call.
+
+    :param species: {'m': dry refractive index, 'kappa': hygroscopicity, 'density': dry density [kg m-3]}
+    :param r_g: dry geometric median radius [m]
+    :param geo_stdev: geometric standard deviation
+    :param RH: [RH] relative humidity [fraction]
+    :param wavelengths: [lam] wavelengths to average over [m]
+    :param n_bins: number of radius bins in the size distribution
+    :param max_growth_RH: RH is capped at this for the growth, as the growth factor is infinite at RH = 1. The RH
+                    column of the table is not capped, so the tables can go up to RH = 1 for interpolation.
+                    NOTE: rows above max_growth_RH are NOT physical. They hold the values at max_growth_RH (e.g. f(RH)
+                    ~ 92 for NaCl at RH = 1, rather than infinite). Pass max_growth_RH to write_spec_file() to flag
+                    them in the file header.
+    :return: table: [RH, 4] with columns RH, absorption, scattering, asymmetry (as in the spectral files)
+    """
+
+    radius_dry, weights = lognormal_bins(r_g, geo_stdev, n_bins=n_bins)
+    RH = np.asarray(RH, dtype=float)
+    growth_factor, m_wet = calc_wet_properties(species['m'], species['kappa'], np.minimum(RH, max_growth_RH))
+
+    # [RH, bin, lam]
+    radius_wet = growth_factor[:, np.newaxis, np.newaxis] * radius_dry[np.newaxis, :, np.newaxis]
+    Q = mie_efficiencies(radius_wet, m_wet[:, np.newaxis, np.newaxis], np.asarray(wavelengths)[np.newaxis, np.newaxis, :])
+
+    # cross sections averaged over the size distribution and wavelengths [m2 per particle]
+    area = np.pi * np.power(radius_wet, 2) * weights[np.newaxis, :, np.newaxis]
+    sigma_abs = np.mean(np.sum(Q['Q_abs'] * area, axis=1), axis=-1)
+    sigma_sca = np.mean(np.sum(Q['Q_sca'] * area, axis=1), axis=-1)
+    g = np.mean(np.sum(Q['g'] * Q['Q_sca'] * area, axis=1), axis=-1) / sigma_sca
+
+    # mean dry mass of a particle [kg]
+    mass = species['density'] * (4.0 / 3.0) * np.pi * np.sum(np.power(radius_dry, 3) * weights)
+
+    table = np.transpose(np.array([RH, sigma_abs / mass, sigma_sca / mass, g]))
+
+    return table
+
+def calc_Q_ext_dry(r_md, m_dry, geo_stdev, wavelengths, n_bins=200):
+
+    """
+    Extinction efficiency of dry aerosol with a lognormal size distribution, averaged over the wavelengths given
+
+    :param r_md: [radius] dry mean volume radius [m]
+    :param m_dry: dry refractive index
+    :param geo_stdev: geometric standard deviation
+    :param wavelengths: wavelengths to average over [m]
+    :param n_bins: number of radius bins in the size distribution
+    :return: Q_ext: [radius] extinction cross section / geometric cross section of the distribution
+    """
+
+    # mean volume radius -> geometric median radius of the lognormal
+    r_g = np.asarray(r_md, dtype=float) * np.exp(-1.5 * np.power(np.log(geo_stdev), 2))
+
+    unit_radius, weights = lognormal_bins(1.0, geo_stdev, n_bins=n_bins)
+
+    # [radius, bin, lam]
+    radius = r_g[:, np.newaxis, np.newaxis] * unit_radius[np.newaxis, :, np.newaxis]
+    Q = mie_efficiencies(radius, m_dry, np.asarray(wavelengths)[np.newaxis, np.newaxis, :])
+
+    area = np.power(radius, 2) * weights[np.newaxis, :, np.newaxis]
+    Q_ext = np.mean(np.sum(Q['Q_ext'] * area, axis=1), axis=-1) / np.mean(np.sum(area, axis=1), axis=-1)
+
+    return Q_ext
+
+# Saving
+
+def write_spec_file(file_path, band_limits, species_order, tables, max_growth_RH=None):
+
+    """
+    Write the aerosol optical properties as a UM style spectral file, which read_spec_bands() and read_aer_data() can
+    read.
+
+    :param file_path:
+    :param band_limits: [(lower, upper)] wavelength limits of each band [m]. Bands are numbered from 1
+    :param species_order: species names, in index order
+    :param tables: {species: [band][RH, 4] tables from calc_species_table()}
+    :param max_growth_RH: (optional) max_growth_RH given to calc_species_table(). If any humidities are above it,
+                    a note saying those rows are capped (not physical) is written in the file header, before the first
+                    block (where the readers ignore it).
+    :return:
+    """
+
+    lines = ['*FILE TYPE =    6']
+
+    # flag the rows where the growth was capped
+    if max_growth_RH is not None:
+        RH = tables[species_order[0]][0][:, 0]
+        capped_RH = ', '.join(['%.4f' % i for i in RH[RH > max_growth_RH]])
+        if capped_RH != '':
+            lines += ['NOTE: growth capped at humidity %.4f. Rows for humidities above this (%s) hold the values at '
+                      '%.4f and are not physical.' % (max_growth_RH, capped_RH, max_growth_RH)]
+
+    lines += ['*BLOCK: TYPE =    1: SUBTYPE =    0: VERSION =    0',
+             'Limits of spectral intervals (wavelengths in m.)',
+             'Band     Lower limit         Upper limit']
+    for band_i, (lower, upper) in enumerate(band_limits):
+        lines += ['%5d     %.9E     %.9E' % (band_i + 1, lower, upper)]
+    lines += ['*END']
+
+    lines += ['*BLOCK: TYPE =   11: SUBTYPE =    1: VERSION =    2',
+              'Parameters for moist aerosols']
+    for species_idx, species_name in enumerate(species_order):
+        lines += ['Index of species =     %d   %s' % (species_idx + 1, species_name),
+                  'Number of humidities =    %d' % tables[species_name][0].shape[0]]
+        for band_i, table in enumerate(tables[species_name]):
+            lines += ['Band =     %d' % (band_i + 1),
+                      '     Humidity     Absorption      Scattering      Asymmetry',
+                      '                  (m2 kg-1)       (m2 kg-1)']
+            for row in table:
+                lines += ['  %.6E  %.6E  %.6E  %.6E' % tuple(row)]
+    lines += ['*END']
+
+    file = open(file_path, 'w')
+    file.write('\n'.join(lines) + '\n')
+    file.close()
+
+    return
+
+def write_Q_ext_dry_csv(file_path, r_md, Q_ext):
+
+    """
+    Write Q_ext_dry in the calculated_Q_ext_<lam>nm.csv format (radius [m], Q_ext)
+    :param file_path:
+    :param r_md: dry mean volume radius [m]
+    :param Q_ext:
+    :return:
+    """
+
+    np.savetxt(file_path, np.transpose(np.array([r_md, Q_ext])), delimiter=',')
+
+    return
+
+if __name__ == '__main__':
+
+    # User set args
+    # band(s) to make the spectral files for [m]
+    band_limits = [(885.0e-9, 925.0e-9)]
+    n_wavelengths = 9 # per band
+
+    # size distribution
+    geo_stdev = 1.6
+    radii_range_nm = np.arange(5, 3685 + 5, 5) # geometric median radius of each spectral file
+
+    # RH of the tables [fraction]. Up to 1.0, as the f(RH) creation interpolates onto RH_int = 0 - 1
+    RH = np.arange(0.0, 1.01, 0.01)
+    # growth is capped at this RH (infinite at RH = 1). Rows above it are flagged in the file header as not physical
+    max_growth_RH = 0.995
+
+    # species in the spectral files, in index order, with their properties near 900 nm.
+    #   refractive index, hygroscopicity (Petters and Kreidenweis, 2007) and density
+    species_order = ['Ammonium Sulphate', 'Generic NaCl', 'Biogenic', 'Aged fossil-fuel OC', 'Ammonium nitrate']
+    species = {'Ammonium Sulphate': {'m': 1.52 + 0.0j, 'kappa': 0.61, 'density': 1770.0},
+               'Generic NaCl': {'m': 1.53 + 0.0j, 'kappa': 1.28, 'density': 2165.0},
+               'Biogenic': {'m': 1.45 + 0.001j, 'kappa': 0.1, 'density': 1300.0},
+               'Aged fossil-fuel OC': {'m': 1.45 + 0.001j, 'kappa': 0.1, 'density': 1400.0},
+               'Ammonium nitrate': {'m': 1.55 + 0.0j, 'kappa': 0.67, 'density': 1720.0}}
+
+    # dry Q_ext table (MURK)
+    m_murk = 1.53 + 0.001j
+    r_md_Q_ext = np.arange(1.0e-9, 2.0e-6, 1.0e-9)
+
+    # -------------------------
+
+    specdir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/' \
+              'sp_885-925_r_files/'
+    miedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/'
+
+    band_wavelengths = [np.linspace(lower, upper, n_wavelengths) for lower, upper in band_limits]
+    lam_range_str = '%.0f' % (band_limits[0][0] * 1.0e9) + '-' + '%.0f' % (band_limits[-1][1] * 1.0e9)
+
+    # one spectral file per radius, named as daily_f_RH_creation.py expects
+    for radius_nm_i in radii_range_nm:
+
+        print 'on size: ' + str(radius_nm_i)
+
+        tables = {}
+        for species_name in species_order:
+            tables[species_name] = [calc_species_table(species[species_name], radius_nm_i * 1.0e-9, geo_stdev, RH,
+                                                       wavelengths, max_growth_RH=max_growth_RH)
+                                    for wavelengths in band_wavelengths]
+
+        filename = 'sp_' + lam_range_str + '_r' + '0.%09d' % radius_nm_i + '_stdev' + str(geo_stdev) + '_num4.461e9'
+        write_spec_file(specdir + filename, band_limits, species_order, tables, max_growth_RH=max_growth_RH)
+
+    # dry Q_ext for each band's central wavelength
+    for wavelengths in band_wavelengths:
+        Q_ext = calc_Q_ext_dry(r_md_Q_ext, m_murk, geo_stdev, wavelengths)
+        ceil_lam = int(round(np.mean(wavelengths) * 1.0e9))
+        write_Q_ext_dry_csv(miedir + 'calculated_Q_ext_' + str(ceil_lam) + 'nm.csv', r_md_Q_ext, Q_ext)
+
+    print 'END PROGRAM'
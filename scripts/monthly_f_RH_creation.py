@@ -70,81 +70,6 @@ def read_spec_bands(file_path):
 
     return spec_bands
 
-def read_aer_data(file_path, aer_index, aer_order, band=1):
-
-    """
-    Read in the aerosol data, calculate the Qs
-
-    :param file_path:
-    :param aer_index:
-    :param aer_order:
-    :param band
-    :return:
-    """
-
-    # print "Reading from:" + file_path
-    # print "Band: " + str(band)
-
-    # define arrays
-    data = {}
-
-    for aer in aer_order:
-
-
-        # print 'Getting ...' + aer
-
-        data[aer] = []
-
-        file = open(file_path, "r")
-
-        line = file.readline()  # read the first actual line
-        line = line.rstrip('\n\r')
-
-        while line != '*BLOCK: TYPE =   11: SUBTYPE =    1: VERSION =    2':
-            line = file.readline()
-            line = line.rstrip('\n\r')
-
-        # while line != 'Index of species = 6 Accum. Sulphate':
-        while line != 'Index of species = ' + str(aer_index[aer]) + ' ' + aer:
-            line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
-
-        while line != 'Band = ' + str(band):
-            line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
-
-
-        # skip two lines
-        line = file.readline()
-        line = file.readline()
-
-        # read first line of data
-        line = file.readline()
-        line = line.rstrip('\n\r')
-
-        # when reached the data line...
-        while (line != 'Band = ' + str(band + 1)) & (line != '*END'):
-
-            line = ' '.join(line.split()) # remove duplicate, trailing and leading spaces
-            line_split = line.split(' ')
-
-            # extract data
-            data[aer] += [line_split]
-
-            line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
-
-        file.close()
-
-        # convert to numpy array, list already alligned correctly for np.array()
-        data[aer] = np.array(data[aer], dtype=float)
-
-
-    return data
-
 # Processing
 
 def calc_f_RH(data, aer_order, Q_type=''):
@@ -184,7 +109,8 @@ def calc_f_RH(data, aer_order, Q_type=''):
 
 # Saving
 
-def save_fRH_netCDF(fRHdir, f_RH, radii_range_nm, RH_int, site_ins, ceil_lambda_nm_str):
+def save_fRH_netCDF(fRHdir, f_RH, radii_range_nm, RH_int, site_ins, ceil_lambda_nm_str,
+                    zlib=False, complevel=4, shuffle=True, float32=False, radii_chunk=8):
 
     """
     Create a netCDF file for the f(RH) information to be stored in.
@@ -195,6 +121,12 @@ def save_fRH_netCDF(fRHdir, f_RH, radii_range_nm, RH_int, site_ins, ceil_lambda_
     :param RH_int: interpolated RH values [fraction]
     :param site_ins: site information
     :param ceil_lambda_nm_str: ceilometer wavelength as str with nm on the end e.g. '905.0nm'
+    :param zlib: compress the f(RH) variables
+    :param complevel: zlib compression level (1-9)
+    :param shuffle: use the shuffle filter with zlib (usually makes compression better)
+    :param float32: store the f(RH) variables as float32 instead of float64
+    :param radii_chunk: number of radii in each chunk. Chunks are [1 month, radii_chunk radii, all RH], to
+                suit the forward operator reading one month and a few radii at a time.
     :return:
 
     Store the MURK [month, radius, RH] AND species f(RH) curves [radius, RH]
@@ -223,15 +155,23 @@ def save_fRH_netCDF(fRHdir, f_RH, radii_range_nm, RH_int, site_ins, ceil_lambda_
     nc_RH.units = 'fraction'
     nc_radii_range_nm.units = 'nm'
 
+    # storage type, compression and chunking for the f(RH) variables
+    f_RH_dtype = np.float32 if float32 else np.float64
+    radii_chunk = min(radii_chunk, len(radii_range_nm))
+
     # create and fill variables
     for species_i in f_RH.keys():
         var_name = 'f(RH) ' + species_i
 
         if var_name == 'f(RH) MURK':
-            nc_f_RH_MURK = ncfile.createVariable('f(RH) MURK', np.float64, ('month', 'radii_range', 'RH'))
+            nc_f_RH_MURK = ncfile.createVariable('f(RH) MURK', f_RH_dtype, ('month', 'radii_range', 'RH'),
+                                                 zlib=zlib, complevel=complevel, shuffle=shuffle,
+                                                 chunksizes=(1, radii_chunk, len(RH_int)))
             nc_f_RH_MURK[:] = f_RH['MURK']
         else:
-            nc_f_RH_species_i = ncfile.createVariable(var_name, np.float64, ('radii_range', 'RH'))
+            nc_f_RH_species_i = ncfile.createVariable(var_name, f_RH_dtype, ('radii_range', 'RH'),
+                                                      zlib=zlib, complevel=complevel, shuffle=shuffle,
+                                                      chunksizes=(radii_chunk, len(RH_int)))
             nc_f_RH_species_i[:] = f_RH[species_i]
 
     # extra attributes
@@ -280,7 +220,11 @@ if __name__ == '__main__':
     # site_ins = {'site_short':'Ha', 'site_long': 'Harwell',
     #             'ceil_lambda': 0.905e-06, 'land-type': 'rural'}
 
-    ceil_lambda_nm_str = str(int(site_ins['ceil_lambda'] * 1e9)) + 'nm'
+    # f(RH) is made by f_RH_climatology_creation, which imports this module for save_fRH_netCDF()
+    import f_RH_climatology_creation as clim
+    import daily_f_RH_creation as daily
+
+    ceil_lambda_nm_str = clim.ceil_lambda_str(site_ins['ceil_lambda'])
 
     # User set args
     # band that read_spec_bands() uses to find the correct band
@@ -290,6 +234,13 @@ if __name__ == '__main__':
     # saveF(RH)?
     saveFRH = True
 
+    # f(RH) file storage: zlib compress? store as float32 instead of float64?
+    compressFRH = True
+    float32FRH = False
+
+    # number of processes to spread the radii across (1 = serial)
+    n_workers = 1
+
     # -------------------------
 
     # directories
@@ -298,6 +249,8 @@ if __name__ == '__main__':
     specdir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/' \
               'SOCRATES/'+site_ins['SOCRATES_file_subdir']+'/'
     pickleloaddir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/pickle/'
+    # parsed spectral files are cached here (as .npy) to save re-reading the ASCII on later runs. None = no caching
+    cachedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/cache/'
 
 
     # variables to take from file (as listed within the file) with index from BLOCK = 0
@@ -330,11 +283,7 @@ if __name__ == '__main__':
 
     # read in relative volume of aerosol species
     #   created in VMachine "create_Qext_for_MURK_.py" and saved as a pickle
-    # # read in any pickled S data from before
-    filename = pickleloaddir + site_ins['site_short'] + '_aerosol_relative_volume.pickle'
-    with open(filename, 'rb') as handle:
-        pickle_load_in = pickle.load(handle)
-    pm10_rel_vol = pickle_load_in['pm10_rel_vol']
+    pm10_rel_vol, pm10_time = clim.load_rel_vol(pickleloaddir, site_ins['site_short'], 'monthly')
 
     # range of radii to iterate over
     # radii_range_m = np.arange(0.005e-06, 3.685e-6 + 0.005e-06, 0.005e-06)
@@ -345,76 +294,18 @@ if __name__ == '__main__':
     # RH to interpolate to
     RH_int = np.arange(0, 1.01, 0.01)
 
-    # create f(RH) dictionaries to fill (including one for murk)
-    #   MURK data will be in a 3D array [month, size, RH]
-    #   all other speices will be 2D [size, RH] as they wont vary each month
-    f_RH = {}
-    f_RH['MURK'] = np.empty((12, len(radii_range_nm), 101))
-    f_RH['MURK'][:] = np.nan
-    for species_i in aer_particles:
-        f_RH[species_i] = np.empty((len(radii_range_nm), 101))
-        f_RH[species_i][:] = np.nan
-
-
-    for radius_idx, radius_nm_i in enumerate(radii_range_nm):
-
-        print radius_nm_i
-
-        # format of radius used in the filename
-        #   trying to use m or microns leads to rounding errors when making the string...
-        radius_filestr = '0.%09d' % radius_nm_i
-
-        # create filename
-        filename = 'sp_885-925_r'+radius_filestr+'_stdev'+site_ins['geo_stdev']+'_num4.461e9'
-        file_path = specdir + filename
-
-        # read in the spectral band information
-        spec_bands = read_spec_bands(file_path)
-
-        # wavelength range in current band
-        band_idx = np.where(spec_bands['band'] == band)[0][0]
-        band_lam_range = '%.0f' % (spec_bands['lower_limit'][band_idx] * 1.0e9) + '-' + \
-                         '%.0f' % (spec_bands['upper_limit'][band_idx] * 1.0e9) + 'nm'
-
-        # read the aerosol data
-        data = read_aer_data(file_path, aer_index, aer_order, band=band)
-
-        # Extract RH (RH is the same across all aerosol types)
-        RH = np.array(data[aer_order[0]][:, 0])
-
-        # calculate f(RH) for each species
-        Q, f_RH_i = calc_f_RH(data, aer_order, Q_type=Q_type)
-
-        # add a soot f_RH
-        f_RH_i['Soot'] = np.array([1.0 for i in f_RH_i['Generic NaCl']])
-
-        # linearly interpolate f(RH) to increase resolution from 0.05 to 0.01 [fraction]
-        interp_f_RH_i = {}
-
-        # soot is always the same (fixed at 1)
-        interp_f_RH_i['Soot'] = np.repeat(1.0, 101)
-        f_RH['CBLK'][radius_idx, :] = interp_f_RH_i['Soot']
-
-        # all species excluding soot
-        for species_i, chem_i in aer_particles_chem.iteritems():
-            f = interp1d(RH, f_RH_i[species_i], kind='linear')
-            interp_f_RH_i[species_i] = f(RH_int)
-            f_RH[chem_i][radius_idx, :] = interp_f_RH_i[species_i]
-
-        # make f(RH) for murk from the interpolated f(RH)
-        for month_idx in range(12):
-            f_RH['MURK'][month_idx, radius_idx, :] = \
-                (interp_f_RH_i['Ammonium Sulphate'] * pm10_rel_vol['(NH4)2SO4'][month_idx]) + \
-                (interp_f_RH_i['Ammonium nitrate'] * pm10_rel_vol['NH4NO3'][month_idx]) + \
-                (interp_f_RH_i['Aged fossil-fuel OC'] * pm10_rel_vol['CORG'][month_idx]) + \
-                (interp_f_RH_i['Soot'] * pm10_rel_vol['CBLK'][month_idx]) + \
-                (interp_f_RH_i['Generic NaCl'] * pm10_rel_vol['NaCl'][month_idx])
+    # f(RH) for each species [radius, RH] and MURK [month, radius, RH]
+    file_paths = [daily.radius_file_path(specdir, radius_nm_i, site_ins['geo_stdev']) for radius_nm_i in radii_range_nm]
+    f_RH, _ = clim.create_f_RH(file_paths, pm10_rel_vol, pm10_time, aer_index, aer_order, aer_particles_chem,
+                               aer_particles, RH_int, product='monthly', band=band, Q_type=Q_type, cachedir=cachedir,
+                               n_workers=n_workers)
 
 
     # save f(RH) once all radii have been looped through
     if saveFRH == True:
 
-        save_fRH_netCDF(fRHdir, f_RH, radii_range_nm, RH_int, site_ins, ceil_lambda_nm_str)
+        save_fRH_netCDF(fRHdir, f_RH, radii_range_nm, RH_int, site_ins, ceil_lambda_nm_str,
+                        zlib=compressFRH, float32=float32FRH)
 
 
     # ---------------------------------------------------
@@ -13,6 +13,7 @@ import matplotlib.pyplot as plt
 import pickle
 from netCDF4 import Dataset
 import datetime as dt
+import f_RH_climatology_creation as clim
 
 # Reading
 
@@ -66,81 +67,6 @@ def read_spec_bands(file_path):
 
     return spec_bands
 
-def read_aer_data(file_path, aer_index, aer_order, band=1):
-
-    """
-    Read in the aerosol data, calculate the Qs
-
-    :param file_path:
-    :param aer_index:
-    :param aer_order:
-    :param band
-    :return:
-    """
-
-    # print "Reading from:" + file_path
-    # print "Band: " + str(band)
-
-    # define arrays
-    data = {}
-
-    for aer in aer_order:
-
-
-        # print 'Getting ...' + aer
-
-        data[aer] = []
-
-        file = open(file_path, "r")
-
-        line = file.readline()  # read the first actual line
-        line = line.rstrip('\n\r')
-
-        while line != '*BLOCK: TYPE =   11: SUBTYPE =    1: VERSION =    2':
-            line = file.readline()
-            line = line.rstrip('\n\r')
-
-        # while line != 'Index of species = 6 Accum. Sulphate':
-        while line != 'Index of species = ' + str(aer_index[aer]) + ' ' + aer:
-            line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
-
-        while line != 'Band = ' + str(band):
-            line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
-
-
-        # skip two lines
-        line = file.readline()
-        line = file.readline()
-
-        # read first line of data
-        line = file.readline()
-        line = line.rstrip('\n\r')
-
-        # when reached the data line...
-        while (line != 'Band = ' + str(band + 1)) & (line != '*END'):
-
-            line = ' '.join(line.split()) # remove duplicate, trailing and leading spaces
-            line_split = line.split(' ')
-
-            # extract data
-            data[aer] += [line_split]
-
-            line = file.readline()
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
-
-        file.close()
-
-        # convert to numpy array, list already alligned correctly for np.array()
-        data[aer] = np.array(data[aer], dtype=float)
-
-
-    return data
-
 # Processing
 
 def calc_f_RH(data, aer_order, Q_type=''):
@@ -247,7 +173,7 @@ if __name__ == '__main__':
     # site_ins = {'site_short':'Ha', 'site_long': 'Harwell',
     #             'ceil_lambda': 0.905e-06, 'land-type': 'rural'}
 
-    ceil_lambda_nm_str = str(site_ins['ceil_lambda'] * 1e9) + 'nm'
+    ceil_lambda_nm_str = clim.ceil_lambda_str(site_ins['ceil_lambda'])
 
     # User set args
     # band that read_spec_bands() uses to find the correct band
@@ -257,6 +183,9 @@ if __name__ == '__main__':
     # saveF(RH)?
     saveFRH = True
 
+    # number of processes to spread the stdevs across (1 = serial)
+    n_workers = 1
+
     # -------------------------
 
     # directories
@@ -265,6 +194,8 @@ if __name__ == '__main__':
     specdir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/' \
               'monthly_f(RH)/sp_885-925_r_files/'
     pickleloaddir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/pickle/'
+    # parsed spectral files are cached here (as .npy) to save re-reading the ASCII on later runs. None = no caching
+    cachedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/cache/'
 
 
     # variables to take from file (as listed within the file) with index from BLOCK = 0
@@ -290,11 +221,7 @@ if __name__ == '__main__':
 
     # read in relative volume of aerosol species
     #   created in VMachine "create_Qext_for_MURK_.py" and saved as a pickle
-    # # read in any pickled S data from before
-    filename = pickleloaddir + site_ins['site_short'] + '_aerosol_relative_volume.pickle'
-    with open(filename, 'rb') as handle:
-        pickle_load_in = pickle.load(handle)
-    pm10_rel_vol = pickle_load_in['pm10_rel_vol']
+    pm10_rel_vol, pm10_time = clim.load_rel_vol(pickleloaddir, site_ins['site_short'], 'monthly')
 
     # range of st dev to iterate over
     stdev_range = np.linspace(1.1, 2.0, 10)# np.arange(1.1, 2.1, 0.1)
@@ -302,70 +229,14 @@ if __name__ == '__main__':
     # RH to interpolate to
     RH_int = np.arange(0, 1.01, 0.01)
 
-    # create f(RH) dictionaries to fill (including one for murk)
-    #   MURK data will be in a 3D array [month, size, RH]
-    #   all other speices will be 2D [size, RH] as they wont vary each month
-    f_RH = {}
-    f_RH['MURK'] = np.empty((12, len(stdev_range), 101))
-    f_RH['MURK'][:] = np.nan
-    for species_i in aer_particles:
-        f_RH[species_i] = np.empty((len(stdev_range), 101))
-        f_RH[species_i][:] = np.nan
-
-
-    for stdev_idx, stdev_i in enumerate(stdev_range):
-
-        print stdev_i
-
-        # format of radius used in the filename
-        #   trying to use m or microns leads to rounding errors when making the string...
-        stdev_i_filestr = '%3.1f' % stdev_i
-
-        # create filename
-        filename = 'sp_885-925_r1.1e-7_stdev'+stdev_i_filestr+'_num4.461e9'
-        file_path = specdir + filename
-
-        # read in the spectral band information
-        spec_bands = read_spec_bands(file_path)
-
-        # wavelength range in current band
-        band_idx = np.where(spec_bands['band'] == band)[0][0]
-        band_lam_range = '%.0f' % (spec_bands['lower_limit'][band_idx] * 1.0e9) + '-' + \
-                         '%.0f' % (spec_bands['upper_limit'][band_idx] * 1.0e9) + 'nm'
-
-        # read the aerosol data
-        data = read_aer_data(file_path, aer_index, aer_order, band=band)
-
-        # Extract RH (RH is the same across all aerosol types)
-        RH = np.array(data[aer_order[0]][:, 0])
-
-        # calculate f(RH) for each species
-        Q, f_RH_i = calc_f_RH(data, aer_order, Q_type=Q_type)
-
-        # add a soot f_RH
-        f_RH_i['Soot'] = np.array([1.0 for i in f_RH_i['Generic NaCl']])
-
-        # linearly interpolate f(RH) to increase resolution from 0.05 to 0.01 [fraction]
-        interp_f_RH_i = {}
-
-        # soot is always the same (fixed at 1)
-        interp_f_RH_i['Soot'] = np.repeat(1.0, 101)
-        f_RH['CBLK'][stdev_idx, :] = interp_f_RH_i['Soot']
-
-        # all species excluding soot
-        for species_i, chem_i in aer_particles_chem.iteritems():
-            f = interp1d(RH, f_RH_i[species_i], kind='linear')
-            interp_f_RH_i[species_i] = f(RH_int)
-            f_RH[chem_i][stdev_idx, :] = interp_f_RH_i[species_i]
+    # spectral file for each stdev, all with a radius of 0.11 microns
+    #   stdev is to 1 d.p. in the filename e.g. 1.6
+    file_paths = [specdir + 'sp_885-925_r1.1e-7_stdev' + '%3.1f' % stdev_i + '_num4.461e9' for stdev_i in stdev_range]
 
-        # make f(RH) for murk from the interpolated f(RH)
-        for month_idx in range(12):
-            f_RH['MURK'][month_idx, stdev_idx, :] = \
-                (interp_f_RH_i['Ammonium Sulphate'] * pm10_rel_vol['(NH4)2SO4'][month_idx]) + \
-                (interp_f_RH_i['Ammonium nitrate'] * pm10_rel_vol['NH4NO3'][month_idx]) + \
-                (interp_f_RH_i['Aged fossil-fuel OC'] * pm10_rel_vol['CORG'][month_idx]) + \
-                (interp_f_RH_i['Soot'] * pm10_rel_vol['CBLK'][month_idx]) + \
-                (interp_f_RH_i['Generic NaCl'] * pm10_rel_vol['NaCl'][month_idx])
+    # f(RH) for each species [stdev, RH] and MURK [month, stdev, RH]
+    f_RH, _ = clim.create_f_RH(file_paths, pm10_rel_vol, pm10_time, aer_index, aer_order, aer_particles_chem,
+                               aer_particles, RH_int, product='monthly', band=band, Q_type=Q_type, cachedir=cachedir,
+                               n_workers=n_workers)
 
 
     # # save f(RH) once all radii have been looped through
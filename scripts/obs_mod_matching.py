@@ -0,0 +1,510 @@
+"""
+Match the ceilometer observations to the model levels: nearest gate pairing (nearest_heights), or regridding with
+sparse weight matrices (layer_mean_weights, interp_weights). Also matches the observation and model times, either by
+picking the nearest time (time_match_idx) or averaging all observations in each model time window (block_average_obs).
+"""
+
+import numpy as np
+import os
+import hashlib
+import pickle
+from scipy import sparse
+
+from cache_io import write_cache_file
+
+# pairing tables already made this run {key: {'mod_height':, 'obs_height':, 'table':}}
+pairing_cache = {}
+
+def nearest_idx(array, values):
+
+    """
+    Index of the nearest element of a sorted array to each of the values, for all values at once.
+    Same as eu.nearest() for each value: ties go to the lower index.
+
+    :param array: 1D array, sorted in ascending order
+    :param values: values to find the nearest element of array to (any shape)
+    :return: idx: index of the nearest element, with the shape of values
+    :return: diff: array[idx] - values
+    """
+
+    array = np.asarray(array)
+    values = np.asarray(values)
+
+    # element above or equal to each value, and the one below it
+    upper = np.clip(np.searchsorted(array, values, side='left'), 1, len(array) - 1)
+    lower = upper - 1
+
+    # take the lower element unless the upper one is closer
+    idx = np.where(np.abs(array[upper] - values) < np.abs(array[lower] - values), upper, lower)
+    diff = array[idx] - values
+
+    return idx, diff
+
+def unique_pairs(obs_idx, diff):
+
+    """
+    Remove duplicate gates from the pairs, keeping the pair with the smallest height difference for each gate. Works
+    for duplicates anywhere in the profile, not just at the ends.
+
+    :param obs_idx: gate paired with each model level
+    :param diff: height difference of each pair
+    :return: unique_pairs_range: index of the pairs to keep, in model level order
+
+    At this point, the two arrays are like:
+    obs_idx = [0, 0, 0, 1, 3, 5, .... 769, 769, 769]
+    mod_idx = [0, 1, 2, 3, 4, 4, .... 67,  68,  69 ]
+    By finding the unique pairs index array for obs_idx, the same array can be used
+    on the mod_idx, as they are already paired up and of equal lengths.
+    """
+
+    # sort the pairs by gate, then by height difference (then model level, from the stable sort), so the first pair of
+    #   each gate is the closest one
+    order = np.lexsort((np.abs(diff), obs_idx))
+    _, first = np.unique(obs_idx[order], return_index=True)
+
+    unique_pairs_range = np.sort(order[first])
+
+    return unique_pairs_range
+
+def nearest_heights(mod_height, obs_height, minHeight=-np.inf, maxHeight=np.inf):
+
+    """
+    Get the nearest ceilometer height gate to each model level, for all levels at once
+
+    :param mod_height: model level heights
+    :param obs_height: ceilometer gate heights (ascending)
+    :param minHeight: lowest gate height to keep
+    :param maxHeight: highest gate height to keep
+    :return: obs_idx: gate idx of each unique pair
+    :return: mod_idx: idx of the model height that each obs_idx is paired to
+    :return: values: gate height of each pair
+    :return: diff: gate height - model height of each pair
+    """
+
+    obs_height = np.asarray(obs_height)
+
+    obs_idx, diff = nearest_idx(obs_height, mod_height)
+    values = obs_height[obs_idx]
+    mod_idx = np.arange(len(mod_height))  # mod_idx should be paired with obs_idx spots.
+
+    # keep the closest model level to each gate, as UKV and obs z0 and zmax are different, leading to the same gate
+    #   matching multiple ukvs
+    unique_pairs_range = unique_pairs(obs_idx, diff)
+
+    # cut off below min height and above max height. If undefined, then limits set to +/- inf
+    # hc = height cut
+    hc_unique_pairs_range = unique_pairs_range[np.logical_and(values[unique_pairs_range] >= minHeight,
+                                                              values[unique_pairs_range] <= maxHeight)]
+
+    return obs_idx[hc_unique_pairs_range], mod_idx[hc_unique_pairs_range], \
+           values[hc_unique_pairs_range], diff[hc_unique_pairs_range]
+
+# Regridding (alternative to nearest_heights)
+
+def layer_bounds(heights, ground=True):
+
+    """
+    Lower and upper bounds of the layer around each height: half way to the neighbouring heights, and the same
+    half spacing beyond the ends
+
+    :param heights: 1D heights, ascending
+    :param ground: bottom layer starts at the ground (0 m), as for the model levels
+    :return: lower: [height]
+    :return: upper: [height]
+    """
+
+    heights = np.asarray(heights, dtype=float)
+
+    mid = 0.5 * (heights[1:] + heights[:-1])
+    lower = np.append(heights[0] - (mid[0] - heights[0]), mid)
+    upper = np.append(mid, heights[-1] + (heights[-1] - mid[-1]))
+
+    if ground == True:
+        lower[0] = 0.0
+
+    return lower, upper
+
+def layer_mean_weights(mod_height, obs_height, minHeight=-np.inf, maxHeight=np.inf, min_coverage=1.0):
+
+    """
+    Sparse weights that average the ceilometer gates onto each model level's layer, weighted by how much of each
+    gate lies within the layer (conservative). Unlike nearest_heights, every gate is used.
+
+    :param mod_height: model level heights
+    :param obs_height: ceilometer gate heights (centres, ascending)
+    :param minHeight: lowest model level height to keep
+    :param maxHeight: highest model level height to keep
+    :param min_coverage: fraction of a model layer that needs to be covered by gates for the level to be kept
+    :return: weights: sparse [mod_idx, gate] matrix. Rows sum to 1.
+    :return: mod_idx: model levels each row of weights is for
+
+    e.g. obs_on_mod = apply_weights(weights, backscatter_obs) # [time, mod_idx]
+    """
+
+    mod_lower, mod_upper = layer_bounds(mod_height, ground=True)
+    obs_lower, obs_upper = layer_bounds(obs_height, ground=False)
+
+    # range of gates overlapping each layer
+    gate_start = np.searchsorted(obs_upper, mod_lower, side='right')
+    gate_end = np.searchsorted(obs_lower, mod_upper, side='left')
+    n_gates = np.maximum(gate_end - gate_start, 0)
+
+    # every (layer, gate) overlap, and its length
+    rows = np.repeat(np.arange(len(mod_lower)), n_gates)
+    cols = np.repeat(gate_start - np.cumsum(n_gates) + n_gates, n_gates) + np.arange(np.sum(n_gates))
+    overlap = np.minimum(mod_upper[rows], obs_upper[cols]) - np.maximum(mod_lower[rows], obs_lower[cols])
+
+    # only keep the levels that are within the height limits and covered enough
+    coverage = np.bincount(rows, weights=overlap, minlength=len(mod_lower)) / (mod_upper - mod_lower)
+    mod_idx = np.where((coverage >= min_coverage - 1.0e-9) & (coverage > 0.0) &
+                       (np.asarray(mod_height) >= minHeight) & (np.asarray(mod_height) <= maxHeight))[0]
+
+    weights = sparse.csr_matrix((overlap, (rows, cols)), shape=(len(mod_lower), len(obs_lower)))[mod_idx, :]
+
+    # normalise so each row is an average
+    row_sum = np.asarray(weights.sum(axis=1)).ravel()
+    weights = sparse.diags(1.0 / row_sum).dot(weights).tocsr()
+
+    return weights, mod_idx
+
+def interp_weights(mod_height, obs_height, minHeight=-np.inf, maxHeight=np.inf):
+
+    """
+    Sparse weights that linearly interpolate the model levels onto each ceilometer gate
+
+    :param mod_height: model level heights (ascending)
+    :param obs_height: ceilometer gate heights
+    :param minHeight: lowest gate height to keep
+    :param maxHeight: highest gate height to keep
+    :return: weights: sparse [obs_idx, level] matrix. Rows sum to 1.
+    :return: obs_idx: gates each row of weights is for (only those between the lowest and highest model levels)
+
+    e.g. mod_on_obs = apply_weights(weights, backscatter_mod) # [time, obs_idx]
+    """
+
+    mod_height = np.asarray(mod_height, dtype=float)
+    obs_height = np.asarray(obs_height, dtype=float)
+
+    obs_idx = np.where((obs_height >= mod_height[0]) & (obs_height <= mod_height[-1]) &
+                       (obs_height >= minHeight) & (obs_height <= maxHeight))[0]
+
+    upper = np.clip(np.searchsorted(mod_height, obs_height[obs_idx], side='left'), 1, len(mod_height) - 1)
+    lower = upper - 1
+    w_upper = (obs_height[obs_idx] - mod_height[lower]) / (mod_height[upper] - mod_height[lower])
+
+    rows = np.tile(np.arange(len(obs_idx)), 2)
+    cols = np.append(lower, upper)
+    data = np.append(1.0 - w_upper, w_upper)
+
+    weights = sparse.csr_matrix((data, (rows, cols)), shape=(len(obs_idx), len(mod_height)))
+
+    return weights, obs_idx
+
+def apply_weights(weights, data):
+
+    """
+    Apply regridding weights to the whole [time, height] array with sparse matrix products. NaNs are left out, with
+    the weights of the remaining values rescaled. NaN where there is no valid data.
+
+    :param weights: sparse [new height, height] matrix from layer_mean_weights() or interp_weights()
+    :param data: [time, height] (e.g. backscatter)
+    :return: regridded: [time, new height]
+    """
+
+    data = np.asarray(data, dtype=float)
+    valid = np.isfinite(data)
+
+    total = weights.dot(np.where(valid, data, 0.0).T).T
+    weight_sum = weights.dot(valid.T.astype(float)).T
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        regridded = np.where(weight_sum > 0.0, total / weight_sum, np.nan)
+
+    return regridded
+
+# Time matching
+
+def to_datetime64(times):
+
+    """
+    Convert a time axis (list or array of datetimes, or datetime64) to a datetime64 array
+
+    :param times:
+    :return: times: datetime64[us] array
+    """
+
+    return np.asarray(times, dtype='datetime64[us]')
+
+def time_match_idx(times, target_times, method='nearest'):
+
+    """
+    Index of the matching time in times for each of the target times, for all target times at once.
+    e.g. the model time for each observation time, for a whole 3 day forecast.
+
+    :param times: sorted time axis to find indices in (list of datetimes or datetime64 array)
+    :param target_times: times to match (list of datetimes or datetime64 array)
+    :param method: 'nearest' (ties go to the earlier time, as eu.nearest), 'previous' (latest time <= target) or
+                    'next' (earliest time >= target). Indices are clipped to the ends of times.
+    :return: idx: index in times for each target time
+    :return: diff: times[idx] - target_times (timedelta64)
+    """
+
+    times = to_datetime64(times)
+    target_times = to_datetime64(target_times)
+
+    if method == 'nearest':
+        idx, diff = nearest_idx(times, target_times)
+        return idx, diff
+    elif method == 'previous':
+        idx = np.clip(np.searchsorted(times, target_times, side='right') - 1, 0, len(times) - 1)
+    elif method == 'next':
+        idx = np.clip(np.searchsorted(times, target_times, side='left'), 0, len(times) - 1)
+    else:
+        raise ValueError("method needs to be either 'nearest', 'previous' or 'next'")
+
+    return idx, times[idx] - target_times
+
+def time_bracket_idx(times, target_times):
+
+    """
+    Indices of the times either side of each target time, and the linear interpolation weight of the later one.
+    Target times outside of times take the end values (weight clipped to 0 or 1).
+
+    :param times: sorted time axis (list of datetimes or datetime64 array)
+    :param target_times: times to match (list of datetimes or datetime64 array)
+    :return: lower: index of the time before (or at) each target time
+    :return: upper: index of the time after each target time
+    :return: weight: weight of upper, so data[lower] * (1 - weight) + data[upper] * weight
+    """
+
+    times = to_datetime64(times)
+    target_times = to_datetime64(target_times)
+
+    upper = np.clip(np.searchsorted(times, target_times, side='right'), 1, len(times) - 1)
+    lower = upper - 1
+
+    weight = (target_times - times[lower]) / (times[upper] - times[lower])
+
+    return lower, upper, np.clip(weight, 0.0, 1.0)
+
+def time_window_idx(times, window_times, window='centred'):
+
+    """
+    Range of times that fall within the window around each of the window times, for all windows at once
+
+    :param times: sorted time axis of the data (list of datetimes or datetime64 array) e.g. 15 s ceilometer times
+    :param window_times: sorted times of the windows e.g. hourly model times
+    :param window: 'centred' (half way to the neighbouring window times, [lower, upper)) or 'previous' (from the
+                    previous window time to this one, (lower, upper]). The first and last windows take the same
+                    width as their neighbour.
+    :return: start: index of the first time in each window
+    :return: end: index after the last time in each window (start == end if the window is empty)
+    """
+
+    times = to_datetime64(times).astype('int64')
+    window_times = to_datetime64(window_times).astype('int64').astype(float)
+
+    if window == 'centred':
+        lower, upper = layer_bounds(window_times, ground=False)
+        start = np.searchsorted(times, lower, side='left')
+        end = np.searchsorted(times, upper, side='left')
+    elif window == 'previous':
+        spacing = np.diff(window_times)
+        lower = window_times - np.append(spacing[:1], spacing)
+        start = np.searchsorted(times, lower, side='right')
+        end = np.searchsorted(times, window_times, side='right')
+    else:
+        raise ValueError("window needs to be either 'centred' or 'previous'")
+
+    return start, end
+
+def block_average(data, start, end, method='nanmean'):
+
+    """
+    Average the data within each time window, with grouped reductions over the whole [time, ...] array
+
+    :param data: [time, ...] e.g. [time, gate] backscatter
+    :param start: index of the first time in each window (from time_window_idx())
+    :param end: index after the last time in each window
+    :param method: 'mean', 'nanmean', 'median' or 'nanmedian'
+    :return: averaged: [window, ...]. NaN where a window has no (valid) data.
+    :return: n_valid: [window, ...] number of finite values each average is made from, for every method. 0 where the
+                        average is NaN (an empty window, or a NaN in the window for 'mean' and 'median').
+    """
+
+    data = np.asarray(data, dtype=float)
+    n_times = end - start
+
+    # number of times in each window, to broadcast against [window, ...]
+    n_times_b = n_times.reshape((-1,) + (1,) * (data.ndim - 1))
+
+    finite = np.isfinite(data)
+
+    if method in ['mean', 'nanmean']:
+
+        # sum over [start, end) of each window with np.add.reduceat. A row of zeros is added to the end so end can be
+        #   the length of the data, and every other result (end to the next start) is not needed.
+        pad = np.zeros((1,) + data.shape[1:])
+        bounds = np.column_stack((start, end)).ravel()
+        n_finite = np.add.reduceat(np.concatenate((finite.astype(float), pad)), bounds, axis=0)[::2]
+
+        # reduceat returns the row at start for empty windows
+        n_finite[n_times == 0] = 0.0
+
+        if method == 'nanmean':
+            total = np.add.reduceat(np.concatenate((np.where(finite, data, 0.0), pad)), bounds, axis=0)[::2]
+            n_averaged = n_finite
+            n_valid = n_finite
+        else:
+            # a NaN in the window makes the mean NaN, as np.mean would
+            total = np.add.reduceat(np.concatenate((data, pad)), bounds, axis=0)[::2]
+            n_averaged = np.broadcast_to(n_times_b, n_finite.shape)
+            n_valid = np.where(n_finite == n_times_b, n_finite, 0.0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            averaged = np.where(n_averaged > 0, total / n_averaged, np.nan)
+
+        n_valid = n_valid.astype(int)
+
+    elif method in ['median', 'nanmedian']:
+
+        # put each window's data into a NaN padded [window, longest window, ...] array, then take the median of each
+        max_n = max(np.max(n_times), 1)
+        position = np.arange(max_n)
+        in_window = position[np.newaxis, :] < n_times[:, np.newaxis]
+        time_idx = np.where(in_window, start[:, np.newaxis] + position[np.newaxis, :], 0)
+
+        windows = np.where(in_window.reshape(in_window.shape + (1,) * (data.ndim - 1)), data[time_idx], np.nan)
+        n_valid = np.sum(np.isfinite(windows), axis=1)
+
+        if method == 'median':
+            # a NaN in the window makes the median NaN, as np.median would
+            has_nan = np.any(in_window.reshape(in_window.shape + (1,) * (data.ndim - 1)) & ~np.isfinite(data[time_idx]),
+                             axis=1)
+        else:
+            has_nan = np.zeros(n_valid.shape, dtype=bool)
+
+        with np.errstate(invalid='ignore'):
+            averaged = np.where((n_valid > 0) & ~has_nan, np.nanmedian(windows, axis=1), np.nan)
+        n_valid = np.where(has_nan, 0, n_valid)
+
+    else:
+        raise ValueError("method needs to be either 'mean', 'nanmean', 'median' or 'nanmedian'")
+
+    return averaged, n_valid
+
+def block_average_obs(bsc_obs, window_times, method='nanmean', window='centred', var_names=['backscatter', 'SNR']):
+
+    """
+    Average the full time resolution ceilometer obs onto the window (e.g. model) times. An alternative to matching
+    the obs to the model times by sampling (timeMatch=mod_data when reading them in).
+
+    :param bsc_obs: {site: {'time': [...], 'height': ..., 'backscatter': [time, gate], ...}} as read in by FO, without
+                        time matching
+    :param window_times: times to average onto e.g. mod_data[site_id]['time']
+    :param method: 'mean', 'nanmean', 'median' or 'nanmedian'
+    :param window: 'centred' or 'previous' (see time_window_idx())
+    :param var_names: [time, ...] variables to average. Those missing from a site are skipped. Anything else (e.g.
+                        height) is left as it is.
+    :return: bsc_obs: same as the input, but with the var_names variables averaged onto window_times, 'time' set to
+                        window_times and 'n_obs' holding the number of finite backscatter values in each average.
+    """
+
+    for site, site_obs in bsc_obs.iteritems():
+
+        n_times = len(site_obs['time'])
+        start, end = time_window_idx(site_obs['time'], window_times, window=window)
+
+        for var in var_names:
+            if var in site_obs:
+
+                if np.shape(site_obs[var])[0] != n_times:
+                    raise ValueError(site + ' ' + var + ' does not have a time dimension first')
+
+                site_obs[var], n_valid = block_average(site_obs[var], start, end, method=method)
+                if var == 'backscatter':
+                    site_obs['n_obs'] = n_valid
+
+        site_obs['time'] = list(window_times)
+
+    return bsc_obs
+
+# Cached pairing
+
+def pairing_table_key(site, ceil_id, model_type, pair_func, kwargs):
+
+    """
+    Create the key of a pairing table, from everything the pairing depends on other than the heights themselves
+
+    :param site: e.g. 'MR'
+    :param ceil_id: e.g. 'CL31-C'
+    :param model_type: e.g. 'UKV'
+    :param pair_func: pairing function
+    :param kwargs: {argument: value} of the other arguments passed to pair_func (e.g. the height limits)
+    :return: key: e.g. 'MR_CL31-C_UKV_nearest_heights_minHeight73.0'
+    """
+
+    key = '_'.join([site, ceil_id, model_type, pair_func.__name__])
+    for arg in sorted(kwargs.keys()):
+        key += '_' + arg + str(kwargs[arg])
+
+    return key
+
+def get_pairing_table(site, ceil_id, model_type, mod_height, obs_height, pair_func=nearest_heights, cache_dir=None,
+                      **kwargs):
+
+    """
+    Get the obs/model height pairing for a site, only calculating it if the site, instrument, model, pairing
+    arguments or the heights themselves have changed. Tables are kept in memory for the run and, if cache_dir is
+    given, saved there to be reused by later runs.
+
+    :param site: e.g. 'MR'
+    :param ceil_id: e.g. 'CL31-C'
+    :param model_type: e.g. 'UKV'
+    :param mod_height: model level heights
+    :param obs_height: ceilometer gate heights
+    :param pair_func: pairing function, called as pair_func(mod_height, obs_height, **kwargs)
+    :param cache_dir: (optional) directory to save the tables in, as pairs_[key]_[md5 of the heights].pickle
+    :param kwargs: other arguments for pair_func (e.g. minHeight=73.0)
+    :return: table: output of pair_func (e.g. obs_idx, mod_idx, values, diff for nearest_heights)
+
+    e.g.
+    obs_idx, mod_idx, values, diff = get_pairing_table('MR', 'CL31-C', 'UKV', mod_height, obs_height, minHeight=73.0)
+    """
+
+    key = pairing_table_key(site, ceil_id, model_type, pair_func, kwargs)
+
+    # the file name also has a hash of the heights, so a saved table never needs to be replaced
+    if cache_dir is not None:
+        heights_md5 = hashlib.md5(np.asarray(mod_height, dtype=float).tostring() +
+                                  np.asarray(obs_height, dtype=float).tostring()).hexdigest()[0:8]
+        cache_path = os.path.join(cache_dir, 'pairs_' + key + '_' + heights_md5 + '.pickle')
+
+    # only use a table if the heights are the same as when it was made
+    if key in pairing_cache:
+        entry = pairing_cache[key]
+        if np.array_equal(entry['mod_height'], mod_height) & np.array_equal(entry['obs_height'], obs_height):
+            return entry['table']
+
+    # read in a table from a previous run
+    if cache_dir is not None:
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as handle:
+                entry = pickle.load(handle)
+            if np.array_equal(entry['mod_height'], mod_height) & np.array_equal(entry['obs_height'], obs_height):
+                pairing_cache[key] = entry
+                return entry['table']
+
+    entry = {'mod_height': np.array(mod_height),
+             'obs_height': np.array(obs_height),
+             'table': pair_func(mod_height, obs_height, **kwargs)}
+    pairing_cache[key] = entry
+
+    if cache_dir is not None:
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        write_cache_file(cache_path, lambda handle: pickle.dump(entry, handle, protocol=2))
+
+    return entry['table']
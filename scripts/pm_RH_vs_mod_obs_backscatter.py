@@ -24,6 +24,7 @@ import colorsys
 import ellUtils as eu
 from forward_operator import FOUtils as FO
 from forward_operator import FOconstants as FOcon
+from obs_mod_matching import get_pairing_table
 
 def create_stats_entry(site_id, statistics={}):
 
@@ -390,6 +391,7 @@ if __name__ == '__main__':
     modDatadir = datadir + model_type + '/'
     rhDatadir = datadir + 'L1/'
     aerDatadir = datadir + 'LAQN/'
+    pairsDatadir = datadir + 'height_pairs/'
 
     # statistics to run
     pm10_stats = True
@@ -540,8 +542,11 @@ if __name__ == '__main__':
             else:
                 mod_rh_height_idx = 0
 
+            #   only worked out again if the site's heights change, otherwise they are read in
             ceil_height_idx, mod_height_idx =\
-                 get_nearest_ceil_mod_height_idx(mod_data[site_id]['level_height'], bsc_site_obs['height'], ceil_gate_num)
+                 get_pairing_table(site_id, ceil_id, model_type, mod_data[site_id]['level_height'],
+                                   bsc_site_obs['height'], pair_func=get_nearest_ceil_mod_height_idx,
+                                   cache_dir=pairsDatadir, ceil_gate_num=ceil_gate_num)
 
             # create entry in the dictionary if one does not exist
             statistics = create_stats_entry(site_id, statistics)
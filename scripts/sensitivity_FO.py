@@ -0,0 +1,449 @@
+"""
+Aerosol forward operator functions for the sensitivity scripts. Kept here, rather than in sensitivity_plots.py, so
+they can be imported without running a script.
+"""
+
+import numpy as np
+
+from forward_operator import FOconstants as FOcon
+
+def get_mie_lookup(ceil_lam, reload=False):
+    """
+    Get the Q_ext_dry and f(RH) tables for the current wavelength, as a QextLookup (see Q_ext_lookup.py).
+    The tables are only read from disk on the first call for each wavelength.
+    :param ceil_lam:
+    :param reload: read the tables in again, rather than using the ones already read in
+    :return: lookup
+    """
+
+    from Q_ext_lookup import get_Q_ext_lookup
+
+    # temp file names
+    #   Q_ext_dry requires the wavelength to be passed, just so in the future, the 910 nm file is not incorrectly used
+    #   by mistake when it should use the file for another wavelength.
+    miedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/'
+    # f_RH_filename = 'calculated_ext_f(RH)_' + str(ceil_lam) + 'nm.csv'
+    f_RH_filename = 'sp_ew_910_ext_f(RH)_910-910nm.csv'
+    Q_ext_dry_filename = 'calculated_Q_ext_' + str(ceil_lam) + 'nm.csv'
+
+    return get_Q_ext_lookup(ceil_lam, miedir + f_RH_filename, miedir + Q_ext_dry_filename, reload=reload)
+
+def calc_Q_ext_wet(ceil_lam, r_md, RH, reload=False):
+    """
+    Calculate Q_ext_wet using Q_ext_dry and f(RH) for current wavelength
+    EW 23/02/17
+    :param ceil_lam:
+    :param r_md: dry mean volume radius [m] (any shape)
+    :param RH: relative humidity [%] (any shape)
+    :param reload: read the tables in again, rather than using the ones already read in
+    :return: Q, Q_ext_dry_matrix, f_RH_matrix (broadcast shape of r_md and RH)
+
+    Q_ext_dry and f(RH) are linearly interpolated from the tables, for all elements at once (see Q_ext_lookup.py).
+    The tables are only read from disk on the first call for each wavelength.
+    """
+
+    RH_factor = 0.01  # Relative Humidity in 0.38 not 38%
+
+    lookup = get_mie_lookup(ceil_lam, reload=reload)
+
+    # calculate Q_ext_wet
+    # need RH factor as the f(RH) table RH is in units of frac not percentage
+    Q, Q_ext_dry_matrix, f_RH_matrix = lookup.Q_ext_wet(r_md, RH_factor * np.asarray(RH))
+
+    return Q, Q_ext_dry_matrix, f_RH_matrix
+
+def solve_kohler(r_md, RH, B=FOcon.B_activation_haywood, T=288.15, n_iter=40, tol=1.0e-10):
+
+    """
+    Solve the Kohler equation for the wet mean volume radius rm, for whole arrays at once
+
+    ln(RH) = A/rm - B * r_md^3 / (rm^3 - r_md^3),   A = 2 * sigma * M_w / (rho_w * R * T)
+
+    This is eq. 12 of Clark et.al. (2008) with the curvature term (A/rm) kept. It is solved for y = rm/r_md with a
+    fixed number of safeguarded Newton iterations: the Newton step is taken if it stays inside the bracket of the
+    root, otherwise the bracket is halved. The stable root lies between y = 1 and the eq. 12 solution (RH < 100 %)
+    or the critical radius (RH >= 100 %). There is no stable root once the particles activate.
+
+    :param r_md: dry mean volume radius [m]
+    :param RH: relative humidity [%]
+    :param B: activation parameter
+    :param T: air temperature [K], for the curvature term
+    :param n_iter: number of iterations
+    :param tol: tolerance on the bracket width of y, or the ln(RH) residual, to count as converged
+    :return: rm: wet mean volume radius [m]. NaN where not converged
+    :return: converged: True where a root was found
+    """
+
+    RH_factor = 0.01  # Relative Humidity in 0.38 not 38%
+
+    r_md, RH, B, T = np.broadcast_arrays(np.asarray(r_md, dtype=float), np.asarray(RH, dtype=float),
+                                         np.asarray(B, dtype=float), np.asarray(T, dtype=float))
+
+    # curvature term [m]: surface tension of water = 0.072 N m-1, molar mass of water = 0.018 kg mol-1,
+    # density of water = 1000 kg m-3, gas constant = 8.314 J mol-1 K-1
+    a = ((2.0 * 0.072 * 0.018) / (1000.0 * 8.314 * T)) / r_md
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+
+        ln_RH = np.log(RH_factor * RH)
+
+        def residual(y):
+            return (a / y) - (B / (np.power(y, 3) - 1.0)) - ln_RH
+
+        def slope(y):
+            return (-a / np.power(y, 2)) + ((3.0 * B * np.power(y, 2)) / np.power(np.power(y, 3) - 1.0, 2))
+
+        # upper end of the bracket: eq. 12 (no curvature) if RH < 100 %, else the critical radius (for y >> 1)
+        y_hi = np.where(ln_RH < 0.0, np.power(1.0 - (B / ln_RH), 1. / 3.), np.sqrt(3.0 * B / a))
+        y_hi = np.where(np.isfinite(y_hi) & (y_hi > 1.0), y_hi, np.nan)
+        y_lo = np.ones(y_hi.shape)
+
+        # only bracketed if the residual is positive at the top (it is -inf at y = 1)
+        bracketed = residual(y_hi) > 0.0
+
+        y = 0.5 * (y_lo + y_hi)
+
+        for _ in range(n_iter):
+
+            f = residual(y)
+
+            # shrink the bracket
+            y_lo = np.where(f < 0.0, y, y_lo)
+            y_hi = np.where(f >= 0.0, y, y_hi)
+
+            # Newton step, or bisection if the step leaves the bracket
+            y_newton = y - (f / slope(y))
+            y = np.where((y_newton > y_lo) & (y_newton < y_hi), y_newton, 0.5 * (y_lo + y_hi))
+
+        converged = bracketed & ((np.abs(residual(y)) < tol) | ((y_hi - y_lo) < (tol * y)))
+
+    rm = np.where(converged, r_md * y, np.nan)
+
+    return rm, converged
+
+def calc_alpha_wv(q_v, rho_air, k_wv):
+
+    """
+    Water vapour absorption coefficient
+
+    :param q_v: specific humidity [kg kg-1]
+    :param rho_air: air density [kg m-3]
+    :param k_wv: mass absorption coefficient of water vapour, averaged over the ceilometer's emission spectrum
+                    [m2 kg-1]. Depends on the laser wavelength and line width, so needs setting for each ceilometer.
+    :return: alpha_wv: [m-1]
+    """
+
+    return k_wv * np.asarray(q_v, dtype=float) * np.asarray(rho_air, dtype=float)
+
+def calc_two_way_transmission(alpha, z, axis=-1):
+
+    """
+    Two-way transmission from the ground to each level, exp(-2 * optical depth), for all profiles at once
+
+    The optical depth is the cumulative trapezoidal integral of alpha up the level axis. Below the lowest level,
+    alpha is taken to be the same as at the lowest level.
+
+    :param alpha: total extinction (and absorption) coefficient [m-1] e.g. [time, height] or [site, time, height]
+    :param z: height of each level above the ground [m]. Either the same shape as alpha or 1D along the level axis
+    :param axis: level axis of alpha
+    :return: transmission: two-way transmission, with the shape of alpha
+    """
+
+    alpha = np.moveaxis(np.asarray(alpha, dtype=float), axis, -1)
+    z = np.asarray(z, dtype=float)
+    if z.ndim > 1:
+        z = np.moveaxis(z, axis, -1)
+
+    # optical depth of each layer between levels, then the cumulative sum up the profile
+    layer_tau = 0.5 * (alpha[..., 1:] + alpha[..., :-1]) * np.diff(z, axis=-1)
+
+    tau = np.empty(alpha.shape)
+    tau[..., 0] = alpha[..., 0] * z[..., 0]
+    tau[..., 1:] = tau[..., :1] + np.cumsum(layer_tau, axis=-1)
+
+    transmission = np.exp(-2.0 * tau)
+
+    return np.moveaxis(transmission, -1, axis)
+
+def aer_ext_scat(q_aer, RH, r0 = FOcon.r0_haywood, p = FOcon.p_aer,
+                 B=FOcon.B_activation_haywood, S = FOcon.LidarRatio['Aerosol'],
+                 N0=FOcon.N0_aer, m0 = FOcon.m0_aer, eta = FOcon.eta, Q = FOcon.Q_ext_aer,
+                 r_md = [], kohler=False, T=288.15, z=None, alpha_wv=None, level_axis=-1, ceil_lam=910):
+                 #, lnRH = [], BolnRH = []):
+
+    """
+    Compute aerosol extinction coefficient
+
+    All inputs and parameters can be arrays of any shape, as long as they broadcast together (e.g. q_aer [time, height]
+    with RH [time, height], or a parameter given as [n, 1] against RH [1, m] for a grid). The outputs have the
+    broadcast shape.
+
+    :param q_aer: aerosol mass mizing ratio [micrograms kg-1]
+    :param RH: relative humidity [%]
+    :param r0:
+    :param B:
+    :param kohler: solve the full Kohler curve for rm above RH_crit (see solve_kohler()), rather than eq. 12. Falls
+                    back to eq. 12 where it cannot be solved (e.g. activated particles)
+    :param T: air temperature [K], only used if kohler=True
+    :param z: (optional) height of each level above the ground [m], 1D along level_axis or the shape of q_aer.
+                    If given, the attenuated backscatter is also calculated, with the two-way transmission of the
+                    aerosol and water vapour (see calc_two_way_transmission()).
+    :param alpha_wv: water vapour absorption coefficient [m-1] (see calc_alpha_wv()). Must be given with z. There is
+                    no default k_wv for the ceilometer wavelengths, so pass 0.0 to knowingly attenuate by the aerosol
+                    alone.
+    :param level_axis: level axis of the profiles, only used if z is given
+    :param ceil_lam: wavelength of the Mie tables used for Q [nm]
+    :return: alpha_a: aerosol extinction coefficient
+    :return: beta_a: UNattenuated backscatter
+    :return: beta_attenuated: attenuated backscatter (only if z is given)
+    """
+
+    # water vapour absorption must be chosen by the caller, not left out by default
+    if (z is not None) & (alpha_wv is None):
+        raise ValueError('alpha_wv must be given with z (see calc_alpha_wv()). Use alpha_wv=0.0 for the aerosol '
+                         'transmission only.')
+
+    q_aer = np.asarray(q_aer, dtype=float)
+    RH = np.asarray(RH, dtype=float)
+
+    # Compute the aerosol number density N_aer. Eqn. 3 in Clark et.al. (2008) and Eqn 39 in UMDP 26 Large-scale precip.
+    q_aer_kg_kg = q_aer * 1.0e-9  # convert micrograms kg-1 to kg/kg
+    N_aer = N0 * np.power((q_aer_kg_kg / m0), 1-(3*p))
+
+    # r_md is the dry mean volume radius. Eqn. 2 in Clark et.al. (2008)
+    if type(r_md) == list:
+        r_md = r0 * np.power((q_aer_kg_kg / m0), p)
+    r_md = np.asarray(r_md, dtype=float)
+
+    # rm is the mean volume radius. Eqn. 12 in Clark et.al. (2008)
+    # "When no activated particles are present an analytic solution for rm" is
+    RH_crit = FOcon.RH_crit
+
+    RH_factor = 0.01  # Relative Humidity in 0.38 not 38%
+
+    # eq 12 - swell rm for RH greater than critical, keep rm as r_md where below.
+    # calculated everywhere, then masked, so the ln(RH) of low RH is ignored
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rm2 = np.power(1.0 - (B / np.log(RH_factor * RH)), 1. / 3.)
+    rm = np.where(RH >= RH_crit, r_md * rm2, r_md)
+
+    # Close to activation one must solve the full equation (Kohler curve), only done here if kohler=True.
+    if kohler == True:
+        rm_kohler, kohler_converged = solve_kohler(r_md, RH, B=B, T=T)
+        rm = np.where((RH >= RH_crit) & kohler_converged, rm_kohler, rm)
+
+    # Assumptions made here include:
+    # 1. Q_ext = scattering efficiency is independent of particle size and is assumed to be on average = 2.0
+    # 2. Only time RH is taken into account is in equation 12 above in the
+    # calculation of a mean radius. No attempt is made to model the variation
+    # of particle growth with RH AS A FUNCTION OF SIZE of particle.
+
+    # Calculate Q
+    Q, Q_ext_dry_matrix, f_RH_matrix = calc_Q_ext_wet(ceil_lam, r_md, RH)
+
+    # Calculate extinction coefficient
+    # eqns. 17-18 in Clark et.al. (2008)
+    alpha_a = (eta * Q) * np.pi * N_aer * np.power(rm, 2)
+
+    # Calculate backscatter using a constant lidar ratio
+    beta_a = alpha_a / S
+
+    # put all the variables into a dinctionary, to be returned at the end of the function
+    out = {'beta': beta_a,
+           'alpha': alpha_a,
+           'r_m': rm,
+           'r_md': r_md,
+           'N': N_aer,
+           'Q': Q,
+           'Q_ext_dry': Q_ext_dry_matrix,
+           'f_RH': f_RH_matrix}
+
+    if kohler == True:
+        out['kohler_converged'] = kohler_converged
+
+    # attenuate the backscatter by the aerosol and water vapour between the ceilometer and each level
+    if z is not None:
+        alpha_total = alpha_a + np.asarray(alpha_wv, dtype=float)
+        out['transmission'] = calc_two_way_transmission(alpha_total, z, axis=level_axis)
+        out['beta_attenuated'] = beta_a * out['transmission']
+
+    return out
+
+def aer_ext_scat_versions(q_aer, RH, versions, ceil_lam=910, out_vars=['beta', 'alpha', 'r_m', 'Q']):
+
+    """
+    Evaluate several versions or parameter sets of the forward operator on the same model fields in one pass.
+
+    The intermediates (N_aer, r_md, rm and the Mie table lookups) are calculated once for each distinct set of the
+    parameters they depend on, and shared between the versions that use them.
+
+    :param q_aer: aerosol mass mizing ratio [micrograms kg-1] e.g. [time, height]
+    :param RH: relative humidity [%] (broadcasts with q_aer)
+    :param versions: list of {parameter: value} for each version. Parameters are the aer_ext_scat keywords (r0, p, B,
+                    S, N0, m0, eta). Others take the aer_ext_scat defaults. 'Q_radius' sets which radius Q_ext is
+                    looked up with: 'r_md' (dry, default, as in aer_ext_scat) or 'r_m' (swollen).
+    :param ceil_lam: wavelength of the Mie tables [nm]
+    :param out_vars: variables to return
+    :return: out: {var: [version, ...] stacked over the versions, with the broadcast shape of q_aer and RH after}
+
+    e.g. FO version 0.1 (Q_ext from the swollen radius) and 0.2 (dry radius):
+    out = aer_ext_scat_versions(q_aer, RH, [{'Q_radius': 'r_m'}, {'Q_radius': 'r_md'}])
+    """
+
+    q_aer, RH = np.broadcast_arrays(np.asarray(q_aer, dtype=float), np.asarray(RH, dtype=float))
+
+    defaults = {'r0': FOcon.r0_haywood, 'p': FOcon.p_aer, 'B': FOcon.B_activation_haywood,
+                'S': FOcon.LidarRatio['Aerosol'], 'N0': FOcon.N0_aer, 'm0': FOcon.m0_aer, 'eta': FOcon.eta,
+                'Q_radius': 'r_md'}
+
+    RH_crit = FOcon.RH_crit
+    RH_factor = 0.01  # Relative Humidity in 0.38 not 38%
+
+    q_aer_kg_kg = q_aer * 1.0e-9  # convert micrograms kg-1 to kg/kg
+
+    # ln(RH) is the same for every version
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ln_RH = np.log(RH_factor * RH)
+
+    # intermediates already calculated, keyed by the parameters they depend on
+    N_aer_done = {}
+    r_md_done = {}
+    rm_done = {}
+    Q_done = {}
+
+    out = {}
+    for var in out_vars:
+        out[var] = np.empty((len(versions),) + q_aer.shape)
+
+    for v, version in enumerate(versions):
+
+        params = dict(defaults)
+        params.update(version)
+
+        # Eqn. 3 in Clark et.al. (2008)
+        N_key = (params['N0'], params['m0'], params['p'])
+        if N_key not in N_aer_done:
+            N_aer_done[N_key] = params['N0'] * np.power((q_aer_kg_kg / params['m0']), 1-(3*params['p']))
+        N_aer = N_aer_done[N_key]
+
+        # Eqn. 2 in Clark et.al. (2008)
+        r_md_key = (params['r0'], params['m0'], params['p'])
+        if r_md_key not in r_md_done:
+            r_md_done[r_md_key] = params['r0'] * np.power((q_aer_kg_kg / params['m0']), params['p'])
+        r_md = r_md_done[r_md_key]
+
+        # Eqn. 12 in Clark et.al. (2008)
+        rm_key = r_md_key + (params['B'],)
+        if rm_key not in rm_done:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rm2 = np.power(1.0 - (params['B'] / ln_RH), 1. / 3.)
+            rm_done[rm_key] = np.where(RH >= RH_crit, r_md * rm2, r_md)
+        rm = rm_done[rm_key]
+
+        # Q_ext_wet from the dry or swollen radius
+        if params['Q_radius'] == 'r_md':
+            Q_key = ('r_md',) + r_md_key
+            Q_radius = r_md
+        elif params['Q_radius'] == 'r_m':
+            Q_key = ('r_m',) + rm_key
+            Q_radius = rm
+        else:
+            raise ValueError("Q_radius needs to be either 'r_md' or 'r_m'")
+
+        if Q_key not in Q_done:
+            Q_done[Q_key] = calc_Q_ext_wet(ceil_lam, Q_radius, RH)
+        Q, Q_ext_dry_matrix, f_RH_matrix = Q_done[Q_key]
+
+        # eqns. 17-18 in Clark et.al. (2008)
+        alpha_a = (params['eta'] * Q) * np.pi * N_aer * np.power(rm, 2)
+        beta_a = alpha_a / params['S']
+
+        version_out = {'beta': beta_a,
+                       'alpha': alpha_a,
+                       'r_m': rm,
+                       'r_md': r_md,
+                       'N': N_aer,
+                       'Q': Q,
+                       'Q_ext_dry': Q_ext_dry_matrix,
+                       'f_RH': f_RH_matrix}
+
+        for var in out_vars:
+            out[var][v] = version_out[var]
+
+    return out
+
+def aer_ext_scat_jacobian(q_aer, RH, r0 = FOcon.r0_haywood, p = FOcon.p_aer,
+                          B=FOcon.B_activation_haywood, S = FOcon.LidarRatio['Aerosol'],
+                          N0=FOcon.N0_aer, m0 = FOcon.m0_aer, eta = FOcon.eta, r_md = [], ceil_lam=910):
+
+    """
+    Unattenuated backscatter from aer_ext_scat(), with its analytic partial derivatives with respect to the inputs
+    and parameters. Inputs broadcast as for aer_ext_scat().
+
+    Differentiates beta = eta * Q * pi * N * rm^2 / S, with N from eqn. 3, r_md from eqn. 2 and rm from eqn. 12 in
+    Clark et.al. (2008), and Q = Q_ext_dry(r_md) * f(RH), using the slopes of the interpolated Mie tables.
+    Written as d ln(beta)/dx, then multiplied by beta.
+
+    :param q_aer: aerosol mass mizing ratio [micrograms kg-1]
+    :param RH: relative humidity [%]
+    :param r_md: (optional) dry mean volume radius [m]. If given, r_md is not calculated from q_aer, r0, p and m0,
+                    so its derivatives with respect to them are 0.
+    :param ceil_lam: wavelength of the Mie tables used for Q [nm]
+    :return: out: aer_ext_scat() output, plus 'dbeta' = {'q_aer':, 'RH':, 'r0':, 'p':, 'B':, 'N0':, 'S':, 'm0':,
+                    'eta':} with the partial derivatives of beta [beta units / parameter units]
+    """
+
+    q_aer = np.asarray(q_aer, dtype=float)
+    RH = np.asarray(RH, dtype=float)
+
+    r_md_given = type(r_md) != list
+
+    out = aer_ext_scat(q_aer, RH, r0=r0, p=p, B=B, S=S, N0=N0, m0=m0, eta=eta, r_md=r_md, ceil_lam=ceil_lam)
+    beta = out['beta']
+
+    RH_crit = FOcon.RH_crit
+    RH_factor = 0.01  # Relative Humidity in 0.38 not 38%
+
+    # ln(q_aer / m0) with q_aer in [kg kg-1]
+    ln_q_m0 = np.log((q_aer * 1.0e-9) / m0)
+
+    # d ln(Q) / d ln(r_md) and d ln(Q) / dRH from the Mie table slopes
+    lookup = get_mie_lookup(ceil_lam)
+    r_md_out = out['r_md']
+    dlnQ_dlnr_md = r_md_out * lookup.Q_ext_dry_slope(r_md_out) / out['Q_ext_dry']
+    dlnQ_dRH = RH_factor * lookup.f_RH_slope(RH_factor * RH) / out['f_RH']
+
+    # d ln(beta) / d ln(r_md), through Q and rm^2 (rm is proportional to r_md)
+    dlnbeta_dlnr_md = 2.0 + dlnQ_dlnr_md
+
+    # eq 12 terms, only where the aerosol is swollen
+    swollen = RH >= RH_crit
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ln_RH = np.log(RH_factor * RH)
+        # d ln(rm^2) / dB and d ln(rm^2) / dRH, with rm^2 ~ (1 - B/ln(RH))^(2/3)
+        dlnrm2_dB = np.where(swollen, -(2.0 / 3.0) / (ln_RH - B), 0.0)
+        dlnrm2_dRH = np.where(swollen, (2.0 / 3.0) * B / (RH * ln_RH * (ln_RH - B)), 0.0)
+
+    # d ln(r_md) / dx, where r_md = r0 * (q_aer / m0)^p
+    if r_md_given == True:
+        dlnr_md = {'q_aer': 0.0, 'r0': 0.0, 'p': 0.0, 'm0': 0.0}
+    else:
+        dlnr_md = {'q_aer': p / q_aer, 'r0': 1.0 / r0, 'p': ln_q_m0, 'm0': -p / m0}
+
+    # d ln(beta) / dx
+    # N = N0 * (q_aer / m0)^(1-3p)
+    dlnbeta = {'q_aer': ((1.0 - (3.0 * p)) / q_aer) + (dlnbeta_dlnr_md * dlnr_md['q_aer']),
+               'RH': dlnQ_dRH + dlnrm2_dRH,
+               'r0': dlnbeta_dlnr_md * dlnr_md['r0'],
+               'p': (-3.0 * ln_q_m0) + (dlnbeta_dlnr_md * dlnr_md['p']),
+               'B': dlnrm2_dB,
+               'N0': 1.0 / N0,
+               'S': -1.0 / S,
+               'm0': (-(1.0 - (3.0 * p)) / m0) + (dlnbeta_dlnr_md * dlnr_md['m0']),
+               'eta': 1.0 / eta}
+
+    out['dbeta'] = {}
+    for param, dlnbeta_i in dlnbeta.iteritems():
+        out['dbeta'][param] = beta * dlnbeta_i
+
+    return out
@@ -0,0 +1,209 @@
+"""
+Emulator of the aerosol forward operator (aer_ext_scat) for a fixed parameter set and wavelength.
+
+aer_ext_scat is run once on a dense (q_aer, RH) grid and the output saved. Later evaluations are a bilinear
+interpolation of the table (in log10 space, as all the variables are positive and vary over orders of magnitude).
+The interpolation error is checked when the table is made, by running the full operator at the centre and edge
+midpoints of every grid cell and at random points within the cells. The largest error found is kept with the table,
+along with an error bound: that maximum times a safety factor. The log10 surfaces are curved, so the largest error
+can fall anywhere in a cell and the bound is an estimate, not a guarantee.
+"""
+
+import numpy as np
+import pickle
+
+from forward_operator import FOconstants as FOcon
+
+from Q_ext_lookup import axis_weights
+from sensitivity_sweep import sweep_aer_ext_scat
+from sensitivity_FO import aer_ext_scat
+
+def create_emulator(q_aer_range, RH_range, params={}, out_vars=['beta', 'alpha', 'r_m', 'Q'], ceil_lam=910,
+                    chunk_size=100000, n_workers=1, n_random=100000, error_safety=1.5, seed=0):
+
+    """
+    Tabulate aer_ext_scat on a (q_aer, RH) grid and measure the interpolation error
+
+    :param q_aer_range: sorted q_aer values [micrograms kg-1]. Log spacing works best.
+    :param RH_range: sorted RH values [%]. RH_crit is added to it, and a point just below, as eq. 12 makes r_m
+                        jump there.
+    :param params: {parameter: scalar value} for the other aer_ext_scat parameters (r0, p, B, S, N0, m0, eta).
+                        Others take the aer_ext_scat defaults.
+    :param out_vars: variables to tabulate
+    :param ceil_lam: wavelength of the Mie tables used by aer_ext_scat [nm]
+    :param chunk_size: maximum number of points run at once (see sweep_aer_ext_scat)
+    :param n_workers: number of processes to use (see sweep_aer_ext_scat)
+    :param n_random: number of random points (uniform within a random grid cell) to check the error at, as well as
+                    the cell centres and edge midpoints
+    :param error_safety: factor the largest error found is multiplied by to give error_bound
+    :param seed: seed for the random check points
+    :return: emulator: {'q_aer': ..., 'RH': ..., 'table': {var: log10 [q_aer, RH]}, 'max_error': {var: largest
+                    relative error found at the check points}, 'error_bound': {var: max_error * error_safety},
+                    'error_safety': ..., 'params': ..., 'ceil_lam': ...}
+    """
+
+    q_aer_range = np.asarray(q_aer_range, dtype=float)
+    RH_range = np.asarray(RH_range, dtype=float)
+
+    # put the jump at RH_crit on the grid
+    RH_crit = FOcon.RH_crit
+    if (RH_crit > RH_range[0]) & (RH_crit <= RH_range[-1]):
+        RH_range = np.union1d(RH_range, [RH_crit - 1.0e-6, RH_crit])
+
+    # run aer_ext_scat with the Mie tables for ceil_lam
+    fixed = dict(params)
+    fixed['ceil_lam'] = ceil_lam
+
+    out = sweep_aer_ext_scat([('q_aer', q_aer_range), ('RH', RH_range)], fixed=fixed, out_vars=out_vars,
+                             chunk_size=chunk_size, n_workers=n_workers)
+
+    emulator = {'q_aer': q_aer_range,
+                'RH': RH_range,
+                'table': {},
+                'params': dict(params),
+                'ceil_lam': ceil_lam}
+
+    for var in out_vars:
+        emulator['table'][var] = np.log10(out[var])
+
+    # check against the full operator between the grid points. The error is 0 on the grid points themselves.
+    q_aer_mid = 0.5 * (q_aer_range[:-1] + q_aer_range[1:])
+    RH_mid = 0.5 * (RH_range[:-1] + RH_range[1:])
+
+    # leave out the cell across the jump at RH_crit, as it is only 1e-6 % wide
+    jump_cell = (RH_range[:-1] < RH_crit) & (RH_range[1:] >= RH_crit)
+
+    rel_errors = {var: [] for var in out_vars}
+
+    # cell centres, midpoints of the edges along RH and midpoints of the edges along q_aer
+    for q_aer_check, RH_check, RH_keep in [(q_aer_mid, RH_mid, ~jump_cell),
+                                           (q_aer_range, RH_mid, ~jump_cell),
+                                           (q_aer_mid, RH_range, np.ones(len(RH_range), dtype=bool))]:
+
+        out_check = sweep_aer_ext_scat([('q_aer', q_aer_check), ('RH', RH_check)], fixed=fixed, out_vars=out_vars,
+                                       chunk_size=chunk_size, n_workers=n_workers)
+        emulated_check = emulate_aer_ext_scat(emulator, q_aer_check[:, np.newaxis], RH_check[np.newaxis, :])
+
+        for var in out_vars:
+            rel_errors[var] += [relative_error(emulated_check[var], out_check[var])[:, RH_keep].ravel()]
+
+    # random points, uniform within randomly picked cells (not the jump cell)
+    rng = np.random.RandomState(seed)
+    q_aer_cell = rng.randint(0, len(q_aer_range) - 1, n_random)
+    RH_cell = rng.choice(np.where(~jump_cell)[0], n_random)
+    q_aer_random = q_aer_range[q_aer_cell] + (rng.random_sample(n_random) * np.diff(q_aer_range)[q_aer_cell])
+    RH_random = RH_range[RH_cell] + (rng.random_sample(n_random) * np.diff(RH_range)[RH_cell])
+
+    emulated_random = emulate_aer_ext_scat(emulator, q_aer_random, RH_random)
+    for start in range(0, n_random, int(chunk_size)):
+        stop = min(start + int(chunk_size), n_random)
+        out_random = aer_ext_scat(q_aer_random[start:stop], RH_random[start:stop], **fixed)
+        for var in out_vars:
+            rel_errors[var] += [relative_error(emulated_random[var][start:stop], out_random[var])]
+
+    emulator['error_safety'] = error_safety
+    emulator['max_error'] = {}
+    emulator['error_bound'] = {}
+    for var in out_vars:
+        emulator['max_error'][var] = np.nanmax(np.concatenate(rel_errors[var]))
+        emulator['error_bound'][var] = emulator['max_error'][var] * error_safety
+
+    return emulator
+
+def relative_error(emulated, exact):
+
+    """
+    Relative error of the emulated values
+    :param emulated:
+    :param exact: full operator values
+    :return: rel_error: |emulated - exact| / |exact|. NaN where exact is 0.
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rel_error = np.abs(emulated - exact) / np.abs(exact)
+
+    return rel_error
+
+def emulate_aer_ext_scat(emulator, q_aer, RH):
+
+    """
+    Evaluate the emulator: a bilinear interpolation of the table, with the index maths on the sorted grid axes
+
+    :param emulator: from create_emulator() or load_emulator()
+    :param q_aer: aerosol mass mixing ratio [micrograms kg-1] (any shape)
+    :param RH: relative humidity [%] (any shape that broadcasts with q_aer)
+    :return: out: {var: values with the broadcast shape of q_aer and RH}. NaN where q_aer or RH are off the grid.
+    """
+
+    q_aer, RH = np.broadcast_arrays(np.asarray(q_aer, dtype=float), np.asarray(RH, dtype=float))
+
+    q_lo, q_hi, q_w = axis_weights(emulator['q_aer'], q_aer)
+    h_lo, h_hi, h_w = axis_weights(emulator['RH'], RH)
+
+    # the table is only valid on the grid
+    off_grid = (q_aer < emulator['q_aer'][0]) | (q_aer > emulator['q_aer'][-1]) | \
+               (RH < emulator['RH'][0]) | (RH > emulator['RH'][-1])
+
+    out = {}
+    for var, table in emulator['table'].iteritems():
+        log_value = ((1.0 - q_w) * (1.0 - h_w) * table[q_lo, h_lo]) + ((1.0 - q_w) * h_w * table[q_lo, h_hi]) + \
+                    (q_w * (1.0 - h_w) * table[q_hi, h_lo]) + (q_w * h_w * table[q_hi, h_hi])
+        out[var] = np.where(off_grid, np.nan, np.power(10.0, log_value))
+
+    return out
+
+# Saving
+
+def save_emulator(emulator, path):
+
+    """
+    Save the emulator as a pickle
+    :param emulator:
+    :param path:
+    :return:
+    """
+
+    with open(path, 'wb') as handle:
+        pickle.dump(emulator, handle, protocol=2)
+
+    return
+
+def load_emulator(path):
+
+    """
+    Load an emulator saved by save_emulator()
+    :param path:
+    :return: emulator
+    """
+
+    with open(path, 'rb') as handle:
+        emulator = pickle.load(handle)
+
+    return emulator
+
+if __name__ == '__main__':
+
+    # User set args
+    # grid to tabulate over
+    q_aer_range = np.logspace(-1, 3, 801) # [micrograms kg-1]
+    RH_range = np.arange(0.0, 99.01, 0.1) # [%]
+
+    # parameters to fix (others take the aer_ext_scat defaults)
+    params = {}
+
+    # number of processes to spread the tabulation across (1 = serial)
+    n_workers = 1
+
+    # -------------------------
+
+    savedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/emulator/'
+
+    emulator = create_emulator(q_aer_range, RH_range, params=params, n_workers=n_workers)
+
+    for var, max_error in emulator['max_error'].iteritems():
+        print var + ' relative interpolation error: largest found = ' + '%.2e' % max_error + \
+              ', bound (x' + str(emulator['error_safety']) + ') = ' + '%.2e' % emulator['error_bound'][var]
+
+    save_emulator(emulator, savedir + 'aer_ext_scat_emulator_' + str(emulator['ceil_lam']) + 'nm.pickle')
+
+    print 'END PROGRAM'
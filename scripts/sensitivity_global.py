@@ -0,0 +1,193 @@
+"""
+Variance-based global sensitivity of the aerosol forward operator (aer_ext_scat) to its parameters.
+
+Unlike the one-at-a-time plots in sensitivity_plots.py, all parameters are varied together, so interactions between
+them are included. Uses the Saltelli (2010) sampling scheme with the Saltelli first order and Jansen total order
+estimators, with bootstrap confidence intervals. The base samples are uniform (pseudo) random rather than a Sobol
+sequence, so more samples are needed for the same accuracy.
+
+Saltelli, A., et al. (2010) Variance based sensitivity analysis of model output. Design and estimator for the total
+sensitivity index. Computer Physics Communications, 181, 259-270.
+"""
+
+import numpy as np
+
+from sensitivity_FO import aer_ext_scat
+
+# [min, max] of each parameter, as used in sensitivity_plots.py
+#   eta has no range there, so it is taken as +/- 1/3 of its default (0.75)
+#   RH stops short of 100 %, as ln(RH) in eq. 12 is 0 at saturation and the swollen radius blows up
+param_bounds = {'r0': [0.1e-6, 0.2e-6],
+                'p': [0.0, 1.0/3],
+                'B': [0.1, 1.0],
+                'S': [20.0, 70.0],
+                'N0': [5.0e8, 2.0e10],
+                'm0': [1.0e-8, 3.0e-8],
+                'eta': [0.5, 1.0],
+                'q_aer': [10.0, 60.0], # m [micrograms kg-1]
+                'RH': [0.0, 99.0]} # [%]
+
+def saltelli_sample(bounds, names, n, seed=None):
+
+    """
+    Create the Saltelli sample matrices
+
+    :param bounds: {parameter: [min, max]}
+    :param names: parameters to vary, in column order
+    :param n: number of base samples. The forward operator will be run n * (len(names) + 2) times
+    :param seed: (optional) random seed
+    :return: A: [n, parameter] base sample
+    :return: B: [n, parameter] second base sample
+    :return: AB: [parameter, n, parameter]. AB[i] is A with column i taken from B
+    """
+
+    rng = np.random.RandomState(seed)
+
+    lower = np.array([bounds[name][0] for name in names])
+    upper = np.array([bounds[name][1] for name in names])
+
+    base = lower + ((upper - lower) * rng.random_sample((n, 2 * len(names))).reshape(n, 2, len(names)))
+    A = base[:, 0, :]
+    B = base[:, 1, :]
+
+    AB = np.repeat(A[np.newaxis, :, :], len(names), axis=0)
+    for i in range(len(names)):
+        AB[i, :, i] = B[:, i]
+
+    return A, B, AB
+
+def evaluate_samples(samples, names, fixed={}, out_var='beta', log10=False, chunk_size=100000, func=aer_ext_scat):
+
+    """
+    Run the forward operator for each row of samples, in vectorised chunks
+
+    :param samples: [..., parameter] array of parameter values
+    :param names: parameter name for each column of samples (as for sweep_aer_ext_scat)
+    :param fixed: {parameter: scalar value} for parameters not being varied. q_aer and RH must be either
+                    in names or fixed. Others not given take func's defaults.
+    :param out_var: variable from func's output to use
+    :param log10: take log10 of out_var
+    :param chunk_size: maximum number of samples run at once
+    :param func: forward operator, called as func(q_aer, RH, **kwargs)
+    :return: y: out_var for each sample, with the shape of samples minus the last dimension
+    """
+
+    flat = samples.reshape(-1, samples.shape[-1])
+    y = np.empty(flat.shape[0])
+
+    for start in range(0, flat.shape[0], int(chunk_size)):
+
+        stop = min(start + int(chunk_size), flat.shape[0])
+
+        kwargs = dict(fixed)
+        for col, name in enumerate(names):
+            kwargs[name] = flat[start:stop, col]
+
+        q_aer = kwargs.pop('q_aer')
+        RH = kwargs.pop('RH')
+
+        y[start:stop] = np.broadcast_to(func(q_aer, RH, **kwargs)[out_var], (stop - start,))
+
+    if log10 == True:
+        y = np.log10(y)
+
+    return y.reshape(samples.shape[:-1])
+
+def calc_sobol_indices(y_A, y_B, y_AB):
+
+    """
+    First order (Saltelli 2010) and total (Jansen) Sobol indices. Works along the last axis, so extra leading
+    dimensions (e.g. bootstrap resamples) are fine.
+
+    :param y_A: [..., n] output for A
+    :param y_B: [..., n] output for B
+    :param y_AB: [parameter, ..., n] output for AB
+    :return: S1: [parameter, ...] first order indices
+    :return: ST: [parameter, ...] total indices
+    """
+
+    V = np.var(np.concatenate((y_A, y_B), axis=-1), axis=-1)
+
+    S1 = np.mean(y_B * (y_AB - y_A), axis=-1) / V
+    ST = 0.5 * np.mean(np.power(y_A - y_AB, 2), axis=-1) / V
+
+    return S1, ST
+
+def sobol_analysis(names, n, bounds=param_bounds, fixed={}, out_var='beta', log10=True, n_boot=1000,
+                   conf_level=0.95, chunk_size=100000, seed=None, func=aer_ext_scat):
+
+    """
+    Sobol first order and total sensitivity indices of the forward operator, with bootstrap confidence intervals
+
+    :param names: parameters to vary e.g. ['r0', 'p', 'B', 'S', 'N0', 'm0', 'eta', 'q_aer', 'RH']
+    :param n: number of base samples. The forward operator is run n * (len(names) + 2) times
+    :param bounds: {parameter: [min, max]}. Parameters are sampled uniformly between these
+    :param fixed: {parameter: scalar value} for parameters not varied
+    :param out_var: variable from the forward operator to analyse
+    :param log10: analyse log10(out_var), as beta varies over orders of magnitude
+    :param n_boot: number of bootstrap resamples
+    :param conf_level: confidence level of the intervals
+    :param chunk_size: maximum number of forward operator runs at once
+    :param seed: (optional) random seed, for both the sampling and bootstrap
+    :param func: forward operator, called as func(q_aer, RH, **kwargs)
+    :return: indices: {parameter: {'S1': ..., 'S1_conf': [lower, upper], 'ST': ..., 'ST_conf': [lower, upper]}}
+    """
+
+    A, B, AB = saltelli_sample(bounds, names, n, seed=seed)
+
+    # all the forward operator runs
+    y_all = evaluate_samples(np.concatenate((A[np.newaxis, ...], B[np.newaxis, ...], AB), axis=0), names,
+                             fixed=fixed, out_var=out_var, log10=log10, chunk_size=chunk_size, func=func)
+    y_A = y_all[0]
+    y_B = y_all[1]
+    y_AB = y_all[2:]
+
+    S1, ST = calc_sobol_indices(y_A, y_B, y_AB)
+
+    # bootstrap: resample the base samples with replacement, a batch of resamples at a time to limit memory use
+    rng = np.random.RandomState(seed)
+    boot_batch = max(1, int(chunk_size) // n)
+    S1_boot = np.empty((len(names), n_boot))
+    ST_boot = np.empty((len(names), n_boot))
+
+    for start in range(0, n_boot, boot_batch):
+        stop = min(start + boot_batch, n_boot)
+        boot_idx = rng.randint(0, n, size=(stop - start, n)) # [boot, n]
+        S1_boot[:, start:stop], ST_boot[:, start:stop] = \
+            calc_sobol_indices(y_A[boot_idx], y_B[boot_idx], y_AB[:, boot_idx])
+
+    percentiles = [50.0 * (1.0 - conf_level), 50.0 * (1.0 + conf_level)]
+    S1_conf = np.percentile(S1_boot, percentiles, axis=-1)
+    ST_conf = np.percentile(ST_boot, percentiles, axis=-1)
+
+    indices = {}
+    for i, name in enumerate(names):
+        indices[name] = {'S1': S1[i], 'S1_conf': S1_conf[:, i],
+                         'ST': ST[i], 'ST_conf': ST_conf[:, i]}
+
+    return indices
+
+if __name__ == '__main__':
+
+    # User set args
+    # parameters to vary together
+    names = ['r0', 'p', 'B', 'S', 'N0', 'm0', 'eta', 'q_aer', 'RH']
+
+    # number of base samples (forward operator runs = n * (len(names) + 2))
+    n = 100000
+
+    # variable to analyse and whether to use log10 of it
+    out_var = 'beta'
+    log10 = True
+
+    # -------------------------
+
+    indices = sobol_analysis(names, n, out_var=out_var, log10=log10, seed=0)
+
+    print 'parameter      S1 [95% conf]             ST [95% conf]'
+    for name in names:
+        print '%-8s  %6.3f [%6.3f, %6.3f]  %6.3f [%6.3f, %6.3f]' % \
+              (name, indices[name]['S1'], indices[name]['S1_conf'][0], indices[name]['S1_conf'][1],
+               indices[name]['ST'], indices[name]['ST_conf'][0], indices[name]['ST_conf'][1])
+
+    print 'END PROGRAM'
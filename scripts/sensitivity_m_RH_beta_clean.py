@@ -13,6 +13,8 @@ from copy import deepcopy
 from forward_operator import FOconstants as FOcon
 from forward_operator import FOUtils as FO
 
+from sensitivity_sweep import sweep_aer_ext_scat
+
 def create_range(value):
 
     step = (value[1] - value[0]) / 100.0
@@ -22,116 +24,58 @@ def create_range(value):
 
 # calculate vars
 
-def calc_Q_ext_wet(ceil_lam, r_md, RH):
+def calc_Q_ext_wet(ceil_lam, r_md, RH, reload=False):
     """
     Calculate Q_ext_wet using Q_ext_dry and f(RH) for current wavelength
     EW 23/02/17
     :param ceil_lam:
-    :param r_md:
-    :param RH:
-    :return:
-    """
-
-    from ellUtils import nearest
-
-    def read_f_RH(ceil_lam):
-        """
-        Read in the f_RH data from csv
-        EW 21/02/17
-
-        :param filename:
-        :return: data = {RH:... f_RH:...}
-
-        filename must be in the form of 'calculated_ext_f(RH)_[ceil_lambda]nm.csv'
-        """
-
-        # temp file name
-        miedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/'
-        # filename = 'calculated_ext_f(RH)_' + str(ceil_lam) + 'nm.csv'
-        filename = 'sp_ew_ceil_guass_908-912_ext_f(RH)_908-912nm.csv'
-
-        # read data
-        raw = np.loadtxt(miedir + filename, delimiter=',')
+    :param r_md: dry mean volume radius [m] (any shape)
+    :param RH: relative humidity [%] (any shape)
+    :param reload: read the tables in again, rather than using the ones already read in
+    :return: Q, Q_ext_dry_matrix, f_RH_matrix (broadcast shape of r_md and RH)
 
-        f_RH = {'RH': raw[:, 0],
-                'f_RH': raw[:, 1]}
-
-        return f_RH
-
-    def read_Q_dry_ext(ceil_lam):
-        """
-        Read in the Q_ext for dry murk.
-        EW 21/02/17
-
-        :param filename:
-        :param lam:
-        :return: Q_ext_dry = {radius:... Q_ext_dry:...}
-
-        Requres the wavelength to be passed, just so in the future, the 910 nm file is not incorrectly used by mistake when
-        it should use the file for another wavelength.
-        """
-
-        miedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/'
-        filename = 'calculated_Q_ext_' + str(ceil_lam) + 'nm.csv'
-
-        raw = np.loadtxt(miedir + filename, delimiter=',')
+    Q_ext_dry and f(RH) are linearly interpolated from the tables, for all elements at once (see Q_ext_lookup.py).
+    The tables are only read from disk on the first call for each wavelength.
+    """
 
-        Q_ext_dry = {'radius': raw[:, 0],
-                     'Q_ext': raw[:, 1]}
+    from Q_ext_lookup import get_Q_ext_lookup
 
-        return Q_ext_dry
+    # temp file names
+    #   Q_ext_dry requires the wavelength to be passed, just so in the future, the 910 nm file is not incorrectly used
+    #   by mistake when it should use the file for another wavelength.
+    miedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/'
+    # f_RH_filename = 'calculated_ext_f(RH)_' + str(ceil_lam) + 'nm.csv'
+    f_RH_filename = 'sp_ew_ceil_guass_908-912_ext_f(RH)_908-912nm.csv'
+    Q_ext_dry_filename = 'calculated_Q_ext_' + str(ceil_lam) + 'nm.csv'
 
     RH_factor = 0.01  # Relative Humidity in 0.38 not 38%
 
-    # calculate Q_ext_wet
-    f_RH = read_f_RH(ceil_lam)
-    Q_ext_dry = read_Q_dry_ext(ceil_lam)
-
-    # create matric of Q_ext_dry based on r_md
-    Q_ext_dry_matrix = np.empty(r_md.shape)
-    f_RH_matrix = np.empty(RH.shape)
-
-    # find Q_ext dry, given the dry radius matrix
-    if r_md.size != 1:
-        for i in range(r_md.shape[0]):
-            idx = nearest(Q_ext_dry['radius'], r_md[i])[1]
-            Q_ext_dry_matrix[i] = Q_ext_dry['Q_ext'][idx]
-
-    else:
-        idx = nearest(Q_ext_dry['radius'], r_md)[1]
-        Q_ext_dry_matrix = Q_ext_dry['Q_ext'][idx]
-
-    # find f(RH), given the RH matrix
-    # need RH factor as f_RH['RH'] in units of frac not percentage
-    if RH.size != 1:
-        for i in range(RH.shape[0]):
-            idx = nearest(f_RH['RH'], RH_factor * RH[i])[1]
-            f_RH_matrix[i] = f_RH['f_RH'][idx]
-    else:
-        idx = nearest(f_RH['RH'], RH_factor * RH)[1]
-        f_RH_matrix = f_RH['f_RH'][idx]
+    lookup = get_Q_ext_lookup(ceil_lam, miedir + f_RH_filename, miedir + Q_ext_dry_filename, reload=reload)
 
     # calculate Q_ext_wet
-    Q = Q_ext_dry_matrix * f_RH_matrix
-    # print np.mean(Q_ext_dry_matrix[:,:20])
+    # need RH factor as the f(RH) table RH is in units of frac not percentage
+    Q, Q_ext_dry_matrix, f_RH_matrix = lookup.Q_ext_wet(r_md, RH_factor * np.asarray(RH))
 
     return Q, Q_ext_dry_matrix, f_RH_matrix
 
-def aer_ext_scat(q_aer, RH, r0 = FOcon.r0_haywood, p = FOcon.p_aer, S = FOcon.LidarRatio['Aerosol'],
-                 N0=FOcon.N0_aer, m0 = FOcon.m0_aer, eta = FOcon.eta, r_md = []):
+def aer_ext_scat(q_aer, RH, r0 = FOcon.r0_haywood, p = FOcon.p_aer, B=FOcon.B_activation_haywood,
+                 S = FOcon.LidarRatio['Aerosol'], N0=FOcon.N0_aer, m0 = FOcon.m0_aer, eta = FOcon.eta, r_md = []):
                  #, lnRH = [], BolnRH = []):
 
     """
     Compute aerosol extinction coefficient
 
     :param q_aer: aerosol mass mizing ratio [micrograms kg-1]
-    :param RH: relative humidity [ratio/dimensionless]
+    :param RH: relative humidity [%]
     :param r0:
-    :param B:
+    :param B: only used for the swollen radius output (r_m). Growth with RH is in Q here, through f(RH)
     :return: alpha_a: aerosol extinction coefficient
     :return: beta_a: UNattenuated backscatter
     """
 
+    q_aer = np.asarray(q_aer, dtype=float)
+    RH = np.asarray(RH, dtype=float)
+
     # Compute the aerosol number density N_aer. Eqn. 3 in Clark et.al. (2008) and Eqn 39 in UMDP 26 Large-scale precip.
     q_aer_kg_kg = q_aer * 1.0e-9  # convert micrograms kg-1 to kg/kg
     N_aer = N0 * np.power((q_aer_kg_kg / m0), 1-(3*p))
@@ -139,6 +83,7 @@ def aer_ext_scat(q_aer, RH, r0 = FOcon.r0_haywood, p = FOcon.p_aer, S = FOcon.Li
     # r_md is the dry mean volume radius. Eqn. 2 in Clark et.al. (2008)
     if type(r_md) == list:
         r_md = r0 * np.power((q_aer_kg_kg / m0), p)
+    r_md = np.asarray(r_md, dtype=float)
 
     # rm is the mean volume radius. Eqn. 12 in Clark et.al. (2008)
     # "When no activated particles are present an analytic solution for rm" is
@@ -146,31 +91,11 @@ def aer_ext_scat(q_aer, RH, r0 = FOcon.r0_haywood, p = FOcon.p_aer, S = FOcon.Li
 
     RH_factor = 0.01  # Relative Humidity in 0.38 not 38%
 
-    # # eq 12 - calc rm for RH greater than critical
-    # # Old - original approach. No longer used with f(RH)
-    # if RH.shape[0] == 1:
-    #     if RH >= RH_crit:
-    #         rm = np.ones(RH.shape) - (B / np.log(RH_factor * RH))
-    #         rm2 = np.power(rm, 1. / 3.)
-    #         rm = np.array(r_md) * rm2
-    #     else:
-    #         rm = r_md
-    #
-    # else: # RH shape > 1
-    #     # set up rm array
-    #     rm = np.empty(RH.shape)
-    #     rm[:] = np.nan
-    #
-    #     # find instances above and below critical threshold
-    #     gt_idx = np.where(RH >= RH_crit)[0]
-    #     ls_idx = np.where(RH < RH_crit)[0]
-    #
-    #     # swell those above the threshold, keep rm as r_md where below.
-    #     if gt_idx.size: # if not empty
-    #         rm[gt_idx] = np.ones(gt_idx.shape) - (B / np.log(RH_factor * RH[gt_idx]))
-    #         rm2 = np.power(rm[gt_idx], 1. / 3.)
-    #         rm[gt_idx] = np.array(r_md) * rm2
-    #     rm[ls_idx] = r_md
+    # eq 12 - swell rm for RH greater than critical, keep rm as r_md where below.
+    # calculated everywhere, then masked, so the ln(RH) of low RH is ignored
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rm2 = np.power(1.0 - (B / np.log(RH_factor * RH)), 1. / 3.)
+    rm = np.where(RH >= RH_crit, r_md * rm2, r_md)
 
     # Close to activation one must solve the full equation (Kohler curve), not done in this code.
     # Assumptions made here include:
@@ -243,17 +168,14 @@ RH_range = np.array([20.0, 40.0, 60.0, 80.0, 90.0, 95.0])
 # do first to get the var_range out for later calculations (r_md)
 # alpha, beta, alpha_c, beta_c, var_range = calc_aer_ext_vars(var_order, variables, q_aer_fix, RH_fix)
 
-beta = {}
-
-for RH_i in RH_range:
-
-    # create a numpy array of the length of m_range full of RH_i to use as input to aer_ext_scat
-    RH_i_array = np.empty(len(m_range))
-    RH_i_array[:] = RH_i
+# RH x m
+# m in [micrograms kg-1], RH in [%]
+beta_RH_m = sweep_aer_ext_scat([('RH', RH_range), ('q_aer', m_range)], out_vars=['beta'],
+                               func=aer_ext_scat)['beta']
 
-    # m in [kg kg-1], RH in [frac]
-    all_vars = aer_ext_scat(m_range, RH_i_array)
-    beta[str(RH_i)] = all_vars['beta']
+beta = {}
+for RH_idx, RH_i in enumerate(RH_range):
+    beta[str(RH_i)] = beta_RH_m[RH_idx, :]
 
 
 # Beta and alpha with different N_0
@@ -264,26 +186,14 @@ for RH_i in RH_range:
 N0_pcm3 = [3769, 4461, 5426, 6824, 4471] # as in table 4 of paper 1
 N0_pm3 = [i*1.0e06 for i in N0_pcm3]
 
-alpha_diff_N0 = []
-beta_diff_N0 = []
-
-
-# for N0_pm3_i, N0_pcm3_i in zip(N0_pm3, N0_pcm3):
-for N0_pm3_i in N0_pm3:
-
-    for RH_i in [60.0]:
-
-        # create a numpy array of the length of m_range full of RH_i to use as input to aer_ext_scat
-        RH_i_array = np.empty(len(m_range))
-        RH_i_array[:] = RH_i
-
-        # m in [kg kg-1], RH in [frac]
-        all_vars = aer_ext_scat(m_range, RH_i_array, N0=N0_pm3_i)
+# N0 x m, with RH fixed at 60 %
+all_vars = sweep_aer_ext_scat([('N0', N0_pm3), ('q_aer', m_range)], fixed={'RH': 60.0},
+                              func=aer_ext_scat)
 
-        # extract out beta at a set m
-        # m_range[18] = 18.0 micrograms kg-1
-        alpha_diff_N0 += [all_vars['alpha'][18]]
-        beta_diff_N0 += [all_vars['beta'][18]]
+# extract out beta at a set m
+# m_range[18] = 18.0 micrograms kg-1
+alpha_diff_N0 = list(all_vars['alpha'][:, 18])
+beta_diff_N0 = list(all_vars['beta'][:, 18])
 
 # -----------------------------------------------------------
 # 3. Plot each with respect to beta
@@ -14,6 +14,9 @@ from copy import deepcopy
 from forward_operator import FOconstants as FOcon
 from forward_operator import FOUtils as FO
 
+from sensitivity_FO import calc_Q_ext_wet, aer_ext_scat
+from sensitivity_sweep import sweep_aer_ext_scat
+
 def create_range(value):
 
     step = (value[1] - value[0]) / 100.0
@@ -23,186 +26,6 @@ def create_range(value):
 
 # calculate vars
 
-def calc_Q_ext_wet(ceil_lam, r_md, RH):
-    """
-    Calculate Q_ext_wet using Q_ext_dry and f(RH) for current wavelength
-    EW 23/02/17
-    :param ceil_lam:
-    :param r_md:
-    :param RH:
-    :return:
-    """
-
-    from ellUtils import nearest
-
-    def read_f_RH(ceil_lam):
-        """
-        Read in the f_RH data from csv
-        EW 21/02/17
-
-        :param filename:
-        :return: data = {RH:... f_RH:...}
-
-        filename must be in the form of 'calculated_ext_f(RH)_[ceil_lambda]nm.csv'
-        """
-
-        # temp file name
-        miedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/'
-        # filename = 'calculated_ext_f(RH)_' + str(ceil_lam) + 'nm.csv'
-        filename = 'sp_ew_910_ext_f(RH)_910-910nm.csv'
-
-        # read data
-        raw = np.loadtxt(miedir + filename, delimiter=',')
-
-        f_RH = {'RH': raw[:, 0],
-                'f_RH': raw[:, 1]}
-
-        return f_RH
-
-    def read_Q_dry_ext(ceil_lam):
-        """
-        Read in the Q_ext for dry murk.
-        EW 21/02/17
-
-        :param filename:
-        :param lam:
-        :return: Q_ext_dry = {radius:... Q_ext_dry:...}
-
-        Requres the wavelength to be passed, just so in the future, the 910 nm file is not incorrectly used by mistake when
-        it should use the file for another wavelength.
-        """
-
-        miedir = 'C:/Users/Elliott/Documents/PhD Reading/PhD Research/Aerosol Backscatter/clearFO/data/Mie/'
-        filename = 'calculated_Q_ext_' + str(ceil_lam) + 'nm.csv'
-
-        raw = np.loadtxt(miedir + filename, delimiter=',')
-
-        Q_ext_dry = {'radius': raw[:, 0],
-                     'Q_ext': raw[:, 1]}
-
-        return Q_ext_dry
-
-    RH_factor = 0.01  # Relative Humidity in 0.38 not 38%
-
-    # calculate Q_ext_wet
-    f_RH = read_f_RH(ceil_lam)
-    Q_ext_dry = read_Q_dry_ext(ceil_lam)
-
-    # create matric of Q_ext_dry based on r_md
-    Q_ext_dry_matrix = np.empty(r_md.shape)
-    f_RH_matrix = np.empty(RH.shape)
-
-    # find Q_ext dry, given the dry radius matrix
-    if r_md.size != 1:
-        for i in range(r_md.shape[0]):
-            idx = nearest(Q_ext_dry['radius'], r_md[i])[1]
-            Q_ext_dry_matrix[i] = Q_ext_dry['Q_ext'][idx]
-
-    else:
-        idx = nearest(Q_ext_dry['radius'], r_md)[1]
-        Q_ext_dry_matrix = Q_ext_dry['Q_ext'][idx]
-
-    # find f(RH), given the RH matrix
-    # need RH factor as f_RH['RH'] in units of frac not percentage
-    if RH.size != 1:
-        for i in range(RH.shape[0]):
-            idx = nearest(f_RH['RH'], RH_factor * RH[i])[1]
-            f_RH_matrix[i] = f_RH['f_RH'][idx]
-    else:
-        idx = nearest(f_RH['RH'], RH_factor * RH)[1]
-        f_RH_matrix = f_RH['f_RH'][idx]
-
-    # calculate Q_ext_wet
-    Q = Q_ext_dry_matrix * f_RH_matrix
-    # print np.mean(Q_ext_dry_matrix[:,:20])
-
-    return Q, Q_ext_dry_matrix, f_RH_matrix
-
-def aer_ext_scat(q_aer, RH, r0 = FOcon.r0_haywood, p = FOcon.p_aer,
-                 B=FOcon.B_activation_haywood, S = FOcon.LidarRatio['Aerosol'],
-                 N0=FOcon.N0_aer, m0 = FOcon.m0_aer, eta = FOcon.eta, Q = FOcon.Q_ext_aer,
-                 r_md = []):
-                 #, lnRH = [], BolnRH = []):
-
-    """
-    Compute aerosol extinction coefficient
-
-    :param q_aer: aerosol mass mizing ratio [micrograms kg-1]
-    :param RH: relative humidity [ratio/dimensionless]
-    :param r0:
-    :param B:
-    :return: alpha_a: aerosol extinction coefficient
-    :return: beta_a: UNattenuated backscatter
-    """
-
-    # Compute the aerosol number density N_aer. Eqn. 3 in Clark et.al. (2008) and Eqn 39 in UMDP 26 Large-scale precip.
-    q_aer_kg_kg = q_aer * 1.0e-9  # convert micrograms kg-1 to kg/kg
-    N_aer = N0 * np.power((q_aer_kg_kg / m0), 1-(3*p))
-
-    # r_md is the dry mean volume radius. Eqn. 2 in Clark et.al. (2008)
-    if type(r_md) == list:
-        r_md = r0 * np.power((q_aer_kg_kg / m0), p)
-
-    # rm is the mean volume radius. Eqn. 12 in Clark et.al. (2008)
-    # "When no activated particles are present an analytic solution for rm" is
-    RH_crit = FOcon.RH_crit
-
-    RH_factor = 0.01  # Relative Humidity in 0.38 not 38%
-
-    # eq 12 - calc rm for RH greater than critical
-    if RH.shape[0] == 1:
-        if RH >= RH_crit:
-            rm = np.ones(RH.shape) - (B / np.log(RH_factor * RH))
-            rm2 = np.power(rm, 1. / 3.)
-            rm = np.array(r_md) * rm2
-        else:
-            rm = r_md
-
-    else: # RH shape > 1
-        # set up rm array
-        rm = np.empty(RH.shape)
-        rm[:] = np.nan
-
-        # find instances above and below critical threshold
-        gt_idx = np.where(RH >= RH_crit)[0]
-        ls_idx = np.where(RH < RH_crit)[0]
-
-        # swell those above the threshold, keep rm as r_md where below.
-        rm[gt_idx] = np.ones(gt_idx.shape) - (B / np.log(RH_factor * RH[gt_idx]))
-        rm2 = np.power(rm[gt_idx], 1. / 3.)
-        rm[gt_idx] = np.array(r_md) * rm2
-        # ToDo only works if RH shape > 1 BUT q_aer shape is also == 1!
-        rm[ls_idx] = r_md
-
-    # Close to activation one must solve the full equation (Kohler curve), not done in this code.
-    # Assumptions made here include:
-    # 1. Q_ext = scattering efficiency is independent of particle size and is assumed to be on average = 2.0
-    # 2. Only time RH is taken into account is in equation 12 above in the
-    # calculation of a mean radius. No attempt is made to model the variation
-    # of particle growth with RH AS A FUNCTION OF SIZE of particle.
-
-    # Calculate Q
-    Q, Q_ext_dry_matrix, f_RH_matrix = calc_Q_ext_wet(910, r_md, RH)
-
-    # Calculate extinction coefficient
-    # eqns. 17-18 in Clark et.al. (2008)
-    alpha_a = (eta * Q) * np.pi * N_aer * np.power(rm, 2)
-
-    # Calculate backscatter using a constant lidar ratio
-    beta_a = alpha_a / S
-
-    # put all the variables into a dinctionary, to be returned at the end of the function
-    out = {'beta': beta_a,
-           'alpha': alpha_a,
-           'r_m': rm,
-           'r_md': r_md,
-           'N': N_aer,
-           'Q': Q,
-           'Q_ext_dry': Q_ext_dry_matrix,
-           'f_RH': f_RH_matrix}
-
-    return out
-
 def calc_aer_ext_vars(var_order, variables, q_aer_fix, RH_fix):
 
     """
@@ -226,14 +49,10 @@ def calc_aer_ext_vars(var_order, variables, q_aer_fix, RH_fix):
 
     for key in var_order:
 
-        if key == 'RH':
-            out = aer_ext_scat(q_aer_fix, var_range[key])
-
-        elif key == 'm':
-            out = aer_ext_scat(var_range[key], RH_fix)
-        else:
-            # ** {key: var_range} = keyword argument unpacking
-            out = aer_ext_scat(q_aer_fix, RH_fix, **{key: var_range[key]})
+        # sweep the one variable, with m and RH fixed unless they are the one being swept
+        # m is q_aer in aer_ext_scat
+        param = 'q_aer' if key == 'm' else key
+        out = sweep_aer_ext_scat([(param, var_range[key])], fixed={'q_aer': q_aer_fix, 'RH': RH_fix})
 
         # extract out the alpha and beta
         alpha[key] = out['alpha']
@@ -0,0 +1,109 @@
+"""
+Evaluate the aerosol forward operator over a grid of parameters, of any number of dimensions (e.g. RH x m x N0 x r0).
+
+The grid is never built in full. Points are taken from it in chunks of a set size, so memory use stays bounded, and
+each chunk is a single vectorised call of the forward operator. Chunks can be spread across a process pool.
+"""
+
+import numpy as np
+from itertools import imap, izip
+from multiprocessing import Pool
+from functools import partial
+
+from sensitivity_FO import aer_ext_scat
+
+def sweep_chunk(bounds, names, values, shape, fixed, out_vars, func):
+
+    """
+    Evaluate one chunk of the grid
+
+    :param bounds: (start, stop) of the chunk, as flat indices of the grid
+    :param names: parameter name of each grid dimension
+    :param values: 1D values of each grid dimension
+    :param shape: shape of the grid
+    :param fixed: {parameter: value} for parameters that are fixed
+    :param out_vars: variables to keep from func's output
+    :param func: forward operator, called as func(q_aer, RH, **kwargs)
+    :return: chunk_out: {out_var: [chunk]}
+    """
+
+    # position of each point in the chunk, along each dimension of the grid
+    grid_idx = np.unravel_index(np.arange(bounds[0], bounds[1]), shape)
+
+    kwargs = dict(fixed)
+    for name, values_i, idx_i in zip(names, values, grid_idx):
+        kwargs[name] = values_i[idx_i]
+
+    q_aer = kwargs.pop('q_aer')
+    RH = kwargs.pop('RH')
+
+    out = func(q_aer, RH, **kwargs)
+
+    # make sure every output has the chunk length (e.g. if it does not depend on any of the grid parameters)
+    chunk_out = {}
+    for var in out_vars:
+        chunk_out[var] = np.broadcast_to(out[var], (bounds[1] - bounds[0],))
+
+    return chunk_out
+
+def sweep_aer_ext_scat(grid, fixed={}, out_vars=['beta', 'alpha'], chunk_size=100000, n_workers=1,
+                       func=aer_ext_scat):
+
+    """
+    Evaluate the forward operator at every point of a parameter grid
+
+    :param grid: list of (parameter name, 1D values) for each dimension of the grid, in order. Parameter names are
+                    the arguments of func: 'q_aer' (m) [micrograms kg-1], 'RH' [%], or any of its keywords (r0, p, B,
+                    S, N0, m0, eta, r_md ...).
+    :param fixed: {parameter: scalar value} for parameters not on the grid. q_aer and RH must be either on the grid
+                    or in fixed. Others not given take func's defaults.
+    :param out_vars: variables to keep from func's output
+    :param chunk_size: maximum number of grid points evaluated at once
+    :param n_workers: number of processes to spread the chunks across (1 = serial)
+    :param func: forward operator to evaluate. Needs to be importable (not from a script's __main__) if n_workers > 1
+    :return: out: {out_var: array with the shape of the grid}
+
+    e.g. RH x m x N0:
+    out = sweep_aer_ext_scat([('RH', np.arange(0, 101)), ('q_aer', np.arange(1.0, 81.0)), ('N0', N0_range)])
+    """
+
+    names = [name for name, _ in grid]
+    values = [np.asarray(values_i) for _, values_i in grid]
+    shape = tuple([len(values_i) for values_i in values])
+    n_points = int(np.prod(shape))
+
+    for required in ['q_aer', 'RH']:
+        if (required not in names) & (required not in fixed):
+            raise ValueError(required + ' needs to be either in grid or fixed')
+
+    # flat index bounds of each chunk
+    starts = np.arange(0, n_points, int(chunk_size))
+    chunks = [(start, min(start + int(chunk_size), n_points)) for start in starts]
+
+    chunk_func = partial(sweep_chunk, names=names, values=values, shape=shape, fixed=fixed, out_vars=out_vars,
+                         func=func)
+
+    out = {}
+    for var in out_vars:
+        out[var] = np.empty(n_points)
+
+    if n_workers > 1:
+        pool = Pool(n_workers)
+        try:
+            # fill the grid as each chunk comes in
+            for (start, stop), chunk_out in izip(chunks, pool.imap(chunk_func, chunks)):
+                for var in out_vars:
+                    out[var][start:stop] = chunk_out[var]
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        # fill the grid as each chunk comes in
+        for (start, stop), chunk_out in izip(chunks, imap(chunk_func, chunks)):
+            for var in out_vars:
+                out[var][start:stop] = chunk_out[var]
+
+    for var in out_vars:
+        out[var] = out[var].reshape(shape)
+
+    return out